@@ -6,7 +6,7 @@ import os
 # Añadir la carpeta actual al path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from models import db, Usuario, Ingrediente, Producto, Receta, RecetaIngrediente
+from models import db, Usuario, Ingrediente, Producto, Receta, RecetaIngrediente, SnapshotInventario
 from routes.auth import auth_bp
 from routes.recetas import recetas_bp
 from routes.ingredientes import ingredientes_bp
@@ -16,11 +16,14 @@ from routes.ventas_avanzado import ventas_bp as ventas_avanzado_bp
 from routes.mermas import mermas_bp
 from routes.admin_usuarios import admin_bp
 from routes.inventario import inventario_bp
+from services.libro_inventario import LibroInventario
+from services.busqueda_ventas import BusquedaVentas
+from services.contadores_dashboard import ContadoresDashboard
 
 app = Flask(__name__)
 
 # Configuración de BD
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///carbo_cheddar_new.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///carbo_cheddar_new.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'tu-clave-secreta-super-segura-aqui')
 
@@ -32,7 +35,8 @@ CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key", "Last-Event-ID"],
+        "expose_headers": ["X-Comanda-Id"]
     }
 })
 
@@ -266,5 +270,17 @@ with app.app_context():
             db.session.commit()
             print("✓ Recetas de demostración creadas")
 
+    # Primer corte del libro de inventario: el stock existente pasa a ser su punto de partida
+    if SnapshotInventario.query.first() is None:
+        LibroInventario.tomar_snapshot()
+        db.session.commit()
+        print("✓ Corte inicial del libro de inventario creado")
+
+    # Índice de búsqueda del historial (tabla FTS5 y triggers; create_all no los crea)
+    BusquedaVentas.crear_indice()
+
+    # Totales históricos del dashboard (se calculan una vez y luego se mantienen)
+    ContadoresDashboard.inicializar()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
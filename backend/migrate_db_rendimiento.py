@@ -0,0 +1,339 @@
+import json
+import sqlite3
+import os
+from datetime import datetime
+
+DB_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'carbo_cheddar_new.db')
+
+RESUMENES = [
+    ('ventas_resumen_hora', 'DATETIME', "strftime('%Y-%m-%d %H:00:00.000000', v.created_at)"),
+    ('ventas_resumen_dia', 'DATE', "date(v.created_at)")
+]
+
+def cargar_resumen(cursor, tabla, expr_bucket):
+    """Carga un resumen de ventas con las ventas no anuladas existentes"""
+    cursor.execute(f"""
+    INSERT INTO {tabla} (bucket, usuario_id, tipo_item, item_id, cantidad, ingresos, descuentos, iva, costo)
+    SELECT {expr_bucket}, COALESCE(v.usuario_id, 0), 'venta', 0,
+           COUNT(*), SUM(COALESCE(v.total, 0)), SUM(COALESCE(v.descuento, 0)), SUM(COALESCE(v.iva, 0)), 0
+    FROM ventas v
+    WHERE v.anulada IS NOT 1
+    GROUP BY 1, 2
+    """)
+    cursor.execute(f"""
+    INSERT INTO {tabla} (bucket, usuario_id, tipo_item, item_id, cantidad, ingresos, descuentos, iva, costo)
+    SELECT {expr_bucket}, COALESCE(v.usuario_id, 0),
+           CASE WHEN vi.es_receta THEN 'receta' ELSE 'producto' END,
+           CASE WHEN vi.es_receta THEN vi.receta_id ELSE vi.producto_id END,
+           SUM(vi.cantidad), SUM(COALESCE(vi.subtotal, 0)), 0, 0,
+           SUM(COALESCE((
+               SELECT SUM(c.cantidad * COALESCE(c.costo_unitario, 0))
+               FROM venta_item_consumos c WHERE c.venta_item_id = vi.id
+           ), 0))
+    FROM venta_items vi
+    JOIN ventas v ON v.id = vi.venta_id
+    WHERE v.anulada IS NOT 1
+      AND (CASE WHEN vi.es_receta THEN vi.receta_id ELSE vi.producto_id END) IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+    """)
+
+def migrate():
+    print(f"Migrando base de datos en: {DB_PATH}")
+    
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    # 1. Permitir producto_id nulo en 'venta_items' (items de receta no tienen producto)
+    #    SQLite no soporta ALTER COLUMN, hay que recrear la tabla.
+    try:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='venta_items'")
+        fila = cursor.fetchone()
+        if fila and 'producto_id INTEGER NOT NULL' in fila[0]:
+            cursor.execute("ALTER TABLE venta_items RENAME TO venta_items_old")
+            cursor.execute("""
+            CREATE TABLE venta_items (
+                id INTEGER NOT NULL,
+                venta_id INTEGER NOT NULL,
+                producto_id INTEGER,
+                receta_id INTEGER,
+                cantidad INTEGER NOT NULL,
+                precio_unitario FLOAT NOT NULL,
+                subtotal FLOAT NOT NULL,
+                observaciones TEXT,
+                es_receta BOOLEAN,
+                explosion_detalles TEXT,
+                created_at DATETIME,
+                PRIMARY KEY (id),
+                FOREIGN KEY(venta_id) REFERENCES ventas (id),
+                FOREIGN KEY(producto_id) REFERENCES productos (id),
+                FOREIGN KEY(receta_id) REFERENCES recetas (id)
+            )
+            """)
+            cursor.execute("""
+            INSERT INTO venta_items (id, venta_id, producto_id, receta_id, cantidad, precio_unitario,
+                                     subtotal, observaciones, es_receta, explosion_detalles, created_at)
+            SELECT id, venta_id, producto_id, receta_id, cantidad, precio_unitario,
+                   subtotal, observaciones, es_receta, explosion_detalles, created_at
+            FROM venta_items_old
+            """)
+            cursor.execute("DROP TABLE venta_items_old")
+            print("✓ Columna 'producto_id' de 'venta_items' ahora admite nulos")
+        else:
+            print("⚠ 'venta_items.producto_id' ya admite nulos")
+    except Exception as e:
+        print(f"x Error recreando 'venta_items': {e}")
+
+    # 2. Clave de idempotencia en 'ventas' (índice único, admite múltiples nulos)
+    try:
+        cursor.execute("ALTER TABLE ventas ADD COLUMN clave_idempotencia VARCHAR(64)")
+        print("✓ Columna 'clave_idempotencia' añadida a tabla 'ventas'")
+    except sqlite3.OperationalError as e:
+        if 'duplicate column name' in str(e):
+            print("⚠ Columna 'clave_idempotencia' ya existe en 'ventas'")
+        else:
+            print(f"x Error añadiendo columna 'clave_idempotencia': {e}")
+    try:
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_ventas_clave_idempotencia ON ventas (clave_idempotencia)")
+        print("✓ Índice 'ix_ventas_clave_idempotencia' creado/verificado")
+    except Exception as e:
+        print(f"x Error creando índice 'ix_ventas_clave_idempotencia': {e}")
+
+    # 3. Una sola comanda por venta y tipo (las comandas se generan en segundo plano)
+    try:
+        cursor.execute("""
+        DELETE FROM comandas
+        WHERE id NOT IN (SELECT MIN(id) FROM comandas GROUP BY venta_id, tipo_comanda)
+        """)
+        if cursor.rowcount:
+            print(f"✓ {cursor.rowcount} comandas duplicadas eliminadas")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_comandas_venta_tipo ON comandas (venta_id, tipo_comanda)")
+        print("✓ Índice 'uq_comandas_venta_tipo' creado/verificado")
+    except Exception as e:
+        print(f"x Error creando índice 'uq_comandas_venta_tipo': {e}")
+
+    # 4. Caché de la comanda en bytes ESC/POS para la impresora térmica
+    try:
+        cursor.execute("ALTER TABLE comandas ADD COLUMN contenido_escpos BLOB")
+        print("✓ Columna 'contenido_escpos' añadida a tabla 'comandas'")
+    except sqlite3.OperationalError as e:
+        if 'duplicate column name' in str(e):
+            print("⚠ Columna 'contenido_escpos' ya existe en 'comandas'")
+        else:
+            print(f"x Error añadiendo columna 'contenido_escpos': {e}")
+
+    # 5. Consumo de ingredientes normalizado (reemplaza el JSON venta_items.explosion_detalles)
+    try:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS venta_item_consumos (
+            id INTEGER NOT NULL PRIMARY KEY,
+            venta_item_id INTEGER NOT NULL,
+            ingrediente_id INTEGER NOT NULL,
+            cantidad FLOAT NOT NULL,
+            costo_unitario FLOAT,
+            FOREIGN KEY(venta_item_id) REFERENCES venta_items (id),
+            FOREIGN KEY(ingrediente_id) REFERENCES ingredientes (id)
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_venta_item_consumos_venta_item_id ON venta_item_consumos (venta_item_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_venta_item_consumos_ingrediente_id ON venta_item_consumos (ingrediente_id)")
+        print("✓ Tabla 'venta_item_consumos' creada/verificada")
+
+        # Pasar el JSON de las ventas anteriores a filas (incluye el formato anidado por sub-receta)
+        def hojas(detalles):
+            for info in detalles.values():
+                if not isinstance(info, dict):
+                    continue
+                if 'ingrediente_id' in info:
+                    yield info['ingrediente_id'], info.get('cantidad_total', 0), info.get('costo_unitario') or 0
+                elif 'items_descontados' in info:
+                    yield from hojas(info['items_descontados'])
+
+        cursor.execute("""
+        SELECT id, explosion_detalles FROM venta_items
+        WHERE es_receta = 1
+          AND explosion_detalles IS NOT NULL AND explosion_detalles != '{}'
+          AND id NOT IN (SELECT venta_item_id FROM venta_item_consumos)
+        """)
+        filas = []
+        for venta_item_id, explosion_detalles in cursor.fetchall():
+            try:
+                detalles = json.loads(explosion_detalles)
+            except ValueError:
+                print(f"⚠ explosion_detalles ilegible en venta_item {venta_item_id}, se omite")
+                continue
+            por_ingrediente = {}
+            for ingrediente_id, cantidad, costo_unitario in hojas(detalles):
+                acumulado = por_ingrediente.setdefault(ingrediente_id, [0, costo_unitario])
+                acumulado[0] += cantidad
+            filas.extend(
+                (venta_item_id, ingrediente_id, cantidad, costo_unitario)
+                for ingrediente_id, (cantidad, costo_unitario) in por_ingrediente.items()
+            )
+        cursor.executemany(
+            "INSERT INTO venta_item_consumos (venta_item_id, ingrediente_id, cantidad, costo_unitario) VALUES (?, ?, ?, ?)",
+            filas
+        )
+        print(f"✓ {len(filas)} consumos migrados desde explosion_detalles")
+    except Exception as e:
+        print(f"x Error migrando 'venta_item_consumos': {e}")
+
+    # 6. Permitir ingrediente_id nulo en 'receta_ingredientes' (las líneas de sub-receta no tienen ingrediente)
+    try:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='receta_ingredientes'")
+        fila = cursor.fetchone()
+        if fila and 'ingrediente_id INTEGER NOT NULL' in fila[0]:
+            cursor.execute("ALTER TABLE receta_ingredientes RENAME TO receta_ingredientes_old")
+            cursor.execute("""
+            CREATE TABLE receta_ingredientes (
+                id INTEGER NOT NULL,
+                receta_id INTEGER NOT NULL,
+                ingrediente_id INTEGER,
+                sub_receta_id INTEGER,
+                cantidad FLOAT NOT NULL,
+                costo_calculado FLOAT,
+                created_at DATETIME,
+                PRIMARY KEY (id),
+                FOREIGN KEY(receta_id) REFERENCES recetas (id),
+                FOREIGN KEY(ingrediente_id) REFERENCES ingredientes (id),
+                FOREIGN KEY(sub_receta_id) REFERENCES recetas (id)
+            )
+            """)
+            cursor.execute("""
+            INSERT INTO receta_ingredientes (id, receta_id, ingrediente_id, sub_receta_id, cantidad, costo_calculado, created_at)
+            SELECT id, receta_id, ingrediente_id, sub_receta_id, cantidad, costo_calculado, created_at
+            FROM receta_ingredientes_old
+            """)
+            cursor.execute("DROP TABLE receta_ingredientes_old")
+            print("✓ Columna 'ingrediente_id' de 'receta_ingredientes' ahora admite nulos")
+        else:
+            print("⚠ 'receta_ingredientes.ingrediente_id' ya admite nulos")
+    except Exception as e:
+        print(f"x Error recreando 'receta_ingredientes': {e}")
+
+    # 7. Libro de movimientos de inventario y corte inicial con el stock actual
+    try:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS movimientos_inventario (
+            id INTEGER NOT NULL,
+            tipo_recurso SMALLINT NOT NULL,
+            recurso_id INTEGER NOT NULL,
+            tipo_movimiento SMALLINT NOT NULL,
+            cantidad FLOAT NOT NULL,
+            referencia_id INTEGER,
+            created_at DATETIME,
+            PRIMARY KEY (id)
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_movimientos_inventario_recurso ON movimientos_inventario (tipo_recurso, recurso_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_movimientos_inventario_created_at ON movimientos_inventario (created_at)")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS snapshots_inventario (
+            id INTEGER NOT NULL,
+            tipo_recurso SMALLINT NOT NULL,
+            recurso_id INTEGER NOT NULL,
+            movimiento_id INTEGER NOT NULL,
+            stock FLOAT NOT NULL,
+            created_at DATETIME,
+            PRIMARY KEY (id)
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_snapshots_inventario_recurso ON snapshots_inventario (tipo_recurso, recurso_id, movimiento_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_snapshots_inventario_movimiento_id ON snapshots_inventario (movimiento_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_snapshots_inventario_created_at ON snapshots_inventario (created_at)")
+        print("✓ Tablas 'movimientos_inventario' y 'snapshots_inventario' creadas/verificadas")
+
+        cursor.execute("SELECT COUNT(*) FROM snapshots_inventario")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos_inventario")
+            ultimo_movimiento = cursor.fetchone()[0]
+            ahora = datetime.utcnow().isoformat(" ")
+            cursor.execute(
+                "INSERT INTO snapshots_inventario (tipo_recurso, recurso_id, movimiento_id, stock, created_at) "
+                "SELECT 1, id, ?, COALESCE(stock, 0), ? FROM productos",
+                (ultimo_movimiento, ahora)
+            )
+            cursor.execute(
+                "INSERT INTO snapshots_inventario (tipo_recurso, recurso_id, movimiento_id, stock, created_at) "
+                "SELECT 2, id, ?, COALESCE(stock_actual, 0), ? FROM ingredientes",
+                (ultimo_movimiento, ahora)
+            )
+            print("✓ Corte inicial del libro de inventario creado con el stock actual")
+        else:
+            print("⚠ El libro de inventario ya tiene cortes")
+    except Exception as e:
+        print(f"x Error creando el libro de inventario: {e}")
+
+    # 8. Resúmenes de ventas por hora y por día, cargados con las ventas no anuladas existentes
+    for tabla, tipo_bucket, expr_bucket in RESUMENES:
+        try:
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {tabla} (
+                bucket {tipo_bucket} NOT NULL,
+                usuario_id INTEGER NOT NULL,
+                tipo_item VARCHAR(10) NOT NULL,
+                item_id INTEGER NOT NULL,
+                cantidad INTEGER NOT NULL,
+                ingresos FLOAT NOT NULL,
+                descuentos FLOAT NOT NULL,
+                iva FLOAT NOT NULL,
+                costo FLOAT NOT NULL,
+                PRIMARY KEY (bucket, usuario_id, tipo_item, item_id)
+            )
+            """)
+            cursor.execute(f"SELECT COUNT(*) FROM {tabla}")
+            if cursor.fetchone()[0] > 0:
+                print(f"⚠ '{tabla}' ya tiene datos, no se recalcula")
+                continue
+
+            cargar_resumen(cursor, tabla, expr_bucket)
+            cursor.execute(f"SELECT COUNT(*) FROM {tabla}")
+            print(f"✓ '{tabla}' creada con {cursor.fetchone()[0]} filas")
+        except Exception as e:
+            print(f"x Error creando '{tabla}': {e}")
+
+    # 9. Índices por cajero y usuario_id de las ventas antiguas (solo tenían el nombre)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_ventas_usuario_created_at ON ventas (usuario_id, created_at)")
+        for tabla, _, _ in RESUMENES:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{tabla}_usuario ON {tabla} (usuario_id, bucket)")
+        print("✓ Índices por cajero creados/verificados")
+
+        # Solo se asigna cuando el nombre corresponde a un único usuario
+        cursor.execute("""
+        UPDATE ventas
+        SET usuario_id = (SELECT u.id FROM usuarios u WHERE u.nombre = ventas.usuario)
+        WHERE usuario_id IS NULL
+          AND usuario IS NOT NULL
+          AND (SELECT COUNT(*) FROM usuarios u WHERE u.nombre = ventas.usuario) = 1
+        """)
+        asignadas = cursor.rowcount
+        cursor.execute("SELECT COUNT(*) FROM ventas WHERE usuario_id IS NULL")
+        sin_usuario = cursor.fetchone()[0]
+        if asignadas:
+            print(f"✓ usuario_id asignado a {asignadas} ventas por nombre de cajero")
+            # Sus filas de resumen estaban bajo usuario_id 0: se recalculan
+            for tabla, _, expr_bucket in RESUMENES:
+                cursor.execute(f"DELETE FROM {tabla}")
+                cargar_resumen(cursor, tabla, expr_bucket)
+            print("✓ Resúmenes de ventas recalculados con el usuario_id asignado")
+        else:
+            print("⚠ No hay ventas pendientes de asignar usuario_id")
+        if sin_usuario:
+            print(f"⚠ {sin_usuario} ventas siguen sin usuario_id (nombre inexistente o repetido)")
+    except Exception as e:
+        print(f"x Error asignando usuario_id a las ventas: {e}")
+
+    # 10. Índices para leer ventas por rango de fechas y sus líneas por venta
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_ventas_created_at ON ventas (created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_venta_items_venta_id ON venta_items (venta_id)")
+        print("✓ Índices 'ix_ventas_created_at' e 'ix_venta_items_venta_id' creados/verificados")
+    except Exception as e:
+        print(f"x Error creando índices de ventas: {e}")
+        
+    conn.commit()
+    conn.close()
+    print("Migración completada.")
+
+if __name__ == '__main__':
+    migrate()
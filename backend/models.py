@@ -1,6 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import json
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -218,6 +217,9 @@ class Producto(db.Model):
 # ============= VENTAS (LEGACY) =============
 class Venta(db.Model):
     __tablename__ = 'ventas'
+    __table_args__ = (
+        db.Index('ix_ventas_usuario_created_at', 'usuario_id', 'created_at'),  # Ventas de un cajero en un rango
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True) # ID Usuario
@@ -230,7 +232,8 @@ class Venta(db.Model):
     propina = db.Column(db.Float, default=0)
     total = db.Column(db.Float, default=0)
     anulada = db.Column(db.Boolean, default=False)  # Nueva bandera para anulación
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    clave_idempotencia = db.Column(db.String(64), unique=True, index=True, nullable=True)  # Enviada por el cliente para reintentos seguros
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Historial y exportación por rango
     
     items = db.relationship('VentaItem', backref='venta', lazy=True, cascade='all, delete-orphan')
     
@@ -254,25 +257,27 @@ class VentaItem(db.Model):
     __tablename__ = 'venta_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    venta_id = db.Column(db.Integer, db.ForeignKey('ventas.id'), nullable=False)
-    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id'), nullable=False)
+    venta_id = db.Column(db.Integer, db.ForeignKey('ventas.id'), nullable=False, index=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id'), nullable=True)  # Nulo si es una receta
     receta_id = db.Column(db.Integer, db.ForeignKey('recetas.id'), nullable=True)  # Si es una receta
     cantidad = db.Column(db.Integer, nullable=False)
     precio_unitario = db.Column(db.Float, nullable=False)
     subtotal = db.Column(db.Float, nullable=False)
     observaciones = db.Column(db.Text, default='')
     es_receta = db.Column(db.Boolean, default=False)  # Para saber si hubo explosión
-    explosion_detalles = db.Column(db.Text, default='{}')  # JSON con ingredientes descontados
+    explosion_detalles = db.Column(db.Text, default='{}')  # Legacy: JSON de ventas anteriores a venta_item_consumos
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     producto = db.relationship('Producto')
     receta = db.relationship('Receta')
+    consumos = db.relationship('VentaItemConsumo', backref='venta_item', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         datos = {
             'id': self.id,
             'producto_id': self.producto_id,
-            'producto_nombre': self.producto.nombre,
+            'receta_id': self.receta_id,
+            'producto_nombre': self.receta.nombre if self.es_receta and self.receta else self.producto.nombre,
             'cantidad': self.cantidad,
             'precio_unitario': self.precio_unitario,
             'subtotal': self.subtotal,
@@ -282,14 +287,141 @@ class VentaItem(db.Model):
         }
         
         # Incluir detalles de explosión si aplica
-        if self.es_receta and self.explosion_detalles:
-            try:
-                datos['explosion_detalles'] = json.loads(self.explosion_detalles)
-            except:
-                datos['explosion_detalles'] = {}
+        if self.es_receta:
+            datos['explosion_detalles'] = {
+                f"ing_{consumo.ingrediente_id}": consumo.to_dict(self.cantidad)
+                for consumo in self.consumos
+            }
         
         return datos
 
+class VentaItemConsumo(db.Model):
+    __tablename__ = 'venta_item_consumos'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    venta_item_id = db.Column(db.Integer, db.ForeignKey('venta_items.id'), nullable=False, index=True)
+    ingrediente_id = db.Column(db.Integer, db.ForeignKey('ingredientes.id'), nullable=False, index=True)
+    cantidad = db.Column(db.Float, nullable=False)  # Total descontado por la línea (todas las porciones)
+    costo_unitario = db.Column(db.Float, default=0)  # Costo del ingrediente al momento de la venta
+    
+    ingrediente = db.relationship('Ingrediente')
+    
+    def to_dict(self, cantidad_recetas=1):
+        return {
+            'ingrediente_id': self.ingrediente_id,
+            'ingrediente_nombre': self.ingrediente.nombre if self.ingrediente else None,
+            'unidad': self.ingrediente.unidad_medida if self.ingrediente else None,
+            'cantidad_por_receta': self.cantidad / cantidad_recetas if cantidad_recetas else self.cantidad,
+            'cantidad_total': self.cantidad,
+            'costo_unitario': self.costo_unitario,
+            'costo_total': round(self.cantidad * (self.costo_unitario or 0), 2)
+        }
+
+class ReservaStock(db.Model):
+    __tablename__ = 'reservas_stock'
+    __table_args__ = (
+        # Suma de reservas vigentes por recurso (disponible = stock - reservado)
+        db.Index('ix_reservas_stock_recurso', 'tipo_recurso', 'recurso_id', 'expira_en'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    codigo = db.Column(db.String(32), nullable=False, index=True)  # Agrupa las reservas de un carrito
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    tipo_recurso = db.Column(db.String(20), nullable=False)  # 'producto' | 'ingrediente'
+    recurso_id = db.Column(db.Integer, nullable=False)
+    cantidad = db.Column(db.Float, nullable=False)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)  # Barrido de reservas vencidas
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'codigo': self.codigo,
+            'usuario_id': self.usuario_id,
+            'tipo_recurso': self.tipo_recurso,
+            'recurso_id': self.recurso_id,
+            'cantidad': self.cantidad,
+            'expira_en': self.expira_en.isoformat(),
+            'created_at': self.created_at.isoformat()
+        }
+
+class MovimientoInventario(db.Model):
+    __tablename__ = 'movimientos_inventario'
+    __table_args__ = (
+        # Movimientos de un recurso desde un snapshot (id creciente = orden del libro)
+        db.Index('ix_movimientos_inventario_recurso', 'tipo_recurso', 'recurso_id', 'id'),
+    )
+
+    # Libro de solo inserción: ninguna fila se actualiza ni se borra.
+    # Los códigos son enteros para que cada fila ocupe poco (ver LibroInventario).
+    id = db.Column(db.Integer, primary_key=True)
+    tipo_recurso = db.Column(db.SmallInteger, nullable=False)  # 1 producto, 2 ingrediente
+    recurso_id = db.Column(db.Integer, nullable=False)
+    tipo_movimiento = db.Column(db.SmallInteger, nullable=False)  # 1 venta, 2 compra, 3 merma, 4 anulación, 5 ajuste
+    cantidad = db.Column(db.Float, nullable=False)  # Con signo: negativo descuenta stock
+    referencia_id = db.Column(db.Integer, nullable=True)  # Venta, reabastecimiento o merma que lo originó
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SnapshotInventario(db.Model):
+    __tablename__ = 'snapshots_inventario'
+    __table_args__ = (
+        db.Index('ix_snapshots_inventario_recurso', 'tipo_recurso', 'recurso_id', 'movimiento_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo_recurso = db.Column(db.SmallInteger, nullable=False)
+    recurso_id = db.Column(db.Integer, nullable=False)
+    movimiento_id = db.Column(db.Integer, nullable=False, index=True)  # Último movimiento incluido en el stock
+    stock = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# ============= RESÚMENES DE VENTAS =============
+# Clave: (bucket, usuario_id, tipo_item, item_id). Las filas tipo_item 'venta'
+# acumulan la cabecera (cantidad = número de ventas, ingresos = total,
+# descuentos, iva); las filas 'producto'/'receta' acumulan las líneas
+# (cantidad = unidades, ingresos = subtotal, costo = ingredientes consumidos).
+# Se mantienen en la misma transacción que la venta y su anulación (ResumenVentas).
+class ResumenVentasHora(db.Model):
+    __tablename__ = 'ventas_resumen_hora'
+    __table_args__ = (
+        db.Index('ix_ventas_resumen_hora_usuario', 'usuario_id', 'bucket'),  # Reportes por cajero
+    )
+    
+    bucket = db.Column(db.DateTime, primary_key=True)  # Inicio de la hora (UTC)
+    usuario_id = db.Column(db.Integer, primary_key=True)  # 0 si la venta no tiene usuario
+    tipo_item = db.Column(db.String(10), primary_key=True)  # 'venta' | 'producto' | 'receta'
+    item_id = db.Column(db.Integer, primary_key=True)  # 0 en las filas 'venta'
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    ingresos = db.Column(db.Float, nullable=False, default=0)
+    descuentos = db.Column(db.Float, nullable=False, default=0)
+    iva = db.Column(db.Float, nullable=False, default=0)
+    costo = db.Column(db.Float, nullable=False, default=0)
+
+class ResumenVentasDia(db.Model):
+    __tablename__ = 'ventas_resumen_dia'
+    __table_args__ = (
+        db.Index('ix_ventas_resumen_dia_usuario', 'usuario_id', 'bucket'),  # Reportes por cajero
+    )
+    
+    bucket = db.Column(db.Date, primary_key=True)  # Día (UTC)
+    usuario_id = db.Column(db.Integer, primary_key=True)  # 0 si la venta no tiene usuario
+    tipo_item = db.Column(db.String(10), primary_key=True)  # 'venta' | 'producto' | 'receta'
+    item_id = db.Column(db.Integer, primary_key=True)  # 0 en las filas 'venta'
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    ingresos = db.Column(db.Float, nullable=False, default=0)
+    descuentos = db.Column(db.Float, nullable=False, default=0)
+    iva = db.Column(db.Float, nullable=False, default=0)
+    costo = db.Column(db.Float, nullable=False, default=0)
+
+# ============= CONTADORES DEL DASHBOARD =============
+# Totales históricos que se mantienen en cada venta, anulación y movimiento
+# de stock de productos (clave -> valor), para no recorrer tablas al mostrarlos.
+class ContadorDashboard(db.Model):
+    __tablename__ = 'contadores_dashboard'
+    
+    clave = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Float, nullable=False, default=0)
+
 class Merma(db.Model):
     __tablename__ = 'mermas'
     
@@ -339,12 +471,16 @@ class MermaIngrediente(db.Model):
 # ============= COMPROBANTES/COMANDAS =============
 class Comanda(db.Model):
     __tablename__ = 'comandas'
+    __table_args__ = (
+        db.UniqueConstraint('venta_id', 'tipo_comanda', name='uq_comandas_venta_tipo'),  # Una comanda por tipo y venta
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     venta_id = db.Column(db.Integer, db.ForeignKey('ventas.id'), nullable=False, unique=False)
     tipo_comanda = db.Column(db.String(20), nullable=False)  # 'cocina' o 'caja'
     contenido_html = db.Column(db.Text, nullable=False)  # HTML del comprobante
     contenido_texto = db.Column(db.Text, nullable=False)  # Versión texto para impresora térmica
+    contenido_escpos = db.deferred(db.Column(db.LargeBinary, nullable=True))  # Bytes ESC/POS (se carga solo al descargarlos)
     impresa = db.Column(db.Boolean, default=False)
     fecha_impresion = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -360,3 +496,13 @@ class Comanda(db.Model):
             'fecha_impresion': self.fecha_impresion.isoformat() if self.fecha_impresion else None,
             'created_at': self.created_at.isoformat()
         }
+
+class ComandaEvento(db.Model):
+    __tablename__ = 'comanda_eventos'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Cursor del feed de cocina (Last-Event-ID)
+    comanda_id = db.Column(db.Integer, db.ForeignKey('comandas.id'), nullable=False)
+    venta_id = db.Column(db.Integer, nullable=False)
+    tipo_comanda = db.Column(db.String(20), nullable=False)
+    evento = db.Column(db.String(20), nullable=False)  # 'creada' | 'impresa'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -6,6 +6,7 @@ from models import db
 from services.auth_service import AuthService
 from services.ingredientes_service import IngredienteService
 from services.calculos_service import GeneradorReportes
+from services.indice_nombres import IndiceNombres
 
 ingredientes_bp = Blueprint('ingredientes', __name__)
 
@@ -98,6 +99,33 @@ def crear_ingrediente():
         return jsonify({'error': str(e)}), 500
 
 
+@ingredientes_bp.route('/ingredientes/autocompletar', methods=['GET'])
+@AuthService.requerir_autenticacion
+def autocompletar_ingredientes():
+    """
+    Endpoint de autocompletado de ingredientes (índice en memoria, sin tildes).
+    
+    Query Parameters:
+        q: string - lo escrito por el usuario
+        limite: int (default 10, máximo 50)
+    
+    Returns:
+        {
+            "resultados": [{"id", "nombre", "unidad_medida"}]
+        }
+    """
+    try:
+        resultados = IndiceNombres.buscar(
+            'ingrediente',
+            request.args.get('q', ''),
+            limite=request.args.get('limite', 10, type=int)
+        )
+        return jsonify({'resultados': resultados}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @ingredientes_bp.route('/ingredientes/<int:ingrediente_id>', methods=['GET'])
 @AuthService.requerir_autenticacion
 def obtener_ingrediente(ingrediente_id):
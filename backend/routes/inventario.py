@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify
 from models import db, Ingrediente, ReabastecimientoInventario, Receta, MermaIngrediente
 from services.auth_service import AuthService
-from services.calculos_service import CalculoCostos
+from services.grafo_recetas import GrafoRecetas
+from services.libro_inventario import LibroInventario
+from sqlalchemy import func, case
+from datetime import datetime
 
 inventario_bp = Blueprint('inventario', __name__, url_prefix='/api/inventario')
 
@@ -58,26 +61,34 @@ def reabastecer_inventario():
         
         # Actualizar Costo Unitario (Promedio Ponderado)
         # Costo Unitario Nuevo = ( (StockActual * CostoActual) + CostoCompraTotal ) / (StockActual + CantidadNueva)
-        valor_stock_actual = ingrediente.stock_actual * ingrediente.costo_unitario
-        nuevo_stock_total = ingrediente.stock_actual + cantidad_nueva
+        tabla = Ingrediente.__table__
+        stock_actual = func.coalesce(tabla.c.stock_actual, 0)
+        costo_actual = func.coalesce(tabla.c.costo_unitario, 0)
+        nuevo_costo_unitario = (stock_actual * costo_actual + costo_compra_total) / (stock_actual + cantidad_nueva)
         
-        nuevo_costo_unitario = (valor_stock_actual + costo_compra_total) / nuevo_stock_total
-        
-        # Guardar historial si el costo cambia significativamente (>1%)
-        if abs(ingrediente.costo_unitario - nuevo_costo_unitario) > (ingrediente.costo_unitario * 0.01):
-             ingrediente.costo_anterior = ingrediente.costo_unitario
-             # Aquí podríamos disparar el recálculo de recetas
-        
-        ingrediente.costo_unitario = round(nuevo_costo_unitario, 2)
-        ingrediente.stock_actual = round(nuevo_stock_total, 3) # 3 decimales para precisión en kg/lt
+        db.session.execute(tabla.update().where(tabla.c.id == ingrediente.id).values(
+            # Guardar historial si el costo cambia significativamente (>1%)
+            costo_anterior=case(
+                (func.abs(costo_actual - nuevo_costo_unitario) > costo_actual * 0.01, tabla.c.costo_unitario),
+                else_=tabla.c.costo_anterior
+            ),
+            costo_unitario=func.round(nuevo_costo_unitario, 2),
+            stock_actual=func.round(stock_actual + cantidad_nueva, 3)  # 3 decimales para precisión en kg/lt
+        ))
         
         db.session.add(reabastecimiento)
+        db.session.flush()
+        LibroInventario.registrar(LibroInventario.COMPRA, [
+            (LibroInventario.INGREDIENTE, ingrediente.id, cantidad_nueva, reabastecimiento.id)
+        ])
         db.session.commit()
 
         # Opcional: Disparar recálculo de costos de recetas que usen este ingrediente
         # Esto podría ser una tarea asíncrona en un sistema más grande
+        # (incluye las recetas que las usan como sub-receta, en orden topológico)
         recetas_afectadas = Receta.query.join(Receta.ingredientes).filter_by(ingrediente_id=ingrediente.id).all()
-        CalculoCostos.recalcular_todas_recetas(request.usuario.id, db, recetas_afectadas)
+        GrafoRecetas.recalcular_costos([receta.id for receta in recetas_afectadas])
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -125,9 +136,18 @@ def registrar_merma():
         )
         
         # Descontar stock
-        ingrediente.stock_actual = (ingrediente.stock_actual or 0) - cantidad
+        tabla = Ingrediente.__table__
+        db.session.execute(
+            tabla.update().where(tabla.c.id == ingrediente.id).values(
+                stock_actual=func.coalesce(tabla.c.stock_actual, 0) - cantidad
+            )
+        )
         
         db.session.add(merma)
+        db.session.flush()
+        LibroInventario.registrar(LibroInventario.MERMA, [
+            (LibroInventario.INGREDIENTE, ingrediente.id, -cantidad, merma.id)
+        ])
         db.session.commit()
         
         return jsonify({
@@ -139,3 +159,100 @@ def registrar_merma():
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+
+def _parsear_recurso_libro():
+    """Lee tipo e id del recurso de los query params; devuelve (tipo_recurso, id, error)"""
+    tipos = {nombre: codigo for codigo, nombre in LibroInventario.TIPOS_RECURSO.items()}
+    tipo = request.args.get('tipo', 'ingrediente')
+    recurso_id = request.args.get('id', type=int)
+    
+    if tipo not in tipos:
+        return None, None, 'Tipo inválido (producto o ingrediente)'
+    if not recurso_id:
+        return None, None, 'Falta el parámetro id'
+    return tipos[tipo], recurso_id, None
+
+def _parsear_fecha_param(nombre):
+    valor = request.args.get(nombre)
+    if not valor:
+        return None
+    return datetime.fromisoformat(valor)
+
+@inventario_bp.route('/movimientos', methods=['GET'])
+@AuthService.requerir_autenticacion
+def listar_movimientos():
+    """
+    Movimientos del libro de inventario de un producto o ingrediente
+    
+    Query params:
+    - tipo: producto | ingrediente (default ingrediente)
+    - id: ID del recurso
+    - desde / hasta: fechas ISO (UTC), opcionales
+    - limite: máximo de movimientos (default 100)
+    """
+    try:
+        tipo_recurso, recurso_id, error = _parsear_recurso_libro()
+        if error:
+            return jsonify({'error': error}), 400
+        
+        movimientos = LibroInventario.movimientos(
+            tipo_recurso, recurso_id,
+            desde=_parsear_fecha_param('desde'),
+            hasta=_parsear_fecha_param('hasta'),
+            limite=min(request.args.get('limite', 100, type=int), 1000)
+        )
+        return jsonify({
+            'success': True,
+            'data': movimientos
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@inventario_bp.route('/stock-historico', methods=['GET'])
+@AuthService.requerir_autenticacion
+def stock_historico():
+    """
+    Stock de un producto o ingrediente según el libro, actual o a una fecha
+    
+    Query params:
+    - tipo: producto | ingrediente (default ingrediente)
+    - id: ID del recurso
+    - fecha: fecha ISO (UTC), opcional; sin fecha es el stock actual
+    """
+    try:
+        tipo_recurso, recurso_id, error = _parsear_recurso_libro()
+        if error:
+            return jsonify({'error': error}), 400
+        
+        resultado = LibroInventario.stock(tipo_recurso, recurso_id, hasta=_parsear_fecha_param('fecha'))
+        return jsonify({
+            'success': True,
+            'data': resultado
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@inventario_bp.route('/snapshots', methods=['POST'])
+@AuthService.requerir_autenticacion
+@AuthService.requerir_rol('admin')
+def tomar_snapshot():
+    """Guarda un corte del stock de todos los productos e ingredientes"""
+    try:
+        movimiento_id = LibroInventario.tomar_snapshot()
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'mensaje': 'Corte de inventario guardado',
+            'movimiento_id': movimiento_id
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
@@ -1,5 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models import db, Merma, Producto
+from services.libro_inventario import LibroInventario
+from services.ventas_service_avanzado import VentasServiceAvanzado
 from datetime import datetime, timedelta
 from sqlalchemy import func
 
@@ -20,9 +22,6 @@ def create_merma():
         if not producto:
             return jsonify({"error": "Producto no encontrado"}), 404
         
-        if producto.stock < cantidad:
-            return jsonify({"error": f"Stock insuficiente. Disponible: {producto.stock}"}), 400
-        
         # Crear merma
         merma = Merma(
             producto_id=producto_id,
@@ -32,9 +31,17 @@ def create_merma():
         )
         
         # Descontar del stock
-        producto.stock -= cantidad
+        try:
+            VentasServiceAvanzado.descontar_stock({producto.id: cantidad}, {})
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
         
         db.session.add(merma)
+        db.session.flush()
+        LibroInventario.registrar(LibroInventario.MERMA, [
+            (LibroInventario.PRODUCTO, producto.id, -cantidad, merma.id)
+        ])
         db.session.commit()
         
         return jsonify({
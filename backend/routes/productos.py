@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify
 from models import db, Producto
+from sqlalchemy import func
+from services.libro_inventario import LibroInventario
+from services.contadores_dashboard import ContadoresDashboard
 
 productos_bp = Blueprint('productos', __name__)
 
@@ -44,6 +47,11 @@ def create_producto():
     )
     
     db.session.add(producto)
+    db.session.flush()
+    ContadoresDashboard.registrar_alta_producto()
+    LibroInventario.registrar(LibroInventario.AJUSTE, [
+        (LibroInventario.PRODUCTO, producto.id, producto.stock, None)
+    ])
     db.session.commit()
     
     return jsonify(producto.to_dict()), 201
@@ -60,14 +68,18 @@ def update_producto(id):
     
     data = request.json
     
+    # El stock se ajusta por diferencia con PATCH /productos/<id>/stock
+    if 'stock' in data:
+        return jsonify({"error": "Para cambiar el stock usa PATCH /productos/<id>/stock con la cantidad a sumar"}), 400
+    
     if 'nombre' in data:
         producto.nombre = data['nombre']
     if 'descripcion' in data:
         producto.descripcion = data['descripcion']
     if 'precio' in data:
+        precio_anterior = producto.precio
         producto.precio = float(data['precio'])
-    if 'stock' in data:
-        producto.stock = int(data['stock'])
+        ContadoresDashboard.registrar_cambio_precio(producto.id, producto.precio - (precio_anterior or 0))
     if 'costo' in data:
         producto.costo = float(data['costo'])
     
@@ -85,6 +97,7 @@ def delete_producto(id):
     if not producto:
         return jsonify({"error": "Producto no encontrado"}), 404
     
+    ContadoresDashboard.registrar_baja_producto(producto.id)
     db.session.delete(producto)
     db.session.commit()
     
@@ -103,7 +116,13 @@ def update_stock(id):
     data = request.json
     cantidad = int(data.get('cantidad', 0))
     
-    producto.stock += cantidad
+    tabla = Producto.__table__
+    db.session.execute(
+        tabla.update().where(tabla.c.id == producto.id).values(stock=func.coalesce(tabla.c.stock, 0) + cantidad)
+    )
+    LibroInventario.registrar(LibroInventario.AJUSTE, [
+        (LibroInventario.PRODUCTO, producto.id, cantidad, None)
+    ])
     db.session.commit()
     
     return jsonify({
@@ -6,6 +6,7 @@ from models import db
 from services.auth_service import AuthService
 from services.recetas_service import RecetaService
 from services.calculos_service import CalculoCostos, GeneradorReportes
+from services.indice_nombres import IndiceNombres
 
 recetas_bp = Blueprint('recetas', __name__)
 
@@ -115,6 +116,35 @@ def crear_receta():
         return jsonify({'error': str(e)}), 500
 
 
+@recetas_bp.route('/recetas/autocompletar', methods=['GET'])
+@AuthService.requerir_autenticacion
+def autocompletar_recetas():
+    """
+    Endpoint de autocompletado de recetas del usuario (p. ej. para elegir
+    sub-recetas), desde el índice en memoria y sin tildes.
+    
+    Query Parameters:
+        q: string - lo escrito por el usuario
+        limite: int (default 10, máximo 50)
+    
+    Returns:
+        {
+            "resultados": [{"id", "nombre"}]
+        }
+    """
+    try:
+        resultados = IndiceNombres.buscar(
+            'receta',
+            request.args.get('q', ''),
+            limite=request.args.get('limite', 10, type=int),
+            usuario_id=request.usuario_id
+        )
+        return jsonify({'resultados': resultados}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @recetas_bp.route('/recetas/<int:receta_id>', methods=['GET'])
 @AuthService.requerir_autenticacion
 def obtener_receta(receta_id):
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify, render_template_string
-from models import db, Venta, VentaItem, Producto, Merma
+from flask import Blueprint, request, jsonify
+from models import db, Venta, VentaItem, Producto, Merma, Usuario
 from datetime import datetime, timedelta
 from sqlalchemy import func
+from services.comprobantes_service import PlantillasComprobantes
+from services.libro_inventario import LibroInventario
+from services.contadores_dashboard import ContadoresDashboard
+from services.resumen_ventas import ResumenVentas
+from services.ventas_service_avanzado import VentasServiceAvanzado
+from services.mas_vendidos import MasVendidos
 
 ventas_bp = Blueprint('ventas', __name__)
 
@@ -19,25 +25,28 @@ def create_venta():
         if not items:
             return jsonify({"error": "No hay items en la venta"}), 400
         
-        # Validar stock y calcular subtotal
+        # Validar productos y calcular subtotal (el stock se valida al descontarlo)
         subtotal = 0
+        descuentos = {}
         for item in items:
             producto = Producto.query.get(item['id'])
             
             if not producto:
                 return jsonify({"error": f"Producto {item['id']} no encontrado"}), 404
             
-            if producto.stock < item['cantidad']:
-                return jsonify({"error": f"Stock insuficiente de {producto.nombre}"}), 400
-            
             subtotal += item['precio'] * item['cantidad']
+            descuentos[producto.id] = descuentos.get(producto.id, 0) + item['cantidad']
         
         # Crear venta principal
         iva = round(subtotal * 0.19, 2)
         propina = round(subtotal * 0.10, 2)  # 10% de propina
         total = subtotal + iva + propina
         
+        # Los reportes usan usuario_id: se resuelve por nombre si es único
+        usuario_ids = db.session.query(Usuario.id).filter(Usuario.nombre == usuario).limit(2).all()
+        
         venta = Venta(
+            usuario_id=usuario_ids[0][0] if len(usuario_ids) == 1 else None,
             usuario=usuario,
             cliente_nombre=cliente_nombre,
             numero_mesa=numero_mesa,
@@ -52,8 +61,6 @@ def create_venta():
         
         # Crear items de venta
         for item in items:
-            producto = Producto.query.get(item['id'])
-            
             venta_item = VentaItem(
                 venta_id=venta.id,
                 producto_id=item['id'],
@@ -63,11 +70,20 @@ def create_venta():
                 observaciones=item.get('observaciones', '')
             )
             
-            # Descontar del stock
-            producto.stock -= item['cantidad']
-            
             db.session.add(venta_item)
         
+        # Descontar del stock
+        try:
+            VentasServiceAvanzado.descontar_stock(descuentos, {})
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
+        
+        LibroInventario.registrar(LibroInventario.VENTA, [
+            (LibroInventario.PRODUCTO, item['id'], -item['cantidad'], venta.id) for item in items
+        ])
+        db.session.flush()
+        ResumenVentas.registrar_ventas([venta.id])
         db.session.commit()
         
         return jsonify({
@@ -96,136 +112,16 @@ def get_venta(id):
 # Voucher HTML (para imprimir)
 @ventas_bp.route('/voucher/<int:venta_id>', methods=['GET'])
 def get_voucher(venta_id):
-    venta = Venta.query.get(venta_id)
+    venta = Venta.query.options(
+        *PlantillasComprobantes.opciones_carga()
+    ).filter_by(id=venta_id).first()
     if not venta:
         return jsonify({"error": "Venta no encontrada"}), 404
     
     tipo = request.args.get('tipo', 'cliente')  # cliente o cocina
     
-    # Generar líneas de items
-    items_html = ""
-    for item in venta.items:
-        items_html += f"""
-        <div class="item">
-            <strong>{item.producto_nombre}</strong><br>
-            {item.cantidad} x ${item.precio_unitario} = ${item.subtotal}
-        </div>
-        """
-        if item.observaciones:
-            items_html += f"<div style='font-size: 11px; color: #666; margin-left: 10px;'>* {item.observaciones}</div>"
-    
-    html_template = f"""
-    <!DOCTYPE html>
-    <html lang="es">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Voucher</title>
-        <style>
-            body {{
-                font-family: 'Courier New', monospace;
-                margin: 0;
-                padding: 10px;
-                background: white;
-                width: 80mm;
-                margin: 0 auto;
-            }}
-            .voucher {{
-                text-align: center;
-                border: 1px dashed #333;
-                padding: 15px;
-            }}
-            .header {{
-                font-size: 18px;
-                font-weight: bold;
-                margin-bottom: 10px;
-            }}
-            .separator {{
-                border-top: 1px dashed #333;
-                margin: 10px 0;
-            }}
-            .item {{
-                text-align: left;
-                margin: 5px 0;
-                font-size: 12px;
-            }}
-            .row {{
-                display: flex;
-                justify-content: space-between;
-                font-size: 12px;
-                text-align: left;
-            }}
-            .tipo {{
-                font-weight: bold;
-                color: red;
-                font-size: 14px;
-                margin: 10px 0;
-            }}
-            .total {{
-                font-weight: bold;
-                font-size: 16px;
-                margin-top: 10px;
-            }}
-            @media print {{
-                body {{ margin: 0; padding: 0; }}
-                .voucher {{ border: none; }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="voucher">
-            <div class="header">🍔 CARBON & CHEDDAR</div>
-            <div class="separator"></div>
-            
-            <div class="tipo">{'COPIA COCINA' if tipo == 'cocina' else 'COPIA CLIENTE'}</div>
-            <div class="separator"></div>
-            
-            <div style="text-align: left; font-size: 12px;">
-                <strong>Orden #{venta.id}</strong><br>
-                Hora: {venta.created_at.strftime('%H:%M:%S')}<br>
-                Cajero: {venta.usuario}
-            </div>
-            
-            {f'<div style="text-align: left; font-size: 12px; margin-top: 5px;"><strong>Mesa:</strong> {venta.numero_mesa}</div>' if venta.numero_mesa else ''}
-            {f'<div style="text-align: left; font-size: 12px;"><strong>Cliente:</strong> {venta.cliente_nombre}</div>' if venta.cliente_nombre else ''}
-            
-            <div class="separator"></div>
-            
-            {items_html}
-            
-            <div class="separator"></div>
-            
-            <div class="row">
-                <span>Subtotal:</span>
-                <span>${venta.subtotal}</span>
-            </div>
-            <div class="row">
-                <span>IVA (19%):</span>
-                <span>${venta.iva}</span>
-            </div>
-            <div class="row">
-                <span>Propina (10%):</span>
-                <span>${venta.propina}</span>
-            </div>
-            
-            <div class="separator"></div>
-            
-            <div class="row total">
-                <span>TOTAL:</span>
-                <span>${venta.total}</span>
-            </div>
-            
-            <div class="separator"></div>
-            <div style="font-size: 11px; margin-top: 10px;">¡GRACIAS POR SU COMPRA!</div>
-        </div>
-        <script>
-            window.print();
-        </script>
-    </body>
-    </html>
-    """
-    
-    return render_template_string(html_template)
+    vista = PlantillasComprobantes.vista_venta(venta)
+    return PlantillasComprobantes.voucher(vista, tipo), 200, {'Content-Type': 'text/html; charset=utf-8'}
 
 # Reportes - Ventas por hora
 @ventas_bp.route('/reportes/ventas-por-hora', methods=['GET'])
@@ -277,72 +173,32 @@ def ventas_diarias():
 # Reportes - Productos más vendidos
 @ventas_bp.route('/reportes/productos-mas-vendidos', methods=['GET'])
 def productos_mas_vendidos():
+    # Productos y recetas, desde el resumen por día (rango opcional, ambos días incluidos)
     limite = request.args.get('limite', 10, type=int)
+    criterio = request.args.get('criterio', 'cantidad')
     
-    productos = db.session.query(
-        Producto.id,
-        Producto.nombre,
-        func.sum(VentaItem.cantidad).label('cantidad_vendida'),
-        func.sum(VentaItem.subtotal).label('total_ventas')
-    ).join(VentaItem, Producto.id == VentaItem.producto_id).group_by(Producto.id).order_by(
-        func.sum(VentaItem.cantidad).desc()
-    ).limit(limite).all()
+    try:
+        desde = request.args.get('fecha_inicio')
+        hasta = request.args.get('fecha_fin')
+        desde = datetime.strptime(desde, '%Y-%m-%d').date() if desde else None
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date() + timedelta(days=1) if hasta else None
+        
+        items = MasVendidos.top(desde, hasta, limite=limite, criterio=criterio)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     resultado = [{
-        'producto_id': p[0],
-        'producto_nombre': p[1],
-        'cantidad_vendida': p[2] or 0,
-        'total_ventas': round(p[3], 2) if p[3] else 0
-    } for p in productos]
+        'tipo': item['tipo'],
+        'producto_id': item['item_id'],  # ID de la receta si tipo es 'receta'
+        'producto_nombre': item['nombre'],
+        'cantidad_vendida': item['cantidad'],
+        'total_ventas': item['ingresos']
+    } for item in items]
     
     return jsonify(resultado), 200
 
-# Reportes - Resumen general
-@ventas_bp.route('/reportes/resumen', methods=['GET'])
+# Reportes - Resumen de ventas e inventario (/reportes/resumen es el resumen de recetas)
+@ventas_bp.route('/reportes/resumen-ventas', methods=['GET'])
 def resumen_ventas():
-    ahora = datetime.utcnow()
-    hoy = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
-    hace_7_dias = ahora - timedelta(days=7)
-    
-    # Hoy
-    ventas_hoy = db.session.query(
-        func.count(Venta.id),
-        func.sum(Venta.total)
-    ).filter(Venta.created_at >= hoy).first()
-    
-    # Últimos 7 días
-    ventas_7_dias = db.session.query(
-        func.count(Venta.id),
-        func.sum(Venta.total)
-    ).filter(Venta.created_at >= hace_7_dias).first()
-    
-    # Total
-    ventas_totales = db.session.query(
-        func.count(Venta.id),
-        func.sum(Venta.total)
-    ).first()
-    
-    # Stock
-    productos = Producto.query.all()
-    stock_total = sum(p.stock for p in productos)
-    valor_stock = sum(p.stock * p.precio for p in productos)
-    
-    return jsonify({
-        'hoy': {
-            'cantidad_ventas': ventas_hoy[0] or 0,
-            'total': round(ventas_hoy[1], 2) if ventas_hoy[1] else 0
-        },
-        'ultimos_7_dias': {
-            'cantidad_ventas': ventas_7_dias[0] or 0,
-            'total': round(ventas_7_dias[1], 2) if ventas_7_dias[1] else 0
-        },
-        'total': {
-            'cantidad_ventas': ventas_totales[0] or 0,
-            'total': round(ventas_totales[1], 2) if ventas_totales[1] else 0
-        },
-        'inventario': {
-            'cantidad_productos': len(productos),
-            'stock_total': stock_total,
-            'valor_stock': round(valor_stock, 2)
-        }
-    }), 200
+    # Contadores mantenidos y resúmenes por día/hora: no recorre ventas ni productos
+    return jsonify(ContadoresDashboard.resumen()), 200
@@ -4,10 +4,13 @@ Rutas de Ventas Avanzadas
 - Obtener comprobantes (cocina/caja)
 - Reportes granulares (hora/día/rango)
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from services.auth_service import AuthService
 from services.ventas_service_avanzado import VentasServiceAvanzado
-from datetime import datetime
+from services.comandas_feed import FeedComandas
+from services.cache_reportes import CacheReportes
+from services.exportacion_ventas import ExportacionVentas
+from datetime import datetime, timedelta
 import traceback
 
 ventas_bp = Blueprint('ventas_avanzado', __name__, url_prefix='/api/ventas')
@@ -29,8 +32,13 @@ def crear_venta_explosion():
         "cliente_nombre": "Juan",
         "numero_mesa": "5",
         "descuento": 10,
-        "comentarios": "Cliente VIP"
+        "comentarios": "Cliente VIP",
+        "clave_idempotencia": "opcional, también se acepta en el header Idempotency-Key",
+        "codigo_reserva": "opcional, reserva de stock del carrito (POST /reservas)"
     }
+    
+    Si la clave de idempotencia ya fue usada se devuelve la venta original (200)
+    en lugar de crear una nueva.
     """
     try:
         datos = request.get_json()
@@ -41,9 +49,18 @@ def crear_venta_explosion():
             cliente_nombre=datos.get('cliente_nombre', ''),
             numero_mesa=datos.get('numero_mesa', ''),
             descuento=datos.get('descuento', 0),
-            comentarios=datos.get('comentarios', '')
+            comentarios=datos.get('comentarios', ''),
+            clave_idempotencia=request.headers.get('Idempotency-Key') or datos.get('clave_idempotencia'),
+            codigo_reserva=datos.get('codigo_reserva')
         )
         
+        if resultado['repetida']:
+            return jsonify({
+                'success': True,
+                'message': 'Venta ya registrada previamente',
+                'data': resultado
+            }), 200
+        
         return jsonify({
             'success': True,
             'message': 'Venta creada exitosamente',
@@ -63,6 +80,56 @@ def crear_venta_explosion():
             'message': f'Error al crear venta: {str(e)}'
         }), 500
 
+@ventas_bp.route('/lote', methods=['POST'])
+@AuthService.requerir_autenticacion
+def crear_ventas_lote():
+    """
+    Registra un lote de ventas en una sola transacción (sincronización de POS offline)
+    
+    Body JSON:
+    {
+        "ventas": [
+            {
+                "referencia": "tablet-3-0042",
+                "clave_idempotencia": "2b7c9e4e-tablet-3-0042",
+                "created_at": "2024-05-10T13:45:12-04:00",
+                "items": [{"tipo": "receta", "id": 5, "cantidad": 1}],
+                "cliente_nombre": "Juan",
+                "numero_mesa": "P2",
+                "descuento": 0
+            }
+        ]
+    }
+    
+    Devuelve un resultado por venta (success + data o message), en el mismo orden.
+    """
+    try:
+        datos = request.get_json() or {}
+        
+        resultado = VentasServiceAvanzado.crear_ventas_lote(
+            usuario_id=request.usuario_id,
+            ventas=datos.get('ventas', [])
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': f"{resultado['exitosas']} de {resultado['procesadas']} ventas registradas",
+            'data': resultado
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error al registrar lote de ventas: {str(e)}'
+        }), 500
+
 # ======================== COMPROBANTES ========================
 
 @ventas_bp.route('/<int:venta_id>/comanda/<tipo>', methods=['GET'])
@@ -100,6 +167,78 @@ def obtener_comanda(venta_id, tipo):
             'message': f'Error al obtener comanda: {str(e)}'
         }), 500
 
+@ventas_bp.route('/<int:venta_id>/comanda/<tipo>/escpos', methods=['GET'])
+@AuthService.requerir_autenticacion
+def descargar_comanda_escpos(venta_id, tipo):
+    """
+    Descarga la comanda como bytes ESC/POS para enviar directo a la impresora térmica
+    
+    tipo: 'cocina' | 'caja'
+    """
+    try:
+        if tipo not in ['cocina', 'caja']:
+            return jsonify({
+                'success': False,
+                'message': f'Tipo de comanda inválido: {tipo}. Debe ser "cocina" o "caja"'
+            }), 400
+        
+        comanda_id, contenido = VentasServiceAvanzado.obtener_comanda_escpos(venta_id, tipo)
+        
+        return Response(contenido, mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename=comanda_{venta_id}_{tipo}.bin',
+            'X-Comanda-Id': str(comanda_id)
+        })
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 404
+    
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error al obtener comanda: {str(e)}'
+        }), 500
+
+@ventas_bp.route('/comandas/feed', methods=['GET'])
+def feed_comandas():
+    """
+    Stream SSE de comandas nuevas, impresas o anuladas para las pantallas de cocina
+    
+    Query params:
+    - tipo: 'cocina' | 'caja' (default: cocina)
+    - token: JWT (EventSource no permite enviar el header Authorization)
+    - desde: ID del último evento recibido; también se acepta el header Last-Event-ID
+    """
+    token = AuthService.obtener_token_de_header() or request.args.get('token')
+    payload = AuthService.verificar_token(token) if token else None
+    if not payload:
+        return jsonify({'error': 'Token faltante o inválido'}), 401
+    
+    tipo = request.args.get('tipo', 'cocina')
+    if tipo not in ['cocina', 'caja']:
+        return jsonify({
+            'success': False,
+            'message': f'Tipo de comanda inválido: {tipo}. Debe ser "cocina" o "caja"'
+        }), 400
+    
+    desde = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    try:
+        cursor = int(desde) if desde else FeedComandas.cursor_inicial(tipo)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Cursor inválido'
+        }), 400
+    
+    return Response(
+        stream_with_context(FeedComandas.transmitir(cursor, tipo)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @ventas_bp.route('/comanda/<int:comanda_id>/marcar-impresa', methods=['PUT'])
 @AuthService.requerir_autenticacion
 def marcar_comanda_impresa(comanda_id):
@@ -149,9 +288,12 @@ def reporte_por_hora():
         
         fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
         
-        reporte = VentasServiceAvanzado.reporte_ventas_por_hora(
-            usuario_id=request.usuario_id,
-            fecha=fecha
+        reporte = CacheReportes.obtener(
+            'por-hora', request.usuario_id, fecha, fecha,
+            lambda: VentasServiceAvanzado.reporte_ventas_por_hora(
+                usuario_id=request.usuario_id,
+                fecha=fecha
+            )
         )
         
         return jsonify({
@@ -201,10 +343,13 @@ def reporte_por_dia():
                 'message': 'fecha_inicio no puede ser mayor que fecha_fin'
             }), 400
         
-        reporte = VentasServiceAvanzado.reporte_ventas_por_dia(
-            usuario_id=request.usuario_id,
-            fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin
+        reporte = CacheReportes.obtener(
+            'por-dia', request.usuario_id, fecha_inicio, fecha_fin,
+            lambda: VentasServiceAvanzado.reporte_ventas_por_dia(
+                usuario_id=request.usuario_id,
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin
+            )
         )
         
         return jsonify({
@@ -254,8 +399,63 @@ def reporte_detallado():
                 'message': 'fecha_inicio no puede ser mayor que fecha_fin'
             }), 400
         
-        reporte = VentasServiceAvanzado.reporte_detallado_ventas(
-            usuario_id=request.usuario_id,
+        reporte = CacheReportes.obtener(
+            'detallado', request.usuario_id, fecha_inicio, fecha_fin,
+            lambda: VentasServiceAvanzado.reporte_detallado_ventas(
+                usuario_id=request.usuario_id,
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin
+            )
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': reporte
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error en formato de fecha: {str(e)}'
+        }), 400
+    
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@ventas_bp.route('/reportes/consumo-ingredientes', methods=['GET'])
+@AuthService.requerir_autenticacion
+def reporte_consumo_ingredientes():
+    """
+    Consumo de ingredientes por ventas (cantidad y costo al momento de la venta)
+    
+    Query params:
+    - fecha_inicio: YYYY-MM-DD
+    - fecha_fin: YYYY-MM-DD
+    """
+    try:
+        fecha_inicio_str = request.args.get('fecha_inicio')
+        fecha_fin_str = request.args.get('fecha_fin')
+        
+        if not fecha_inicio_str or not fecha_fin_str:
+            return jsonify({
+                'success': False,
+                'message': 'Parámetros requeridos: fecha_inicio y fecha_fin (YYYY-MM-DD)'
+            }), 400
+        
+        fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
+        fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d').date()
+        
+        if fecha_inicio > fecha_fin:
+            return jsonify({
+                'success': False,
+                'message': 'fecha_inicio no puede ser mayor que fecha_fin'
+            }), 400
+        
+        reporte = VentasServiceAvanzado.reporte_consumo_ingredientes(
             fecha_inicio=fecha_inicio,
             fecha_fin=fecha_fin
         )
@@ -284,24 +484,41 @@ def reporte_detallado():
 @AuthService.requerir_autenticacion
 def historial_ventas():
     """
-    Historial de ventas con filtros paginados
+    Historial de ventas con filtros, paginado por cursor
+    
+    Query params:
+    - id
+    - q: busca por prefijos de palabras en cliente, mesa y observaciones
+    - cliente: igual que q, solo en el nombre del cliente
+    - fecha_inicio, fecha_fin: YYYY-MM-DD (fecha_fin incluida) o ISO 8601
+    - cursor: siguiente_cursor de la respuesta anterior
+    - por_pagina: default 20, máximo 100
+    - total: 'true' para incluir un total estimado
     """
     try:
         filtros = {
             'id': request.args.get('id', type=int),
             'fecha_inicio': request.args.get('fecha_inicio'),
             'fecha_fin': request.args.get('fecha_fin'),
-            'cliente': request.args.get('cliente')
+            'cliente': request.args.get('cliente'),
+            'q': request.args.get('q')
         }
-        pagina = request.args.get('pagina', 1, type=int)
+        cursor = request.args.get('cursor')
         por_pagina = request.args.get('por_pagina', 20, type=int)
+        con_total = request.args.get('total', 'false').lower() == 'true'
         
-        resultado = VentasServiceAvanzado.listar_ventas(filtros, pagina, por_pagina)
+        resultado = VentasServiceAvanzado.listar_ventas(filtros, cursor, por_pagina, con_total)
         
         return jsonify({
             'success': True,
             'data': resultado
         }), 200
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
         
     except Exception as e:
         print(traceback.format_exc())
@@ -310,6 +527,66 @@ def historial_ventas():
             'message': f'Error: {str(e)}'
         }), 500
 
+@ventas_bp.route('/exportar/<entidad>', methods=['GET'])
+@AuthService.requerir_autenticacion
+def exportar_ventas(entidad):
+    """
+    Exporta ventas, líneas de venta o consumos de ingredientes de un rango,
+    transmitidos por lotes
+    
+    entidad: 'ventas' | 'items' | 'consumos'
+    
+    Query params:
+    - fecha_inicio: YYYY-MM-DD
+    - fecha_fin: YYYY-MM-DD (incluida)
+    - formato: 'csv' | 'ndjson' (default: csv)
+    """
+    if entidad not in ExportacionVentas.COLUMNAS:
+        return jsonify({
+            'success': False,
+            'message': f'Entidad inválida: {entidad}. Debe ser "ventas", "items" o "consumos"'
+        }), 400
+    
+    formato = request.args.get('formato', 'csv')
+    if formato not in ExportacionVentas.FORMATOS:
+        return jsonify({
+            'success': False,
+            'message': f'Formato inválido: {formato}. Debe ser "csv" o "ndjson"'
+        }), 400
+    
+    fecha_inicio_str = request.args.get('fecha_inicio')
+    fecha_fin_str = request.args.get('fecha_fin')
+    if not fecha_inicio_str or not fecha_fin_str:
+        return jsonify({
+            'success': False,
+            'message': 'Parámetros requeridos: fecha_inicio y fecha_fin (YYYY-MM-DD)'
+        }), 400
+    
+    try:
+        desde = datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
+        hasta = datetime.strptime(fecha_fin_str, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error en formato de fecha: {str(e)}'
+        }), 400
+    
+    if desde >= hasta:
+        return jsonify({
+            'success': False,
+            'message': 'fecha_inicio no puede ser mayor que fecha_fin'
+        }), 400
+    
+    nombre_archivo = f'{entidad}_{fecha_inicio_str}_{fecha_fin_str}.{formato}'
+    return Response(
+        stream_with_context(ExportacionVentas.transmitir(entidad, formato, desde, hasta)),
+        mimetype=ExportacionVentas.FORMATOS[formato],
+        headers={
+            'Content-Disposition': f'attachment; filename="{nombre_archivo}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @ventas_bp.route('/<int:venta_id>', methods=['PUT'])
 @AuthService.requerir_autenticacion
 def actualizar_venta(venta_id):
@@ -338,6 +615,115 @@ def actualizar_venta(venta_id):
             'success': False,
             'message': f'Error: {str(e)}'
         }), 500
+@ventas_bp.route('/validar-carrito', methods=['POST'])
+@AuthService.requerir_autenticacion
+def validar_carrito():
+    """
+    Valida el stock de todo el carrito en una sola llamada
+    
+    Body:
+    {
+        "items": [
+            {"tipo": "producto"|"receta", "id": int, "cantidad": int}
+        ]
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('items')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'Se requiere una lista de items'
+            }), 400
+        
+        resultado = VentasServiceAvanzado.validar_stock_carrito(items, data.get('codigo_reserva'))
+        
+        return jsonify({
+            'success': True,
+            'data': resultado
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error validando stock: {str(e)}'
+        }), 500
+
+@ventas_bp.route('/reservas', methods=['POST'])
+@AuthService.requerir_autenticacion
+def reservar_stock():
+    """
+    Reserva por unos minutos el stock del carrito
+    
+    Body:
+    {
+        "items": [
+            {"tipo": "producto"|"receta", "id": int, "cantidad": int}
+        ],
+        "codigo_reserva": "opcional, reserva anterior del mismo carrito (se reemplaza)"
+    }
+    
+    Si algo no alcanza no se reserva nada (reservado: false) y se devuelven
+    los faltantes como en /validar-carrito.
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('items')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'Se requiere una lista de items'
+            }), 400
+        
+        resultado = VentasServiceAvanzado.reservar_stock_carrito(
+            request.usuario_id, items, data.get('codigo_reserva')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': resultado
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error reservando stock: {str(e)}'
+        }), 500
+
+@ventas_bp.route('/reservas/<codigo>', methods=['DELETE'])
+@AuthService.requerir_autenticacion
+def liberar_reserva(codigo):
+    """Libera la reserva de stock de un carrito"""
+    try:
+        liberadas = VentasServiceAvanzado.liberar_reserva_stock(codigo, request.usuario_id)
+        
+        return jsonify({
+            'success': True,
+            'message': f'{liberadas} reservas liberadas'
+        }), 200
+    
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error liberando reserva: {str(e)}'
+        }), 500
+
 @ventas_bp.route('/validar-stock', methods=['GET'])
 @AuthService.requerir_autenticacion
 def validar_stock():
@@ -379,6 +765,48 @@ def validar_stock():
             'message': f'Error validando stock: {str(e)}'
         }), 500
 
+@ventas_bp.route('/anular-lote', methods=['POST'])
+@AuthService.requerir_autenticacion
+@AuthService.requerir_rol('admin')
+def anular_ventas_lote():
+    """
+    Anula varias ventas en una sola transacción y devuelve su stock (solo
+    administradores: los filtros alcanzan ventas de cualquier usuario)
+    
+    Body JSON (uno de los dos):
+    {
+        "venta_ids": [101, 102, 103]
+    }
+    {
+        "filtros": {"usuario_id": 3, "desde": "2024-05-10T08:00:00", "hasta": "2024-05-10T16:00:00"}
+    }
+    """
+    try:
+        datos = request.get_json() or {}
+        
+        resultado = VentasServiceAvanzado.anular_ventas_lote(
+            venta_ids=datos.get('venta_ids'),
+            filtros=datos.get('filtros')
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': f"{len(resultado['anuladas'])} ventas anuladas",
+            'data': resultado
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error al anular ventas: {str(e)}'
+        }), 500
+
 @ventas_bp.route('/<int:venta_id>/anular', methods=['POST'])
 @AuthService.requerir_autenticacion
 def anular_venta(venta_id):
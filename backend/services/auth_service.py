@@ -108,6 +108,7 @@ class AuthService:
 
             request.usuario = usuario
             request.usuario_id = usuario.id # Mantener compatibilidad
+            request.usuario_rol = usuario.rol # Lo usa requerir_rol
             
             return f(*args, **kwargs)
         
@@ -0,0 +1,146 @@
+"""
+Búsqueda de texto completo en el historial de ventas (SQLite FTS5).
+
+La tabla virtual ventas_busqueda tiene una fila por venta (rowid = venta.id)
+con el nombre del cliente, la mesa y las observaciones de sus líneas. La
+mantienen triggers sobre ventas y venta_items, así que cualquier camino de
+escritura (ventas, lotes, la ruta legacy, edición de cabecera) queda
+indexado en la misma transacción.
+
+Cada palabra buscada es un prefijo ("juan p" encuentra "Juan Pérez") y se
+ignoran mayúsculas y tildes. Si la compilación de SQLite no incluye FTS5 la
+búsqueda vuelve a ILIKE.
+"""
+import re
+
+from sqlalchemy import text, exc, column, bindparam, Integer
+
+from models import db
+
+TABLA = 'ventas_busqueda'
+
+_OBSERVACIONES_VENTA = (
+    "(SELECT COALESCE(group_concat(observaciones, ' '), '') FROM venta_items WHERE venta_id = {venta})"
+)
+
+_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5(
+        cliente_nombre, numero_mesa, observaciones,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA}_venta_insert AFTER INSERT ON ventas BEGIN
+        INSERT INTO {TABLA} (rowid, cliente_nombre, numero_mesa, observaciones)
+        VALUES (new.id, COALESCE(new.cliente_nombre, ''), COALESCE(new.numero_mesa, ''), '');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA}_venta_update AFTER UPDATE OF cliente_nombre, numero_mesa ON ventas BEGIN
+        UPDATE {TABLA}
+        SET cliente_nombre = COALESCE(new.cliente_nombre, ''), numero_mesa = COALESCE(new.numero_mesa, '')
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA}_venta_delete AFTER DELETE ON ventas BEGIN
+        DELETE FROM {TABLA} WHERE rowid = old.id;
+    END
+    """,
+    # Las líneas sin observaciones (la mayoría) no tocan el índice al insertarse
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA}_item_insert AFTER INSERT ON venta_items
+    WHEN COALESCE(new.observaciones, '') <> '' BEGIN
+        UPDATE {TABLA} SET observaciones = {_OBSERVACIONES_VENTA.format(venta='new.venta_id')}
+        WHERE rowid = new.venta_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA}_item_update AFTER UPDATE OF observaciones ON venta_items BEGIN
+        UPDATE {TABLA} SET observaciones = {_OBSERVACIONES_VENTA.format(venta='new.venta_id')}
+        WHERE rowid = new.venta_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA}_item_delete AFTER DELETE ON venta_items
+    WHEN COALESCE(old.observaciones, '') <> '' BEGIN
+        UPDATE {TABLA} SET observaciones = {_OBSERVACIONES_VENTA.format(venta='old.venta_id')}
+        WHERE rowid = old.venta_id;
+    END
+    """
+]
+
+
+class BusquedaVentas:
+    """Índice FTS5 de ventas por cliente, mesa y observaciones."""
+
+    disponible = False  # Se activa si crear_indice pudo crear la tabla FTS5
+
+    @staticmethod
+    def crear_indice():
+        """
+        Crea la tabla y los triggers si no existen y carga las ventas existentes
+        cuando la tabla está vacía (con commit). Se llama al iniciar la aplicación.
+
+        Returns:
+            bool: si la búsqueda FTS5 está disponible
+        """
+        try:
+            for sentencia in _DDL:
+                db.session.execute(text(sentencia))
+
+            vacia = db.session.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {TABLA})")).scalar()
+            if vacia:
+                db.session.execute(text(f"""
+                    INSERT INTO {TABLA} (rowid, cliente_nombre, numero_mesa, observaciones)
+                    SELECT v.id, COALESCE(v.cliente_nombre, ''), COALESCE(v.numero_mesa, ''),
+                           {_OBSERVACIONES_VENTA.format(venta='v.id')}
+                    FROM ventas v
+                """))
+            db.session.commit()
+            BusquedaVentas.disponible = True
+        except exc.OperationalError as e:
+            db.session.rollback()
+            print(f"⚠ Búsqueda de ventas sin FTS5, se usará ILIKE: {e}")
+            BusquedaVentas.disponible = False
+
+        return BusquedaVentas.disponible
+
+    @staticmethod
+    def consulta_fts(texto, columna=None):
+        """
+        Convierte el texto del buscador en una consulta FTS5: cada palabra es un
+        prefijo y todas deben aparecer.
+
+        Args:
+            texto: texto libre
+            columna: 'cliente_nombre' | 'numero_mesa' | 'observaciones' para
+                buscar solo en esa columna
+
+        Returns:
+            str o None si el texto no tiene palabras
+        """
+        palabras = re.findall(r'\w+', texto or '')
+        if not palabras:
+            return None
+        prefijos = ' AND '.join(f'"{palabra}"*' for palabra in palabras)
+        return f'{columna} : ({prefijos})' if columna else prefijos
+
+    @staticmethod
+    def filtro(columna_venta_id, texto, columna=None):
+        """
+        Condición 'venta_id IN (ventas que coinciden)' para agregar a una consulta.
+
+        Returns:
+            ClauseElement o None si el texto no tiene palabras
+        """
+        consulta = BusquedaVentas.consulta_fts(texto, columna)
+        if consulta is None:
+            return None
+        return columna_venta_id.in_(
+            # Parámetro único: q y cliente pueden filtrar la misma consulta
+            text(f"SELECT rowid FROM {TABLA} WHERE {TABLA} MATCH :consulta_fts").bindparams(
+                bindparam('consulta_fts', consulta, unique=True)
+            ).columns(column('rowid', Integer))
+        )
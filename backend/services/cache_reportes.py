@@ -0,0 +1,151 @@
+"""
+Caché en memoria de reportes de períodos cerrados.
+
+Los reportes de días pasados solo cambian si se anula una venta o se registra
+una venta con fecha atrasada, así que se guardan por (reporte, usuario,
+desde, hasta) y se sirven desde memoria. Los rangos que incluyen el día de
+hoy (UTC, como los buckets de los resúmenes) siempre se calculan.
+
+Toda escritura a los resúmenes de ventas marca los pares (usuario, día) que
+toca y solo se descartan los reportes de ese usuario cuyo rango incluye
+alguno de esos días. El tamaño total se limita a MAX_BYTES (estimado como el
+largo del JSON del resultado) y se desalojan las entradas menos usadas.
+
+La caché es por proceso: con varios procesos, cada uno solo ve las
+invalidaciones de las escrituras que hizo.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, Producto, Receta
+
+
+class CacheReportes:
+    """Caché LRU de resultados de reportes con límite de memoria."""
+
+    MAX_BYTES = int(os.getenv('REPORTES_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+    _entradas = OrderedDict()  # (reporte, usuario_id, desde, hasta) -> (resultado, bytes)
+    _bytes = 0
+    _generacion = 0  # Se incrementa en cada invalidación
+    _lock = threading.Lock()
+
+    @staticmethod
+    def obtener(reporte, usuario_id, desde, hasta, calcular):
+        """
+        Devuelve el reporte desde la caché o lo calcula.
+
+        Args:
+            reporte: nombre del reporte ('por-hora', 'por-dia', 'detallado', ...)
+            usuario_id: int
+            desde, hasta: date - rango de días, ambos incluidos
+            calcular: función sin argumentos que genera el reporte
+
+        Returns:
+            resultado de calcular() (el mismo objeto en cada acierto: no modificarlo)
+        """
+        if hasta >= datetime.utcnow().date():
+            return calcular()
+
+        clave = (reporte, usuario_id, desde, hasta)
+        with CacheReportes._lock:
+            entrada = CacheReportes._entradas.get(clave)
+            if entrada is not None:
+                CacheReportes._entradas.move_to_end(clave)
+                return entrada[0]
+            generacion = CacheReportes._generacion
+
+        resultado = calcular()
+        tamano = len(json.dumps(resultado, default=str))
+        if tamano > CacheReportes.MAX_BYTES:
+            return resultado
+
+        with CacheReportes._lock:
+            # Una invalidación durante el cálculo pudo dejarlo desactualizado
+            if generacion != CacheReportes._generacion or clave in CacheReportes._entradas:
+                return resultado
+            CacheReportes._entradas[clave] = (resultado, tamano)
+            CacheReportes._bytes += tamano
+            while CacheReportes._bytes > CacheReportes.MAX_BYTES:
+                _, (_, liberado) = CacheReportes._entradas.popitem(last=False)
+                CacheReportes._bytes -= liberado
+
+        return resultado
+
+    @staticmethod
+    def invalidar(pares):
+        """
+        Descarta los reportes que incluyen alguno de los días indicados.
+
+        Args:
+            pares: iterable de (usuario_id, date)
+        """
+        dias_por_usuario = {}
+        for usuario_id, dia in pares:
+            dias_por_usuario.setdefault(usuario_id, set()).add(dia)
+
+        with CacheReportes._lock:
+            CacheReportes._generacion += 1
+            for clave in list(CacheReportes._entradas):
+                _, usuario_id, desde, hasta = clave
+                if any(desde <= dia <= hasta for dia in dias_por_usuario.get(usuario_id, ())):
+                    _, liberado = CacheReportes._entradas.pop(clave)
+                    CacheReportes._bytes -= liberado
+
+    @staticmethod
+    def limpiar():
+        """Descarta toda la caché"""
+        with CacheReportes._lock:
+            CacheReportes._generacion += 1
+            CacheReportes._entradas.clear()
+            CacheReportes._bytes = 0
+
+    @staticmethod
+    def marcar(pares):
+        """
+        Invalida en la transacción en curso los días que una escritura modifica;
+        se repite después del commit.
+
+        Args:
+            pares: iterable de (usuario_id, date)
+        """
+        pares = set(pares)
+        if not pares:
+            return
+        CacheReportes.invalidar(pares)
+        db.session.info.setdefault('reportes_invalidar', set()).update(pares)
+
+
+# ============= INVALIDACIÓN AUTOMÁTICA =============
+
+def _marcar_renombrado(mapper, connection, target):
+    # Los reportes muestran el nombre actual de productos y recetas
+    if inspect(target).attrs.nombre.history.has_changes():
+        CacheReportes.limpiar()
+        Session.object_session(target).info['reportes_limpiar'] = True
+
+
+def _invalidar_tras_commit(session):
+    # Se repite tras el commit por si otra petición recalculó con datos previos al commit
+    pares = session.info.pop('reportes_invalidar', None)
+    if pares:
+        CacheReportes.invalidar(pares)
+    if session.info.pop('reportes_limpiar', None):
+        CacheReportes.limpiar()
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop('reportes_invalidar', None)
+    session.info.pop('reportes_limpiar', None)
+
+
+for _modelo in (Producto, Receta):
+    event.listen(_modelo, 'after_update', _marcar_renombrado)
+event.listen(Session, 'after_commit', _invalidar_tras_commit)
+event.listen(Session, 'after_rollback', _descartar_tras_rollback)
@@ -0,0 +1,187 @@
+"""
+Feed de comandas para las pantallas de cocina (Server-Sent Events).
+
+Cada comanda creada, marcada como impresa o cuya venta se anula deja una fila
+en comanda_eventos dentro de la misma transacción. El id de esa fila es el
+cursor que la pantalla envía como Last-Event-ID al reconectarse, así recibe
+solo lo que se perdió.
+
+Las conexiones abiertas esperan sobre una condición que se despierta después
+de cada commit que registró eventos; mientras no haya novedades no consultan
+la base (salvo un latido cada INTERVALO_LATIDO segundos).
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from models import db, Comanda, ComandaEvento
+
+
+class FeedComandas:
+    """Registro de eventos de comandas y transmisión SSE."""
+
+    INTERVALO_LATIDO = 15  # Segundos entre latidos para mantener viva la conexión
+    LIMITE_LOTE = 100  # Eventos por consulta al ponerse al día
+    HORAS_PENDIENTES = 24  # Antigüedad máxima de las comandas pendientes al conectarse
+
+    _condicion = threading.Condition()
+    _version = 0  # Se incrementa con cada commit que registró eventos
+
+    @staticmethod
+    def registrar(connection, comandas, evento):
+        """
+        Inserta eventos usando la conexión de la transacción en curso.
+
+        Args:
+            connection: Connection de la transacción (p. ej. la del flush)
+            comandas: iterable de (comanda_id, venta_id, tipo_comanda)
+            evento: 'creada' | 'impresa' | 'anulada'
+        """
+        ahora = datetime.utcnow()
+        filas = [
+            {
+                'comanda_id': comanda_id,
+                'venta_id': venta_id,
+                'tipo_comanda': tipo_comanda,
+                'evento': evento,
+                'created_at': ahora
+            }
+            for comanda_id, venta_id, tipo_comanda in comandas
+        ]
+        if filas:
+            connection.execute(ComandaEvento.__table__.insert(), filas)
+
+    @staticmethod
+    def registrar_anulacion(venta_ids):
+        """Registra en la transacción en curso que las ventas de estas comandas se anularon."""
+        comandas = db.session.query(
+            Comanda.id, Comanda.venta_id, Comanda.tipo_comanda
+        ).filter(Comanda.venta_id.in_(venta_ids)).order_by(Comanda.id).all()
+        if comandas:
+            FeedComandas.registrar(db.session.connection(), comandas, 'anulada')
+            db.session.info['feed_comandas'] = True
+
+    @staticmethod
+    def notificar():
+        """Despierta a todas las conexiones abiertas."""
+        with FeedComandas._condicion:
+            FeedComandas._version += 1
+            FeedComandas._condicion.notify_all()
+
+    @staticmethod
+    def cursor_inicial(tipo_comanda):
+        """
+        Cursor para una pantalla que se conecta sin Last-Event-ID: justo antes
+        de la comanda pendiente (no impresa) más antigua, o el último evento si
+        no hay pendientes.
+        """
+        desde = datetime.utcnow() - timedelta(hours=FeedComandas.HORAS_PENDIENTES)
+        primer_pendiente = db.session.query(func.min(ComandaEvento.id)).join(
+            Comanda, Comanda.id == ComandaEvento.comanda_id
+        ).filter(
+            ComandaEvento.tipo_comanda == tipo_comanda,
+            ComandaEvento.evento == 'creada',
+            ComandaEvento.created_at >= desde,
+            Comanda.impresa == False
+        ).scalar()
+
+        if primer_pendiente:
+            return primer_pendiente - 1
+        return db.session.query(func.max(ComandaEvento.id)).scalar() or 0
+
+    @staticmethod
+    def eventos_desde(cursor, tipo_comanda, limite=None):
+        """
+        Eventos posteriores al cursor, en orden.
+
+        Returns:
+            list[dict]
+        """
+        filas = db.session.query(ComandaEvento, Comanda).join(
+            Comanda, Comanda.id == ComandaEvento.comanda_id
+        ).filter(
+            ComandaEvento.id > cursor,
+            ComandaEvento.tipo_comanda == tipo_comanda
+        ).order_by(ComandaEvento.id).limit(limite or FeedComandas.LIMITE_LOTE).all()
+
+        eventos = []
+        for evento, comanda in filas:
+            datos = {
+                'evento_id': evento.id,
+                'evento': evento.evento,
+                'comanda_id': comanda.id,
+                'venta_id': comanda.venta_id,
+                'tipo': comanda.tipo_comanda,
+                'impresa': comanda.impresa,
+                'fecha_impresion': comanda.fecha_impresion.isoformat() if comanda.fecha_impresion else None,
+                'created_at': evento.created_at.isoformat()
+            }
+            if evento.evento == 'creada':
+                datos['html'] = comanda.contenido_html
+                datos['texto'] = comanda.contenido_texto
+            eventos.append(datos)
+        return eventos
+
+    @staticmethod
+    def transmitir(cursor, tipo_comanda):
+        """
+        Generador del stream SSE. Debe consumirse dentro de un contexto de
+        aplicación (stream_with_context).
+
+        Args:
+            cursor: int - último evento que ya recibió la pantalla
+            tipo_comanda: 'cocina' | 'caja'
+        """
+        yield 'retry: 3000\n\n'
+
+        while True:
+            version = FeedComandas._version
+            eventos = FeedComandas.eventos_desde(cursor, tipo_comanda)
+            # No retener la conexión a la base mientras se espera
+            db.session.close()
+
+            for datos in eventos:
+                cursor = datos['evento_id']
+                yield f"id: {cursor}\nevent: {datos['evento']}\ndata: {json.dumps(datos)}\n\n"
+
+            if len(eventos) == FeedComandas.LIMITE_LOTE:
+                continue  # Aún se está poniendo al día
+
+            with FeedComandas._condicion:
+                hubo_cambios = FeedComandas._condicion.wait_for(
+                    lambda: FeedComandas._version != version,
+                    timeout=FeedComandas.INTERVALO_LATIDO
+                )
+            if not hubo_cambios:
+                yield ': latido\n\n'
+
+
+# ============= REGISTRO AUTOMÁTICO =============
+
+def _comanda_creada(mapper, connection, target):
+    FeedComandas.registrar(connection, [(target.id, target.venta_id, target.tipo_comanda)], 'creada')
+    Session.object_session(target).info['feed_comandas'] = True
+
+
+def _comanda_actualizada(mapper, connection, target):
+    if target.impresa and inspect(target).attrs.impresa.history.has_changes():
+        FeedComandas.registrar(connection, [(target.id, target.venta_id, target.tipo_comanda)], 'impresa')
+        Session.object_session(target).info['feed_comandas'] = True
+
+
+def _notificar_tras_commit(session):
+    if session.info.pop('feed_comandas', None):
+        FeedComandas.notificar()
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop('feed_comandas', None)
+
+
+event.listen(Comanda, 'after_insert', _comanda_creada)
+event.listen(Comanda, 'after_update', _comanda_actualizada)
+event.listen(Session, 'after_commit', _notificar_tras_commit)
+event.listen(Session, 'after_rollback', _descartar_tras_rollback)
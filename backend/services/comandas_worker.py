@@ -0,0 +1,71 @@
+"""
+Generación de comandas en segundo plano.
+
+La venta responde apenas queda guardada; las comandas de cocina y caja se
+generan después en un hilo de fondo. Si alguien las pide antes de que el
+hilo termine, GET /api/ventas/<id>/comanda/<tipo> las genera en el momento.
+"""
+import queue
+import threading
+import traceback
+
+from flask import current_app
+
+from models import db
+
+
+class GeneradorComandas:
+    """Cola y worker de generación de comandas."""
+
+    _cola = queue.Queue()
+    _hilo = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def encolar(venta_id):
+        """
+        Agenda la generación de las comandas de una venta.
+
+        Debe llamarse dentro de un contexto de aplicación (p. ej. una petición).
+
+        Args:
+            venta_id: int - ID de la venta ya confirmada
+        """
+        app = current_app._get_current_object()
+        GeneradorComandas._iniciar()
+        GeneradorComandas._cola.put((app, venta_id))
+
+    @staticmethod
+    def esperar():
+        """Bloquea hasta que la cola quede vacía (útil en scripts y pruebas)."""
+        GeneradorComandas._cola.join()
+
+    @staticmethod
+    def _iniciar():
+        with GeneradorComandas._lock:
+            if GeneradorComandas._hilo is None or not GeneradorComandas._hilo.is_alive():
+                GeneradorComandas._hilo = threading.Thread(
+                    target=GeneradorComandas._procesar,
+                    name='generador-comandas',
+                    daemon=True
+                )
+                GeneradorComandas._hilo.start()
+
+    @staticmethod
+    def _procesar():
+        from services.ventas_service_avanzado import VentasServiceAvanzado
+
+        while True:
+            app, venta_id = GeneradorComandas._cola.get()
+            try:
+                with app.app_context():
+                    try:
+                        VentasServiceAvanzado.generar_comandas_venta(venta_id)
+                    finally:
+                        db.session.remove()
+            except Exception:
+                # La comanda se generará al consultarla
+                print(f"Error generando comandas de venta {venta_id}:")
+                print(traceback.format_exc())
+            finally:
+                GeneradorComandas._cola.task_done()
@@ -0,0 +1,466 @@
+"""
+Plantillas de comprobantes (comanda de cocina, recibo de caja y voucher).
+
+Las plantillas Jinja2 se compilan una sola vez al importar el módulo y se
+renderizan a partir de una vista compacta de la venta (VistaVenta), que se
+arma una vez y sirve para todos los comprobantes de esa venta.
+
+Las comandas también se generan como bytes ESC/POS para enviarlas tal cual a
+la impresora térmica, sin transcodificar el texto con recuadros y emoji.
+"""
+from collections import namedtuple
+
+from jinja2 import Environment
+from sqlalchemy.orm import selectinload
+
+from models import Venta, VentaItem, VentaItemConsumo
+
+
+VistaVenta = namedtuple('VistaVenta', [
+    'id', 'fecha', 'hora', 'cajero', 'cliente', 'mesa', 'items',
+    'subtotal', 'descuento', 'iva', 'propina', 'total'
+])
+VistaItem = namedtuple('VistaItem', [
+    'nombre', 'cantidad', 'precio_unitario', 'subtotal', 'observaciones', 'es_receta', 'ingredientes'
+])
+VistaIngrediente = namedtuple('VistaIngrediente', ['nombre', 'cantidad', 'unidad'])
+
+
+# Sin autoescape global: solo los textos ingresados por usuarios pasan por |e,
+# los números no necesitan escaparse
+_entorno_html = Environment(autoescape=False, trim_blocks=True, lstrip_blocks=True)
+_entorno_texto = Environment(autoescape=False, trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=True)
+
+
+# ============= COMANDA COCINA =============
+
+_COCINA_HTML = _entorno_html.from_string("""\
+<div style="font-family: monospace; max-width: 400px; padding: 10px;">
+    <h2 style="text-align: center; margin: 5px 0;">👨‍🍳 COMANDA COCINA</h2>
+    <hr style="margin: 5px 0;">
+    <p><strong>Orden:</strong> #{{ v.id }}</p>
+    <p><strong>Hora:</strong> {{ v.hora }}</p>
+    <p><strong>Mesa:</strong> {{ (v.mesa or 'N/A')|e }}</p>
+    <hr style="margin: 5px 0;">
+    <h3 style="margin: 10px 0; border-bottom: 2px solid black;">PRODUCTOS</h3>
+{% for item in v.items %}
+{% if item.es_receta %}
+    <div style="margin: 10px 0; padding: 8px; border: 1px solid #ccc; background: #fffacd;">
+        <strong style="font-size: 1.2em;">🍽️ {{ item.nombre|e }}</strong><br>
+        <span style="color: red; font-size: 1.5em; font-weight: bold;">x{{ item.cantidad }}</span>
+{% for ing in item.ingredientes %}
+        <br><small>• {{ ing.cantidad }}{{ ing.unidad|e }} de {{ ing.nombre|e }}</small>
+{% endfor %}
+{% if item.observaciones %}
+        <br><em style="color: red;">⚠️ {{ item.observaciones|e }}</em>
+{% endif %}
+    </div>
+{% else %}
+    <div style="margin: 8px 0; padding: 5px; border-bottom: 1px dotted #ccc;">
+        <strong>{{ item.nombre|e }}</strong> x{{ item.cantidad }}
+{% if item.observaciones %}
+        <br><small style="color: red;">⚠️ {{ item.observaciones|e }}</small>
+{% endif %}
+    </div>
+{% endif %}
+{% endfor %}
+    <hr style="margin: 10px 0;">
+    <p style="text-align: center; font-size: 0.9em; margin-top: 20px;">
+        <strong>Marque cuando esté listo</strong><br>
+        __ Cocina __ QA
+    </p>
+</div>
+""")
+
+_COCINA_TEXTO = _entorno_texto.from_string("""\
+╔════════════════════════════════════╗
+║      👨‍🍳 COMANDA COCINA           ║
+╠════════════════════════════════════╣
+Orden: #{{ v.id }}
+Hora: {{ v.hora }}
+Mesa: {{ v.mesa or 'N/A' }}
+╠════════════════════════════════════╣
+{% for item in v.items %}
+{% if item.es_receta %}
+
+🍽️  {{ item.nombre }} x{{ item.cantidad }}
+{% for ing in item.ingredientes %}
+   → {{ ing.cantidad }}{{ ing.unidad }} {{ ing.nombre }}
+{% endfor %}
+{% if item.observaciones %}
+   ⚠️  NOTA: {{ item.observaciones }}
+{% endif %}
+{% else %}
+
+📦 {{ item.nombre }} x{{ item.cantidad }}
+{% if item.observaciones %}
+   ⚠️  {{ item.observaciones }}
+{% endif %}
+{% endif %}
+{% endfor %}
+╠════════════════════════════════════╣
+         ☐ Marca cuando esté listo
+╚════════════════════════════════════╝
+""")
+
+
+# ============= RECIBO CAJA =============
+
+_CAJA_HTML = _entorno_html.from_string("""\
+<div style="font-family: monospace; max-width: 400px; padding: 15px; background: white;">
+    <div style="text-align: center; margin-bottom: 15px;">
+        <h2 style="margin: 5px 0;">🧾 RECIBO DE VENTA</h2>
+        <p style="font-size: 0.9em; color: #666;">Carbon & Cheddar</p>
+    </div>
+    <hr style="margin: 10px 0;">
+    <table style="width: 100%; font-size: 0.95em;">
+        <tr><td><strong>Recibo #:</strong></td><td style="text-align: right;">{{ v.id }}</td></tr>
+        <tr><td><strong>Fecha:</strong></td><td style="text-align: right;">{{ v.fecha }}</td></tr>
+        <tr><td><strong>Hora:</strong></td><td style="text-align: right;">{{ v.hora }}</td></tr>
+        <tr><td><strong>Cajero:</strong></td><td style="text-align: right;">{{ v.cajero|e }}</td></tr>
+{% if v.cliente %}
+        <tr><td><strong>Cliente:</strong></td><td style="text-align: right;">{{ v.cliente|e }}</td></tr>
+{% endif %}
+{% if v.mesa %}
+        <tr><td><strong>Mesa:</strong></td><td style="text-align: right;">{{ v.mesa|e }}</td></tr>
+{% endif %}
+    </table>
+    <hr style="margin: 10px 0;">
+    <h4 style="margin: 10px 0;">DETALLES</h4>
+{% for item in v.items %}
+    <div style="display: flex; justify-content: space-between; padding: 5px 0; border-bottom: 1px dotted #ddd;">
+        <span>{{ item.nombre|e }} x{{ item.cantidad }}</span>
+        <strong>${{ '%.2f'|format(item.subtotal) }}</strong>
+    </div>
+{% endfor %}
+    <hr style="margin: 10px 0; font-weight: bold;">
+    <div style="display: flex; justify-content: space-between; padding: 5px 0;">
+        <span>Subtotal:</span>
+        <strong>${{ '%.2f'|format(v.subtotal) }}</strong>
+    </div>
+{% if v.descuento > 0 %}
+    <div style="display: flex; justify-content: space-between; padding: 5px 0; color: green;">
+        <span>Descuento:</span>
+        <strong>-${{ '%.2f'|format(v.descuento) }}</strong>
+    </div>
+{% endif %}
+    <div style="display: flex; justify-content: space-between; padding: 5px 0;">
+        <span>IVA (19%):</span>
+        <strong>${{ '%.2f'|format(v.iva) }}</strong>
+    </div>
+    <div style="display: flex; justify-content: space-between; padding: 5px 0;">
+        <span>Propina (10%):</span>
+        <strong>${{ '%.2f'|format(v.propina) }}</strong>
+    </div>
+    <hr style="margin: 10px 0; border: 2px solid black;">
+    <div style="display: flex; justify-content: space-between; padding: 10px 0; font-size: 1.3em; font-weight: bold;">
+        <span>TOTAL:</span>
+        <span>${{ '%.2f'|format(v.total) }}</span>
+    </div>
+    <hr style="margin: 10px 0;">
+    <div style="text-align: center; font-size: 0.85em; color: #666;">
+        <p>¡Gracias por su compra!</p>
+        <p>Vuelva pronto</p>
+    </div>
+</div>
+""")
+
+_CAJA_TEXTO = _entorno_texto.from_string("""\
+╔════════════════════════════════════╗
+║      🧾 RECIBO DE VENTA           ║
+║      Carbon & Cheddar             ║
+╠════════════════════════════════════╣
+Recibo #: {{ v.id }}
+Fecha: {{ v.fecha }}
+Hora: {{ v.hora }}
+Cajero: {{ v.cajero }}
+{% if v.cliente %}
+Cliente: {{ v.cliente }}
+{% endif %}
+{% if v.mesa %}
+Mesa: {{ v.mesa }}
+{% endif %}
+╠════════════════════════════════════╣
+{% for item in v.items %}
+{{ '%s x%-25s$%8.2f'|format(item.nombre, item.cantidad, item.subtotal) }}
+{% endfor %}
+
+{{ '%-35s$%8.2f'|format('SUBTOTAL:', v.subtotal) }}
+{% if v.descuento > 0 %}
+{{ '%-35s-$%8.2f'|format('DESCUENTO:', v.descuento) }}
+{% endif %}
+{{ '%-35s$%8.2f'|format('IVA (19%):', v.iva) }}
+{{ '%-35s$%8.2f'|format('PROPINA (10%):', v.propina) }}
+╠════════════════════════════════════╣
+{{ '%-35s$%8.2f'|format('TOTAL:', v.total) }}
+╠════════════════════════════════════╣
+        ¡Gracias por su compra!
+        Vuelva pronto
+╚════════════════════════════════════╝
+""")
+
+
+# ============= VOUCHER (página imprimible) =============
+
+_VOUCHER_HTML = _entorno_html.from_string("""\
+<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Voucher</title>
+    <style>
+        body { font-family: 'Courier New', monospace; margin: 0 auto; padding: 10px; background: white; width: 80mm; }
+        .voucher { text-align: center; border: 1px dashed #333; padding: 15px; }
+        .header { font-size: 18px; font-weight: bold; margin-bottom: 10px; }
+        .separator { border-top: 1px dashed #333; margin: 10px 0; }
+        .item { text-align: left; margin: 5px 0; font-size: 12px; }
+        .obs { font-size: 11px; color: #666; margin-left: 10px; text-align: left; }
+        .datos { text-align: left; font-size: 12px; }
+        .row { display: flex; justify-content: space-between; font-size: 12px; text-align: left; }
+        .tipo { font-weight: bold; color: red; font-size: 14px; margin: 10px 0; }
+        .total { font-weight: bold; font-size: 16px; margin-top: 10px; }
+        @media print {
+            body { margin: 0; padding: 0; }
+            .voucher { border: none; }
+        }
+    </style>
+</head>
+<body>
+    <div class="voucher">
+        <div class="header">🍔 CARBON & CHEDDAR</div>
+        <div class="separator"></div>
+        <div class="tipo">{{ 'COPIA COCINA' if tipo == 'cocina' else 'COPIA CLIENTE' }}</div>
+        <div class="separator"></div>
+        <div class="datos">
+            <strong>Orden #{{ v.id }}</strong><br>
+            Hora: {{ v.hora }}<br>
+            Cajero: {{ v.cajero|e }}
+        </div>
+{% if v.mesa %}
+        <div class="datos" style="margin-top: 5px;"><strong>Mesa:</strong> {{ v.mesa|e }}</div>
+{% endif %}
+{% if v.cliente %}
+        <div class="datos"><strong>Cliente:</strong> {{ v.cliente|e }}</div>
+{% endif %}
+        <div class="separator"></div>
+{% for item in v.items %}
+        <div class="item">
+            <strong>{{ item.nombre|e }}</strong><br>
+            {{ item.cantidad }} x ${{ '%.2f'|format(item.precio_unitario) }} = ${{ '%.2f'|format(item.subtotal) }}
+        </div>
+{% if item.observaciones %}
+        <div class="obs">* {{ item.observaciones|e }}</div>
+{% endif %}
+{% endfor %}
+        <div class="separator"></div>
+        <div class="row"><span>Subtotal:</span><span>${{ '%.2f'|format(v.subtotal) }}</span></div>
+{% if v.descuento > 0 %}
+        <div class="row"><span>Descuento:</span><span>-${{ '%.2f'|format(v.descuento) }}</span></div>
+{% endif %}
+        <div class="row"><span>IVA (19%):</span><span>${{ '%.2f'|format(v.iva) }}</span></div>
+        <div class="row"><span>Propina (10%):</span><span>${{ '%.2f'|format(v.propina) }}</span></div>
+        <div class="separator"></div>
+        <div class="row total"><span>TOTAL:</span><span>${{ '%.2f'|format(v.total) }}</span></div>
+        <div class="separator"></div>
+        <div style="font-size: 11px; margin-top: 10px;">¡GRACIAS POR SU COMPRA!</div>
+    </div>
+    <script>
+        window.print();
+    </script>
+</body>
+</html>
+""")
+
+
+# ============= ESC/POS (impresora térmica) =============
+
+# Comandos de impresora; la página de códigos CP858 (ESC t 19) cubre tildes,
+# ñ y símbolos de moneda. Lo que no exista en ella (emoji) se imprime como '?'.
+ESCPOS_CODEC = 'cp858'
+ESCPOS_ANCHO = 48  # Columnas con fuente A en papel de 80 mm
+
+_INICIAR = b'\x1b@'
+_PAGINA_CODIGOS = b'\x1bt\x13'
+_NEGRITA = b'\x1bE\x01'
+_SIN_NEGRITA = b'\x1bE\x00'
+_ALINEAR_IZQ = b'\x1ba\x00'
+_ALINEAR_CENTRO = b'\x1ba\x01'
+_TAMANO_NORMAL = b'\x1d!\x00'
+_DOBLE_ALTO = b'\x1d!\x01'
+_DOBLE_ALTO_ANCHO = b'\x1d!\x11'
+_CORTE = b'\x1dVB\x03'  # Avanza 3 líneas y corta parcial
+_SEPARADOR = b'-' * ESCPOS_ANCHO + b'\n'
+
+
+def _linea(texto):
+    return texto.encode(ESCPOS_CODEC, 'replace') + b'\n'
+
+
+def _columnas(izquierda, derecha):
+    # El texto de la izquierda se recorta para que el monto no salte de línea
+    izquierda = izquierda[:ESCPOS_ANCHO - len(derecha) - 1]
+    return _linea(izquierda.ljust(ESCPOS_ANCHO - len(derecha)) + derecha)
+
+
+def _escpos_cocina(v):
+    partes = [
+        _INICIAR, _PAGINA_CODIGOS,
+        _ALINEAR_CENTRO, _DOBLE_ALTO_ANCHO, _NEGRITA, _linea('COMANDA COCINA'),
+        _TAMANO_NORMAL, _SIN_NEGRITA, _ALINEAR_IZQ, _SEPARADOR,
+        _DOBLE_ALTO, _linea(f"Orden #{v.id}   Mesa {v.mesa or 'N/A'}"), _TAMANO_NORMAL,
+        _linea(f"Hora: {v.hora}"),
+        _SEPARADOR,
+    ]
+    for item in v.items:
+        partes += [_DOBLE_ALTO, _NEGRITA, _linea(f"{item.cantidad} x {item.nombre}"), _SIN_NEGRITA, _TAMANO_NORMAL]
+        for ing in item.ingredientes:
+            partes.append(_linea(f"   {ing.cantidad}{ing.unidad} {ing.nombre}"))
+        if item.observaciones:
+            partes += [_NEGRITA, _linea(f"   NOTA: {item.observaciones}"), _SIN_NEGRITA]
+    partes += [_SEPARADOR, _ALINEAR_CENTRO, _linea('[ ] Listo'), _CORTE]
+    return b''.join(partes)
+
+
+def _escpos_caja(v):
+    partes = [
+        _INICIAR, _PAGINA_CODIGOS,
+        _ALINEAR_CENTRO, _DOBLE_ALTO, _NEGRITA, _linea('RECIBO DE VENTA'),
+        _TAMANO_NORMAL, _SIN_NEGRITA, _linea('Carbon & Cheddar'),
+        _ALINEAR_IZQ, _SEPARADOR,
+        _columnas('Recibo #:', str(v.id)),
+        _columnas('Fecha:', f"{v.fecha} {v.hora}"),
+        _columnas('Cajero:', v.cajero),
+    ]
+    if v.cliente:
+        partes.append(_columnas('Cliente:', v.cliente))
+    if v.mesa:
+        partes.append(_columnas('Mesa:', v.mesa))
+    partes.append(_SEPARADOR)
+    for item in v.items:
+        partes.append(_columnas(f"{item.cantidad} x {item.nombre}", f"${item.subtotal:.2f}"))
+    partes += [_SEPARADOR, _columnas('Subtotal:', f"${v.subtotal:.2f}")]
+    if v.descuento > 0:
+        partes.append(_columnas('Descuento:', f"-${v.descuento:.2f}"))
+    partes += [
+        _columnas('IVA (19%):', f"${v.iva:.2f}"),
+        _columnas('Propina (10%):', f"${v.propina:.2f}"),
+        _SEPARADOR,
+        _DOBLE_ALTO, _NEGRITA, _columnas('TOTAL:', f"${v.total:.2f}"), _SIN_NEGRITA, _TAMANO_NORMAL,
+        _SEPARADOR,
+        _ALINEAR_CENTRO, _linea('¡Gracias por su compra!'), _linea('Vuelva pronto'),
+        _CORTE,
+    ]
+    return b''.join(partes)
+
+
+class PlantillasComprobantes:
+    """Renderizado de comprobantes a partir de plantillas precompiladas."""
+
+    @staticmethod
+    def vista_venta(venta):
+        """
+        Arma la vista compacta de una venta para las plantillas.
+
+        Conviene cargar la venta con opciones_carga() para no disparar
+        consultas por item.
+
+        Args:
+            venta: Venta
+
+        Returns:
+            VistaVenta
+        """
+        items = []
+        for item in venta.items:
+            if item.es_receta:
+                nombre = item.receta.nombre if item.receta else f"Receta #{item.receta_id}"
+                ingredientes = PlantillasComprobantes._ingredientes_item(item)
+            else:
+                nombre = item.producto.nombre if item.producto else f"Producto #{item.producto_id}"
+                ingredientes = ()
+
+            items.append(VistaItem(
+                nombre=nombre,
+                cantidad=item.cantidad,
+                precio_unitario=item.precio_unitario or 0,
+                subtotal=item.subtotal or 0,
+                observaciones=item.observaciones or '',
+                es_receta=bool(item.es_receta),
+                ingredientes=ingredientes
+            ))
+
+        return VistaVenta(
+            id=venta.id,
+            fecha=venta.created_at.strftime('%d/%m/%Y'),
+            hora=venta.created_at.strftime('%H:%M:%S'),
+            cajero=venta.usuario or 'Sistema',
+            cliente=venta.cliente_nombre or '',
+            mesa=venta.numero_mesa or '',
+            items=tuple(items),
+            subtotal=venta.subtotal or 0,
+            descuento=venta.descuento or 0,
+            iva=venta.iva or 0,
+            propina=venta.propina or 0,
+            total=venta.total or 0
+        )
+
+    @staticmethod
+    def comanda_cocina(vista):
+        """Devuelve (html, texto) de la comanda de cocina."""
+        return _COCINA_HTML.render(v=vista), _COCINA_TEXTO.render(v=vista)
+
+    @staticmethod
+    def comanda_caja(vista):
+        """Devuelve (html, texto) del recibo de caja."""
+        return _CAJA_HTML.render(v=vista), _CAJA_TEXTO.render(v=vista)
+
+    @staticmethod
+    def escpos(vista, tipo_comanda):
+        """
+        Devuelve la comanda como secuencia de bytes ESC/POS lista para enviar
+        a la impresora térmica (negrita, doble alto, página de códigos y corte).
+
+        Args:
+            vista: VistaVenta
+            tipo_comanda: 'cocina' | 'caja'
+        """
+        if tipo_comanda == 'cocina':
+            return _escpos_cocina(vista)
+        return _escpos_caja(vista)
+
+    @staticmethod
+    def voucher(vista, tipo='cliente'):
+        """
+        Devuelve la página HTML imprimible del voucher.
+
+        Args:
+            vista: VistaVenta
+            tipo: 'cliente' | 'cocina'
+        """
+        return _VOUCHER_HTML.render(v=vista, tipo=tipo)
+
+    @staticmethod
+    def opciones_carga():
+        """
+        Opciones de carga para Venta que traen todo lo que usa vista_venta
+        (items, receta/producto y consumos con su ingrediente) en pocas consultas.
+        """
+        items = selectinload(Venta.items)
+        return (
+            items.selectinload(VentaItem.receta),
+            items.selectinload(VentaItem.producto),
+            items.selectinload(VentaItem.consumos).joinedload(VentaItemConsumo.ingrediente),
+        )
+
+    @staticmethod
+    def _ingredientes_item(item):
+        """Lista de ingredientes descontados por un item de receta."""
+        return tuple(
+            VistaIngrediente(
+                nombre=consumo.ingrediente.nombre if consumo.ingrediente else '',
+                cantidad=round(consumo.cantidad, 3),
+                unidad=consumo.ingrediente.unidad_medida if consumo.ingrediente else ''
+            )
+            for consumo in item.consumos
+        )
@@ -0,0 +1,210 @@
+"""
+Resumen del dashboard con contadores mantenidos.
+
+Los totales históricos (ventas no anuladas y su monto, productos, unidades en
+stock y valor del stock a precio de venta) viven en contadores_dashboard y se
+actualizan en la misma transacción que los cambia:
+
+- ventas y anulaciones, desde ResumenVentas (que ya agrupa cada escritura)
+- movimientos de stock de productos, desde LibroInventario.registrar
+- alta, baja y cambio de precio de productos, desde sus rutas
+
+Hoy y los últimos 7 días se leen de los resúmenes por día y por hora, así que
+el resumen lee un número de filas acotado sin importar el tamaño del historial.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, bindparam, case, select, literal
+
+from models import db, Venta, Producto, ContadorDashboard, ResumenVentasHora, ResumenVentasDia
+
+
+class ContadoresDashboard:
+    """Contadores históricos y resumen del dashboard."""
+
+    VENTAS_CANTIDAD = 'ventas_cantidad'
+    VENTAS_TOTAL = 'ventas_total'
+    PRODUCTOS_CANTIDAD = 'productos_cantidad'
+    PRODUCTOS_STOCK = 'productos_stock'
+    PRODUCTOS_VALOR_STOCK = 'productos_valor_stock'
+
+    CLAVES = (VENTAS_CANTIDAD, VENTAS_TOTAL, PRODUCTOS_CANTIDAD, PRODUCTOS_STOCK, PRODUCTOS_VALOR_STOCK)
+
+    @staticmethod
+    def sumar(deltas):
+        """
+        Suma variaciones a los contadores con un UPDATE executemany (sin commit).
+
+        Args:
+            deltas: dict {clave: variación}
+        """
+        filas = [{'b_clave': clave, 'delta': delta} for clave, delta in sorted(deltas.items()) if delta]
+        if not filas:
+            return
+        tabla = ContadorDashboard.__table__
+        db.session.execute(
+            tabla.update().where(tabla.c.clave == bindparam('b_clave')).values(
+                valor=tabla.c.valor + bindparam('delta')
+            ),
+            filas
+        )
+
+    @staticmethod
+    def registrar_stock_productos(cantidades):
+        """
+        Registra movimientos de stock de productos (sin commit). El valor se
+        calcula al precio actual de cada producto.
+
+        Args:
+            cantidades: dict {producto_id: variación de stock}
+        """
+        cantidades = {producto_id: cantidad for producto_id, cantidad in cantidades.items() if cantidad}
+        if not cantidades:
+            return
+        precios = dict(
+            db.session.query(Producto.id, Producto.precio).filter(Producto.id.in_(cantidades)).all()
+        )
+        ContadoresDashboard.sumar({
+            ContadoresDashboard.PRODUCTOS_STOCK: sum(cantidades.values()),
+            ContadoresDashboard.PRODUCTOS_VALOR_STOCK: sum(
+                cantidad * (precios.get(producto_id) or 0) for producto_id, cantidad in cantidades.items()
+            )
+        })
+
+    @staticmethod
+    def registrar_alta_producto():
+        """Cuenta un producto nuevo; su stock inicial llega como movimiento del libro"""
+        ContadoresDashboard.sumar({ContadoresDashboard.PRODUCTOS_CANTIDAD: 1})
+
+    @staticmethod
+    def _sumar_por_producto(producto_id, deltas):
+        """
+        Como sumar, pero cada variación es una expresión sobre la fila actual
+        del producto (stock y precio se leen en el mismo UPDATE, no del objeto
+        en memoria, que pudo quedar atrás de una venta concurrente).
+
+        Args:
+            deltas: dict {clave: función(columnas de productos) -> expresión}
+        """
+        productos = Producto.__table__
+        tabla = ContadorDashboard.__table__
+        variacion = case(
+            *(
+                (tabla.c.clave == clave, select(delta(productos.c)).where(
+                    productos.c.id == producto_id
+                ).scalar_subquery())
+                for clave, delta in deltas.items()
+            ),
+            else_=0
+        )
+        db.session.execute(
+            tabla.update().where(tabla.c.clave.in_(deltas)).values(
+                valor=tabla.c.valor + func.coalesce(variacion, 0)
+            )
+        )
+
+    @staticmethod
+    def registrar_baja_producto(producto_id):
+        """Descuenta un producto con su stock y su valor, antes de eliminarlo (sin commit)"""
+        ContadoresDashboard._sumar_por_producto(producto_id, {
+            ContadoresDashboard.PRODUCTOS_CANTIDAD: lambda c: literal(-1),
+            ContadoresDashboard.PRODUCTOS_STOCK: lambda c: -func.coalesce(c.stock, 0),
+            ContadoresDashboard.PRODUCTOS_VALOR_STOCK:
+                lambda c: -func.coalesce(c.stock, 0) * func.coalesce(c.precio, 0)
+        })
+
+    @staticmethod
+    def registrar_cambio_precio(producto_id, diferencia):
+        """Revaloriza el stock actual de un producto al cambiar su precio (sin commit)"""
+        if diferencia:
+            ContadoresDashboard._sumar_por_producto(producto_id, {
+                ContadoresDashboard.PRODUCTOS_VALOR_STOCK: lambda c: func.coalesce(c.stock, 0) * diferencia
+            })
+
+    @staticmethod
+    def recalcular():
+        """
+        Recalcula todos los contadores desde las tablas (con commit). Se usa al
+        iniciar la aplicación si faltan contadores.
+        """
+        ventas_cantidad, ventas_total = db.session.query(
+            func.count(Venta.id), func.coalesce(func.sum(Venta.total), 0)
+        ).filter(Venta.anulada.isnot(True)).one()
+        productos_cantidad, productos_stock, productos_valor = db.session.query(
+            func.count(Producto.id),
+            func.coalesce(func.sum(Producto.stock), 0),
+            func.coalesce(func.sum(Producto.stock * Producto.precio), 0)
+        ).one()
+
+        valores = {
+            ContadoresDashboard.VENTAS_CANTIDAD: ventas_cantidad,
+            ContadoresDashboard.VENTAS_TOTAL: ventas_total,
+            ContadoresDashboard.PRODUCTOS_CANTIDAD: productos_cantidad,
+            ContadoresDashboard.PRODUCTOS_STOCK: productos_stock,
+            ContadoresDashboard.PRODUCTOS_VALOR_STOCK: productos_valor
+        }
+        ContadorDashboard.query.delete()
+        db.session.execute(ContadorDashboard.__table__.insert(), [
+            {'clave': clave, 'valor': valor} for clave, valor in valores.items()
+        ])
+        db.session.commit()
+        return valores
+
+    @staticmethod
+    def inicializar():
+        """Crea los contadores si faltan (al iniciar la aplicación)"""
+        if ContadorDashboard.query.count() < len(ContadoresDashboard.CLAVES):
+            ContadoresDashboard.recalcular()
+            print("✓ Contadores del dashboard calculados")
+
+    @staticmethod
+    def resumen():
+        """
+        Resumen del dashboard: ventas de hoy, de los últimos 7 días e históricas
+        (no anuladas) e inventario de productos.
+
+        Returns:
+            dict {hoy, ultimos_7_dias, total, inventario}
+        """
+        ahora = datetime.utcnow()
+        contadores = dict(db.session.query(ContadorDashboard.clave, ContadorDashboard.valor).all())
+
+        ventas_hoy = db.session.query(
+            func.coalesce(func.sum(ResumenVentasDia.cantidad), 0),
+            func.coalesce(func.sum(ResumenVentasDia.ingresos), 0)
+        ).filter(
+            ResumenVentasDia.bucket == ahora.date(),
+            ResumenVentasDia.tipo_item == 'venta'
+        ).one()
+
+        # Por hora: la ventana móvil de 7 días empieza en la hora de hace 7 días
+        ventas_7_dias = db.session.query(
+            func.coalesce(func.sum(ResumenVentasHora.cantidad), 0),
+            func.coalesce(func.sum(ResumenVentasHora.ingresos), 0)
+        ).filter(
+            ResumenVentasHora.bucket >= (ahora - timedelta(days=7)).replace(minute=0, second=0, microsecond=0),
+            ResumenVentasHora.tipo_item == 'venta'
+        ).one()
+
+        def valor(clave):
+            return contadores.get(clave) or 0
+
+        return {
+            'hoy': {
+                'cantidad_ventas': int(ventas_hoy[0]),
+                'total': round(ventas_hoy[1], 2)
+            },
+            'ultimos_7_dias': {
+                'cantidad_ventas': int(ventas_7_dias[0]),
+                'total': round(ventas_7_dias[1], 2)
+            },
+            'total': {
+                'cantidad_ventas': int(valor(ContadoresDashboard.VENTAS_CANTIDAD)),
+                'total': round(valor(ContadoresDashboard.VENTAS_TOTAL), 2)
+            },
+            'inventario': {
+                'cantidad_productos': int(valor(ContadoresDashboard.PRODUCTOS_CANTIDAD)),
+                'stock_total': int(valor(ContadoresDashboard.PRODUCTOS_STOCK)),
+                'valor_stock': round(valor(ContadoresDashboard.PRODUCTOS_VALOR_STOCK), 2)
+            }
+        }
@@ -0,0 +1,201 @@
+"""
+Servicio de explosión de recetas con caché en memoria.
+
+Cada receta se aplana a un vector {ingrediente_id: cantidad por porción} que
+incluye todas sus sub-recetas. El vector se calcula una vez por proceso y se
+reutiliza en ventas, validación de stock y comandas; explotar N porciones es
+multiplicar el vector por N.
+
+La caché se invalida cuando cambia una fila de RecetaIngrediente o se elimina
+una Receta, incluyendo todas las recetas que la usan como sub-receta.
+"""
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Receta, RecetaIngrediente
+from services.grafo_recetas import orden_topologico
+
+
+class ExplosionRecetas:
+    """Caché de vectores de ingredientes aplanados por receta."""
+
+    _vectores = {}  # receta_id -> {ingrediente_id: cantidad por porción}
+    _padres = {}  # receta_id -> set(receta_id que la usan como sub-receta)
+    _generacion = 0  # Se incrementa en cada invalidación
+    _lock = threading.Lock()
+
+    @staticmethod
+    def vector(receta_id):
+        """
+        Obtiene el vector aplanado de una receta.
+
+        Args:
+            receta_id: int - ID de la receta
+
+        Returns:
+            dict: {ingrediente_id: cantidad por porción}
+        """
+        return ExplosionRecetas.vectores([receta_id])[receta_id]
+
+    @staticmethod
+    def vectores(receta_ids):
+        """
+        Obtiene los vectores aplanados de varias recetas.
+
+        Las recetas que no están en caché se cargan con una consulta IN por
+        nivel de anidación de sub-recetas.
+
+        Raises:
+            ValueError: si las sub-recetas forman un ciclo
+
+        Args:
+            receta_ids: iterable de IDs de receta
+
+        Returns:
+            dict: {receta_id: {ingrediente_id: cantidad por porción}}
+        """
+        receta_ids = set(receta_ids)
+        faltantes = receta_ids - set(ExplosionRecetas._vectores)
+
+        calculados = ExplosionRecetas._materializar(faltantes) if faltantes else {}
+
+        # Si una invalidación concurrente impidió guardarlos, se usan igual los recién calculados
+        return {
+            rid: calculados[rid] if rid in calculados else ExplosionRecetas._vectores.get(rid, {})
+            for rid in receta_ids
+        }
+
+    @staticmethod
+    def explotar(receta_id, cantidad):
+        """
+        Explota N porciones de una receta.
+
+        Returns:
+            dict: {ingrediente_id: cantidad total}
+        """
+        return {
+            ingrediente_id: cantidad_porcion * cantidad
+            for ingrediente_id, cantidad_porcion in ExplosionRecetas.vector(receta_id).items()
+        }
+
+    @staticmethod
+    def invalidar(receta_ids):
+        """
+        Invalida las recetas indicadas y todas las que las contienen.
+
+        Args:
+            receta_ids: iterable de IDs de receta
+        """
+        with ExplosionRecetas._lock:
+            ExplosionRecetas._generacion += 1
+            pendientes = list(receta_ids)
+            vistos = set()
+            while pendientes:
+                receta_id = pendientes.pop()
+                if receta_id in vistos:
+                    continue
+                vistos.add(receta_id)
+                ExplosionRecetas._vectores.pop(receta_id, None)
+                pendientes.extend(ExplosionRecetas._padres.pop(receta_id, ()))
+
+    @staticmethod
+    def limpiar():
+        """Vacía toda la caché."""
+        with ExplosionRecetas._lock:
+            ExplosionRecetas._generacion += 1
+            ExplosionRecetas._vectores.clear()
+            ExplosionRecetas._padres.clear()
+
+    @staticmethod
+    def _materializar(receta_ids):
+        """Carga las líneas de las recetas indicadas y calcula sus vectores (los devuelve)."""
+        generacion = ExplosionRecetas._generacion
+
+        # Cargar líneas por niveles; las recetas ya cacheadas no se vuelven a leer
+        lineas = {}  # receta_id -> [(ingrediente_id, sub_receta_id, cantidad)]
+        pendientes = set(receta_ids)
+        while pendientes:
+            for receta_id in pendientes:
+                lineas[receta_id] = []
+
+            filas = RecetaIngrediente.query.with_entities(
+                RecetaIngrediente.receta_id,
+                RecetaIngrediente.ingrediente_id,
+                RecetaIngrediente.sub_receta_id,
+                RecetaIngrediente.cantidad
+            ).filter(RecetaIngrediente.receta_id.in_(pendientes)).all()
+
+            for receta_id, ingrediente_id, sub_receta_id, cantidad in filas:
+                lineas[receta_id].append((ingrediente_id, sub_receta_id, cantidad))
+
+            pendientes = {
+                fila.sub_receta_id for fila in filas if fila.sub_receta_id
+            } - set(lineas) - set(ExplosionRecetas._vectores)
+
+        calculados = {}
+        padres = {}
+
+        # Sub-recetas antes que las recetas que las usan; cada una se aplana una
+        # sola vez aunque la compartan varias. Un ciclo se rechaza con ValueError.
+        hijos = {
+            receta_id: [sub_receta_id for _, sub_receta_id, _ in filas if sub_receta_id]
+            for receta_id, filas in lineas.items()
+        }
+        for receta_id in orden_topologico(hijos):
+            if receta_id not in lineas:
+                continue  # Ya estaba en caché
+
+            vector = {}
+            for ingrediente_id, sub_receta_id, cantidad in lineas[receta_id]:
+                if ingrediente_id:
+                    vector[ingrediente_id] = vector.get(ingrediente_id, 0) + cantidad
+                elif sub_receta_id:
+                    padres.setdefault(sub_receta_id, set()).add(receta_id)
+                    sub_vector = calculados.get(sub_receta_id)
+                    if sub_vector is None:
+                        sub_vector = ExplosionRecetas._vectores.get(sub_receta_id, {})
+                    for sub_ingrediente_id, sub_cantidad in sub_vector.items():
+                        vector[sub_ingrediente_id] = vector.get(sub_ingrediente_id, 0) + sub_cantidad * cantidad
+
+            calculados[receta_id] = vector
+
+        with ExplosionRecetas._lock:
+            # Si hubo una invalidación mientras se leía, el resultado puede estar desactualizado
+            if generacion == ExplosionRecetas._generacion:
+                ExplosionRecetas._vectores.update(calculados)
+                for sub_receta_id, ids in padres.items():
+                    ExplosionRecetas._padres.setdefault(sub_receta_id, set()).update(ids)
+
+        return calculados
+
+
+# ============= INVALIDACIÓN AUTOMÁTICA =============
+
+def _marcar_receta_ingrediente(mapper, connection, target):
+    ExplosionRecetas.invalidar([target.receta_id])
+    Session.object_session(target).info.setdefault('explosion_invalidar', set()).add(target.receta_id)
+
+
+def _marcar_receta(mapper, connection, target):
+    ExplosionRecetas.invalidar([target.id])
+    Session.object_session(target).info.setdefault('explosion_invalidar', set()).add(target.id)
+
+
+def _invalidar_tras_commit(session):
+    # Se repite tras el commit por si otra petición recargó datos previos al commit
+    receta_ids = session.info.pop('explosion_invalidar', None)
+    if receta_ids:
+        ExplosionRecetas.invalidar(receta_ids)
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop('explosion_invalidar', None)
+
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(RecetaIngrediente, _evento, _marcar_receta_ingrediente)
+event.listen(Receta, 'after_delete', _marcar_receta)
+event.listen(Session, 'after_commit', _invalidar_tras_commit)
+event.listen(Session, 'after_rollback', _descartar_tras_rollback)
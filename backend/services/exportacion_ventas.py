@@ -0,0 +1,163 @@
+"""
+Exportación de ventas, líneas de venta y consumos de ingredientes en CSV o NDJSON.
+
+Las ventas del rango se recorren en lotes de TAMANO_LOTE ordenados por
+(created_at, id): cada lote es una consulta que continúa desde la última
+venta del anterior (usa el índice de created_at) y las líneas o consumos se
+leen solo para las ventas del lote. Cada lote se escribe y se entrega antes
+de leer el siguiente, así que la memoria no depende del tamaño del rango.
+Solo se leen columnas, sin cargar objetos del ORM en la sesión.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import tuple_, case, and_
+
+from models import db, Venta, VentaItem, VentaItemConsumo, Producto, Receta, Ingrediente
+
+
+class ExportacionVentas:
+    """Exportación en lotes del historial de ventas."""
+
+    TAMANO_LOTE = 500  # Ventas por consulta
+
+    FORMATOS = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson'
+    }
+
+    COLUMNAS = {
+        'ventas': (
+            'id', 'fecha', 'usuario_id', 'usuario', 'cliente_nombre', 'numero_mesa',
+            'subtotal', 'descuento', 'iva', 'propina', 'total', 'anulada'
+        ),
+        'items': (
+            'id', 'venta_id', 'fecha', 'tipo', 'item_id', 'nombre',
+            'cantidad', 'precio_unitario', 'subtotal', 'observaciones'
+        ),
+        'consumos': (
+            'id', 'venta_id', 'venta_item_id', 'fecha', 'ingrediente_id', 'ingrediente',
+            'unidad', 'cantidad', 'costo_unitario', 'costo_total'
+        )
+    }
+
+    @staticmethod
+    def transmitir(entidad, formato, desde, hasta):
+        """
+        Genera el archivo por partes (una por lote).
+
+        Args:
+            entidad: 'ventas' | 'items' | 'consumos'
+            formato: 'csv' | 'ndjson'
+            desde, hasta: datetime - rango [desde, hasta) de la fecha de venta
+
+        Yields:
+            str: encabezado (CSV) y luego las filas de cada lote
+        """
+        columnas = ExportacionVentas.COLUMNAS[entidad]
+        filas_por_lote = getattr(ExportacionVentas, f'_filas_{entidad}')
+
+        if formato == 'csv':
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(columnas)
+            for ventas in ExportacionVentas._lotes_ventas(desde, hasta):
+                escritor.writerows(filas_por_lote(ventas))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            for ventas in ExportacionVentas._lotes_ventas(desde, hasta):
+                yield ''.join(
+                    json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + '\n'
+                    for fila in filas_por_lote(ventas)
+                )
+
+    @staticmethod
+    def _lotes_ventas(desde, hasta):
+        """Ventas del rango en lotes, continuando desde la última (created_at, id) leída"""
+        ultima = None
+        while True:
+            consulta = db.session.query(
+                Venta.id, Venta.created_at, Venta.usuario_id, Venta.usuario, Venta.cliente_nombre,
+                Venta.numero_mesa, Venta.subtotal, Venta.descuento, Venta.iva, Venta.propina,
+                Venta.total, Venta.anulada
+            ).filter(
+                Venta.created_at >= desde,
+                Venta.created_at < hasta
+            )
+            if ultima is not None:
+                consulta = consulta.filter(tuple_(Venta.created_at, Venta.id) > ultima)
+            ventas = consulta.order_by(
+                Venta.created_at, Venta.id
+            ).limit(ExportacionVentas.TAMANO_LOTE).all()
+
+            if not ventas:
+                return
+            yield ventas
+            if len(ventas) < ExportacionVentas.TAMANO_LOTE:
+                return
+            ultima = (ventas[-1].created_at, ventas[-1].id)
+
+    @staticmethod
+    def _filas_ventas(ventas):
+        return [
+            (venta.id, venta.created_at.isoformat(), venta.usuario_id, venta.usuario, venta.cliente_nombre,
+             venta.numero_mesa, venta.subtotal, venta.descuento, venta.iva, venta.propina, venta.total,
+             bool(venta.anulada))
+            for venta in ventas
+        ]
+
+    @staticmethod
+    def _filas_items(ventas):
+        orden = {venta.id: (posicion, venta.created_at.isoformat()) for posicion, venta in enumerate(ventas)}
+        es_receta = VentaItem.es_receta.is_(True)
+
+        items = db.session.query(
+            VentaItem.id, VentaItem.venta_id,
+            case((es_receta, 'receta'), else_='producto'),
+            case((es_receta, VentaItem.receta_id), else_=VentaItem.producto_id),
+            case((es_receta, Receta.nombre), else_=Producto.nombre),
+            VentaItem.cantidad, VentaItem.precio_unitario, VentaItem.subtotal, VentaItem.observaciones
+        ).outerjoin(
+            Receta, and_(es_receta, Receta.id == VentaItem.receta_id)
+        ).outerjoin(
+            Producto, Producto.id == VentaItem.producto_id
+        ).filter(
+            VentaItem.venta_id.in_(orden)
+        ).all()
+        items.sort(key=lambda item: (orden[item[1]][0], item[0]))
+
+        return [
+            (item_id, venta_id, orden[venta_id][1], tipo, recurso_id, nombre,
+             cantidad, precio_unitario, subtotal, observaciones)
+            for item_id, venta_id, tipo, recurso_id, nombre, cantidad, precio_unitario, subtotal, observaciones
+            in items
+        ]
+
+    @staticmethod
+    def _filas_consumos(ventas):
+        orden = {venta.id: (posicion, venta.created_at.isoformat()) for posicion, venta in enumerate(ventas)}
+
+        consumos = db.session.query(
+            VentaItemConsumo.id, VentaItem.venta_id, VentaItemConsumo.venta_item_id,
+            VentaItemConsumo.ingrediente_id, Ingrediente.nombre, Ingrediente.unidad_medida,
+            VentaItemConsumo.cantidad, VentaItemConsumo.costo_unitario
+        ).join(
+            VentaItem, VentaItem.id == VentaItemConsumo.venta_item_id
+        ).outerjoin(
+            Ingrediente, Ingrediente.id == VentaItemConsumo.ingrediente_id
+        ).filter(
+            VentaItem.venta_id.in_(orden)
+        ).all()
+        consumos.sort(key=lambda consumo: (orden[consumo[1]][0], consumo[2], consumo[0]))
+
+        return [
+            (consumo_id, venta_id, venta_item_id, orden[venta_id][1], ingrediente_id, nombre, unidad,
+             cantidad, costo_unitario, round(cantidad * (costo_unitario or 0), 4))
+            for consumo_id, venta_id, venta_item_id, ingrediente_id, nombre, unidad, cantidad, costo_unitario
+            in consumos
+        ]
@@ -0,0 +1,228 @@
+"""
+Grafo de sub-recetas.
+
+Las recetas forman un grafo dirigido receta -> sub-receta que debe ser
+acíclico: una receta que se contiene a sí misma, directa o indirectamente,
+haría infinita la explosión y el costeo. El grafo se valida antes de agregar
+una sub-receta, y su orden topológico (sub-recetas antes que las recetas que
+las usan) se guarda en memoria hasta el próximo cambio en receta_ingredientes.
+
+El costeo recorre ese orden: cada receta se calcula una sola vez usando el
+costo ya actualizado de sus sub-recetas, aunque varias recetas las compartan.
+"""
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload
+
+from models import db, Receta, RecetaIngrediente
+from services.calculos_service import CalculoCostos
+
+
+def orden_topologico(hijos):
+    """
+    Ordena un grafo dejando cada nodo después de todos sus hijos.
+
+    Args:
+        hijos: dict {nodo: iterable de hijos}; los hijos sin entrada se tratan como hojas
+
+    Returns:
+        list: nodos en orden (hojas primero)
+
+    Raises:
+        ValueError: si hay un ciclo; el mensaje incluye el recorrido
+    """
+    orden = []
+    estado = {}  # nodo -> 1 en recorrido, 2 terminado
+
+    for inicio in hijos:
+        if inicio in estado:
+            continue
+        # DFS iterativo: la profundidad de las sub-recetas no depende del límite de recursión
+        pila = [(inicio, iter(hijos.get(inicio, ())))]
+        estado[inicio] = 1
+        while pila:
+            nodo, pendientes = pila[-1]
+            for hijo in pendientes:
+                if estado.get(hijo) == 1:
+                    camino = [n for n, _ in pila]
+                    ciclo = camino[camino.index(hijo):] + [hijo]
+                    raise ValueError(
+                        "Ciclo de sub-recetas: " + " -> ".join(f"#{n}" for n in ciclo)
+                    )
+                if hijo not in estado:
+                    estado[hijo] = 1
+                    pila.append((hijo, iter(hijos.get(hijo, ()))))
+                    break
+            else:
+                pila.pop()
+                estado[nodo] = 2
+                orden.append(nodo)
+
+    return orden
+
+
+class GrafoRecetas:
+    """Grafo receta -> sub-receta con su orden topológico en caché."""
+
+    _hijos = None  # receta_id -> set(sub_receta_id)
+    _orden = None  # receta_ids, sub-recetas primero
+    _lock = threading.Lock()
+
+    @staticmethod
+    def hijos():
+        """
+        Aristas del grafo.
+
+        Returns:
+            dict {receta_id: set(sub_receta_id)}
+        """
+        GrafoRecetas._cargar()
+        return GrafoRecetas._hijos
+
+    @staticmethod
+    def orden():
+        """
+        Orden topológico de las recetas con sub-recetas (sub-recetas primero).
+
+        Raises:
+            ValueError: si los datos guardados ya contienen un ciclo
+        """
+        GrafoRecetas._cargar()
+        if GrafoRecetas._orden is None:
+            orden = orden_topologico(GrafoRecetas._hijos)
+            with GrafoRecetas._lock:
+                GrafoRecetas._orden = orden
+        return GrafoRecetas._orden
+
+    @staticmethod
+    def validar_sub_receta(receta_id, sub_receta_id):
+        """
+        Verifica que agregar sub_receta_id dentro de receta_id no forme un ciclo.
+
+        Raises:
+            ValueError: con el recorrido del ciclo (por nombre) si lo formaría
+        """
+        if receta_id == sub_receta_id:
+            raise ValueError('No se puede agregar una receta a sí misma')
+
+        hijos = GrafoRecetas.hijos()
+
+        # ¿receta_id es alcanzable desde sub_receta_id?
+        previo = {sub_receta_id: None}
+        pendientes = [sub_receta_id]
+        while pendientes:
+            nodo = pendientes.pop()
+            if nodo == receta_id:
+                camino = []
+                while nodo is not None:
+                    camino.append(nodo)
+                    nodo = previo[nodo]
+                camino = [receta_id] + camino[::-1]
+                nombres = dict(
+                    db.session.query(Receta.id, Receta.nombre).filter(Receta.id.in_(camino)).all()
+                )
+                raise ValueError(
+                    "La sub-receta formaría un ciclo: "
+                    + " -> ".join(nombres.get(n, f"#{n}") for n in camino)
+                )
+            for hijo in hijos.get(nodo, ()):
+                if hijo not in previo:
+                    previo[hijo] = nodo
+                    pendientes.append(hijo)
+
+    @staticmethod
+    def ancestros(receta_ids):
+        """
+        Recetas que contienen a las indicadas, directa o indirectamente
+        (incluye las indicadas).
+
+        Returns:
+            set de IDs de receta
+        """
+        padres = {}
+        for receta_id, subs in GrafoRecetas.hijos().items():
+            for sub_receta_id in subs:
+                padres.setdefault(sub_receta_id, set()).add(receta_id)
+
+        resultado = set(receta_ids)
+        pendientes = list(resultado)
+        while pendientes:
+            for padre in padres.get(pendientes.pop(), ()):
+                if padre not in resultado:
+                    resultado.add(padre)
+                    pendientes.append(padre)
+        return resultado
+
+    @staticmethod
+    def recalcular_costos(receta_ids):
+        """
+        Recalcula costos y márgenes de las recetas indicadas y de todas las que
+        las usan como sub-receta, en orden topológico (sin commit).
+
+        Args:
+            receta_ids: iterable de IDs de receta
+
+        Returns:
+            list: recetas recalculadas, en el orden en que se calcularon
+        """
+        afectadas = GrafoRecetas.ancestros(receta_ids)
+        if not afectadas:
+            return []
+
+        recetas = {
+            receta.id: receta
+            for receta in Receta.query.options(
+                selectinload(Receta.ingredientes)
+            ).filter(Receta.id.in_(afectadas)).all()
+        }
+
+        posicion = {receta_id: i for i, receta_id in enumerate(GrafoRecetas.orden())}
+        # Las recetas sin sub-recetas ni padres no están en el orden: van primero
+        ordenadas = sorted(recetas.values(), key=lambda r: posicion.get(r.id, -1))
+
+        for receta in ordenadas:
+            CalculoCostos.actualizar_calculos_receta(receta)
+        return ordenadas
+
+    @staticmethod
+    def invalidar():
+        """Descarta el grafo en caché; se recarga en el próximo uso."""
+        with GrafoRecetas._lock:
+            GrafoRecetas._hijos = None
+            GrafoRecetas._orden = None
+
+    @staticmethod
+    def _cargar():
+        if GrafoRecetas._hijos is not None:
+            return
+
+        hijos = {}
+        for receta_id, sub_receta_id in db.session.query(
+            RecetaIngrediente.receta_id, RecetaIngrediente.sub_receta_id
+        ).filter(RecetaIngrediente.sub_receta_id.isnot(None)):
+            hijos.setdefault(receta_id, set()).add(sub_receta_id)
+
+        with GrafoRecetas._lock:
+            GrafoRecetas._hijos = hijos
+            GrafoRecetas._orden = None
+
+
+# ============= INVALIDACIÓN AUTOMÁTICA =============
+
+def _marcar_cambio(mapper, connection, target):
+    GrafoRecetas.invalidar()
+    Session.object_session(target).info['grafo_recetas_invalidar'] = True
+
+
+def _invalidar_tras_transaccion(session):
+    # Tras commit o rollback el grafo leído dentro de la transacción puede no valer
+    if session.info.pop('grafo_recetas_invalidar', None):
+        GrafoRecetas.invalidar()
+
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(RecetaIngrediente, _evento, _marcar_cambio)
+event.listen(Receta, 'after_delete', _marcar_cambio)
+event.listen(Session, 'after_commit', _invalidar_tras_transaccion)
+event.listen(Session, 'after_rollback', _invalidar_tras_transaccion)
@@ -0,0 +1,230 @@
+"""
+Índice en memoria de nombres de ingredientes y recetas para autocompletar.
+
+Los nombres se normalizan sin tildes ni mayúsculas ("Jamón" -> "jamon") y se
+indexan por trigramas de cada palabra y por los prefijos de 1 y 2 letras de
+cada palabra. Una búsqueda intersecta las listas de sus palabras (trigramas
+si tienen 3 o más letras, prefijo si son más cortas) y verifica los
+candidatos, sin consultar la base.
+
+Cada tipo se carga completo con una consulta la primera vez que se usa. Luego
+se mantiene por fila: las altas, cambios y bajas se registran al hacer flush
+y se aplican después del commit (un rollback las descarta). El índice es por
+proceso, como las demás cachés.
+"""
+import re
+import threading
+import unicodedata
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Ingrediente, Receta
+
+
+def normalizar(texto):
+    """Minúsculas sin tildes y con espacios simples"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', texto.lower()))
+
+
+def _trigramas(palabra):
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+def _claves(texto):
+    """Claves de un texto normalizado: '^' + prefijos de 1-2 letras y trigramas de cada palabra"""
+    claves = set()
+    for palabra in texto.split():
+        claves.add('^' + palabra[:1])
+        if len(palabra) >= 2:
+            claves.add('^' + palabra[:2])
+        claves.update(_trigramas(palabra))
+    return claves
+
+
+class IndiceNombres:
+    """Búsqueda por prefijos y trigramas sobre nombres de ingredientes y recetas."""
+
+    MAX_RESULTADOS = 50
+
+    _indices = {}  # tipo -> {'entradas': {id: entrada}, 'claves': {clave: set(ids)}}
+    _generacion = {}  # tipo -> int, se incrementa con cada commit que cambia el tipo
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _entrada_ingrediente(ingrediente_id, nombre, descripcion, unidad_medida):
+        return {
+            'texto': normalizar(f'{nombre} {descripcion or ""}'),
+            'nombre': normalizar(nombre),
+            'usuario_id': None,
+            'datos': {'id': ingrediente_id, 'nombre': nombre, 'unidad_medida': unidad_medida}
+        }
+
+    @staticmethod
+    def _entrada_receta(receta_id, nombre, descripcion, usuario_id):
+        return {
+            'texto': normalizar(nombre),
+            'nombre': normalizar(nombre),
+            'usuario_id': usuario_id,
+            'datos': {'id': receta_id, 'nombre': nombre}
+        }
+
+    @staticmethod
+    def _indice(tipo):
+        """Índice de un tipo; la primera vez se construye con una consulta"""
+        with IndiceNombres._lock:
+            indice = IndiceNombres._indices.get(tipo)
+            if indice is not None:
+                return indice
+            generacion = IndiceNombres._generacion.get(tipo, 0)
+
+        if tipo == 'ingrediente':
+            filas = db.session.query(
+                Ingrediente.id, Ingrediente.nombre, Ingrediente.descripcion, Ingrediente.unidad_medida
+            ).all()
+            crear = IndiceNombres._entrada_ingrediente
+        else:
+            filas = db.session.query(Receta.id, Receta.nombre, Receta.descripcion, Receta.usuario_id).all()
+            crear = IndiceNombres._entrada_receta
+
+        indice = {'entradas': {}, 'claves': {}}
+        for fila in filas:
+            IndiceNombres._agregar(indice, fila[0], crear(*fila))
+
+        with IndiceNombres._lock:
+            # Un commit durante la carga pudo dejarla desactualizada: se usa solo para esta búsqueda
+            if IndiceNombres._generacion.get(tipo, 0) == generacion:
+                indice = IndiceNombres._indices.setdefault(tipo, indice)
+        return indice
+
+    @staticmethod
+    def _agregar(indice, item_id, entrada):
+        indice['entradas'][item_id] = entrada
+        for clave in _claves(entrada['texto']):
+            indice['claves'].setdefault(clave, set()).add(item_id)
+
+    @staticmethod
+    def _quitar(indice, item_id):
+        entrada = indice['entradas'].pop(item_id, None)
+        if entrada is None:
+            return
+        for clave in _claves(entrada['texto']):
+            ids = indice['claves'].get(clave)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del indice['claves'][clave]
+
+    @staticmethod
+    def buscar(tipo, texto, limite=10, usuario_id=None):
+        """
+        Busca por palabras (prefijo o parte de palabra), sin tildes ni mayúsculas.
+
+        Args:
+            tipo: 'ingrediente' | 'receta'
+            texto: lo escrito por el usuario
+            limite: máximo de resultados (None = todos)
+            usuario_id: solo recetas de este usuario
+
+        Returns:
+            list[dict]: {id, nombre, ...}; primero los nombres que empiezan con
+                el texto, luego los que tienen una palabra que empieza con él
+        """
+        consulta = normalizar(texto)
+        if not consulta:
+            return []
+
+        indice = IndiceNombres._indice(tipo)
+        with IndiceNombres._lock:
+            palabras = consulta.split()
+            listas = []
+            for palabra in palabras:
+                claves = _trigramas(palabra) if len(palabra) >= 3 else {'^' + palabra}
+                listas.extend(indice['claves'].get(clave, set()) for clave in claves)
+            listas.sort(key=len)
+            candidatos = set(listas[0]).intersection(*listas[1:]) if listas else set()
+
+            encontrados = []
+            for item_id in candidatos:
+                entrada = indice['entradas'][item_id]
+                if usuario_id is not None and entrada['usuario_id'] != usuario_id:
+                    continue
+                if not all(palabra in entrada['texto'] for palabra in palabras):
+                    continue
+                if entrada['nombre'].startswith(consulta):
+                    rango = 0
+                elif any(p.startswith(palabras[0]) for p in entrada['nombre'].split()):
+                    rango = 1
+                else:
+                    rango = 2
+                encontrados.append((rango, len(entrada['nombre']), entrada['nombre'], entrada['datos']))
+
+        encontrados.sort(key=lambda e: e[:3])
+        if limite is not None:
+            encontrados = encontrados[:max(1, min(limite, IndiceNombres.MAX_RESULTADOS))]
+        return [dict(datos) for _, _, _, datos in encontrados]
+
+    @staticmethod
+    def aplicar(cambios):
+        """
+        Aplica cambios confirmados a los índices cargados.
+
+        Args:
+            cambios: iterable de (tipo, id, entrada o None si se eliminó)
+        """
+        with IndiceNombres._lock:
+            for tipo, item_id, entrada in cambios:
+                IndiceNombres._generacion[tipo] = IndiceNombres._generacion.get(tipo, 0) + 1
+                indice = IndiceNombres._indices.get(tipo)
+                if indice is None:
+                    continue
+                IndiceNombres._quitar(indice, item_id)
+                if entrada is not None:
+                    IndiceNombres._agregar(indice, item_id, entrada)
+
+
+# ============= MANTENIMIENTO INCREMENTAL =============
+
+def _registrar(target, tipo, entrada):
+    Session.object_session(target).info.setdefault('indice_nombres', []).append((tipo, target.id, entrada))
+
+
+def _ingrediente_guardado(mapper, connection, target):
+    _registrar(target, 'ingrediente', IndiceNombres._entrada_ingrediente(
+        target.id, target.nombre, target.descripcion, target.unidad_medida
+    ))
+
+
+def _receta_guardada(mapper, connection, target):
+    _registrar(target, 'receta', IndiceNombres._entrada_receta(
+        target.id, target.nombre, target.descripcion, target.usuario_id
+    ))
+
+
+def _ingrediente_eliminado(mapper, connection, target):
+    _registrar(target, 'ingrediente', None)
+
+
+def _receta_eliminada(mapper, connection, target):
+    _registrar(target, 'receta', None)
+
+
+def _aplicar_tras_commit(session):
+    cambios = session.info.pop('indice_nombres', None)
+    if cambios:
+        IndiceNombres.aplicar(cambios)
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop('indice_nombres', None)
+
+
+for _evento in ('after_insert', 'after_update'):
+    event.listen(Ingrediente, _evento, _ingrediente_guardado)
+    event.listen(Receta, _evento, _receta_guardada)
+event.listen(Ingrediente, 'after_delete', _ingrediente_eliminado)
+event.listen(Receta, 'after_delete', _receta_eliminada)
+event.listen(Session, 'after_commit', _aplicar_tras_commit)
+event.listen(Session, 'after_rollback', _descartar_tras_rollback)
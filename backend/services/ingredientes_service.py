@@ -1,8 +1,9 @@
 """
 Servicio de lógica de negocio para ingredientes.
 """
-from models import db, Ingrediente, HistorialCostoIngrediente, Receta
-from services.calculos_service import CalculoCostos
+from models import db, Ingrediente, HistorialCostoIngrediente
+from services.grafo_recetas import GrafoRecetas
+from services.indice_nombres import IndiceNombres
 from sqlalchemy import exc
 
 
@@ -114,18 +115,14 @@ class IngredienteService:
         """
         from models import RecetaIngrediente
         
-        receta_ingredientes = RecetaIngrediente.query.filter_by(
-            ingrediente_id=ingrediente_id
-        ).all()
-        
-        recetas_actualizadas = set()
+        receta_ids = [
+            receta_id for (receta_id,) in db.session.query(RecetaIngrediente.receta_id).filter_by(
+                ingrediente_id=ingrediente_id
+            ).distinct()
+        ]
         
-        for ri in receta_ingredientes:
-            if ri.receta_id not in recetas_actualizadas:
-                receta = Receta.query.get(ri.receta_id)
-                if receta:
-                    CalculoCostos.actualizar_calculos_receta(receta)
-                    recetas_actualizadas.add(receta.id)
+        # Incluye las recetas que las usan como sub-receta, en orden topológico
+        GrafoRecetas.recalcular_costos(receta_ids)
     
     @staticmethod
     def eliminar_ingrediente(ingrediente_id):
@@ -197,17 +194,18 @@ class IngredienteService:
     @staticmethod
     def buscar_ingredientes(termino):
         """
-        Busca ingredientes por nombre o descripción.
+        Busca ingredientes por nombre o descripción (sin tildes ni mayúsculas).
+        Las coincidencias salen del índice en memoria; solo se leen esas filas.
         
         Args:
             termino: str - Término de búsqueda
         
         Returns:
-            list: Ingredientes encontrados
+            list: Ingredientes encontrados, los que empiezan con el término primero
         """
-        resultados = Ingrediente.query.filter(
-            (Ingrediente.nombre.ilike(f'%{termino}%')) |
-            (Ingrediente.descripcion.ilike(f'%{termino}%'))
-        ).all()
+        ids = [i['id'] for i in IndiceNombres.buscar('ingrediente', termino, limite=None)]
+        if not ids:
+            return []
         
-        return [i.to_dict() for i in resultados]
+        ingredientes = {i.id: i for i in Ingrediente.query.filter(Ingrediente.id.in_(ids)).all()}
+        return [ingredientes[i].to_dict() for i in ids if i in ingredientes]
@@ -0,0 +1,233 @@
+"""
+Libro de movimientos de inventario.
+
+Cada cambio de stock (venta, compra, merma, anulación o ajuste manual) agrega
+una fila a movimientos_inventario; ninguna fila se modifica ni se borra, así
+que el libro es la auditoría completa del stock y las inserciones no compiten
+por la misma fila como lo hacen los contadores.
+
+Cada SNAPSHOT_CADA_MOVIMIENTOS movimientos se guarda un corte con el stock de
+todos los recursos. El stock de un recurso a cualquier fecha es el del último
+corte anterior más los movimientos posteriores a él, así que el costo depende
+de los movimientos desde el corte y no de toda la historia.
+
+Producto.stock e Ingrediente.stock_actual se mantienen como valor
+materializado del libro: las guardias de venta (UPDATE ... WHERE stock >= n)
+los necesitan para rechazar ventas sin stock de forma atómica.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import db, Producto, Ingrediente, MovimientoInventario, SnapshotInventario
+from services.contadores_dashboard import ContadoresDashboard
+
+
+class LibroInventario:
+    """Registro y consulta del libro de movimientos de inventario."""
+
+    # Tipos de recurso
+    PRODUCTO = 1
+    INGREDIENTE = 2
+
+    # Tipos de movimiento
+    VENTA = 1
+    COMPRA = 2
+    MERMA = 3
+    ANULACION = 4
+    AJUSTE = 5
+
+    TIPOS_RECURSO = {PRODUCTO: 'producto', INGREDIENTE: 'ingrediente'}
+    TIPOS_MOVIMIENTO = {VENTA: 'venta', COMPRA: 'compra', MERMA: 'merma', ANULACION: 'anulacion', AJUSTE: 'ajuste'}
+
+    SNAPSHOT_CADA_MOVIMIENTOS = int(os.getenv('INVENTARIO_SNAPSHOT_CADA', '5000'))
+
+    _desde_corte = 0  # Movimientos registrados por este proceso desde el último corte (aproximado)
+
+    @staticmethod
+    def registrar(tipo_movimiento, movimientos):
+        """
+        Agrega movimientos al libro en la transacción en curso (sin commit) y
+        actualiza los contadores de stock de productos del dashboard.
+
+        Args:
+            tipo_movimiento: LibroInventario.VENTA | COMPRA | MERMA | ANULACION | AJUSTE
+            movimientos: iterable de (tipo_recurso, recurso_id, cantidad, referencia_id);
+                cantidad con signo (negativa descuenta)
+        """
+        ahora = datetime.utcnow()
+        filas = [
+            {
+                'tipo_recurso': tipo_recurso,
+                'recurso_id': recurso_id,
+                'tipo_movimiento': tipo_movimiento,
+                'cantidad': cantidad,
+                'referencia_id': referencia_id,
+                'created_at': ahora
+            }
+            for tipo_recurso, recurso_id, cantidad, referencia_id in movimientos
+            if cantidad
+        ]
+        if not filas:
+            return
+
+        if LibroInventario._desde_corte >= LibroInventario.SNAPSHOT_CADA_MOVIMIENTOS:
+            LibroInventario.tomar_snapshot()
+
+        db.session.execute(MovimientoInventario.__table__.insert(), filas)
+        LibroInventario._desde_corte += len(filas)
+
+        productos = {}
+        for fila in filas:
+            if fila['tipo_recurso'] == LibroInventario.PRODUCTO:
+                productos[fila['recurso_id']] = productos.get(fila['recurso_id'], 0) + fila['cantidad']
+        ContadoresDashboard.registrar_stock_productos(productos)
+
+    @staticmethod
+    def tomar_snapshot():
+        """
+        Guarda un corte con el stock de todos los recursos (sin commit).
+
+        El primer corte se toma de las columnas de stock (historia previa al
+        libro); los siguientes se calculan con el corte anterior más los
+        movimientos posteriores, agrupados en una consulta.
+
+        Returns:
+            int: último movimiento incluido en el corte
+        """
+        ultimo_movimiento = db.session.query(func.max(MovimientoInventario.id)).scalar() or 0
+        corte_anterior = db.session.query(func.max(SnapshotInventario.movimiento_id)).scalar()
+
+        if corte_anterior is None:
+            stocks = {
+                (LibroInventario.PRODUCTO, producto_id): stock or 0
+                for producto_id, stock in db.session.query(Producto.id, Producto.stock)
+            }
+            stocks.update({
+                (LibroInventario.INGREDIENTE, ingrediente_id): stock or 0
+                for ingrediente_id, stock in db.session.query(Ingrediente.id, Ingrediente.stock_actual)
+            })
+        else:
+            if corte_anterior == ultimo_movimiento:
+                LibroInventario._desde_corte = 0
+                return ultimo_movimiento
+
+            stocks = {
+                (tipo_recurso, recurso_id): stock
+                for tipo_recurso, recurso_id, stock in db.session.query(
+                    SnapshotInventario.tipo_recurso, SnapshotInventario.recurso_id, SnapshotInventario.stock
+                ).filter(SnapshotInventario.movimiento_id == corte_anterior)
+            }
+            for tipo_recurso, recurso_id, cantidad in db.session.query(
+                MovimientoInventario.tipo_recurso, MovimientoInventario.recurso_id, func.sum(MovimientoInventario.cantidad)
+            ).filter(
+                MovimientoInventario.id > corte_anterior,
+                MovimientoInventario.id <= ultimo_movimiento
+            ).group_by(MovimientoInventario.tipo_recurso, MovimientoInventario.recurso_id):
+                clave = (tipo_recurso, recurso_id)
+                stocks[clave] = stocks.get(clave, 0) + cantidad
+
+            # Los productos e ingredientes eliminados no pasan al corte nuevo
+            existentes = {(LibroInventario.PRODUCTO, producto_id) for (producto_id,) in db.session.query(Producto.id)}
+            existentes.update(
+                (LibroInventario.INGREDIENTE, ingrediente_id) for (ingrediente_id,) in db.session.query(Ingrediente.id)
+            )
+            stocks = {clave: stock for clave, stock in stocks.items() if clave in existentes}
+
+        ahora = datetime.utcnow()
+        filas = [
+            {
+                'tipo_recurso': tipo_recurso,
+                'recurso_id': recurso_id,
+                'movimiento_id': ultimo_movimiento,
+                'stock': round(stock, 6),
+                'created_at': ahora
+            }
+            for (tipo_recurso, recurso_id), stock in sorted(stocks.items())
+        ]
+        if filas:
+            db.session.execute(SnapshotInventario.__table__.insert(), filas)
+
+        LibroInventario._desde_corte = 0
+        return ultimo_movimiento
+
+    @staticmethod
+    def stock(tipo_recurso, recurso_id, hasta=None):
+        """
+        Stock de un recurso según el libro, actual o a una fecha.
+
+        Args:
+            tipo_recurso: LibroInventario.PRODUCTO | INGREDIENTE
+            recurso_id: int
+            hasta: datetime (UTC) opcional
+
+        Returns:
+            dict {stock, snapshot_movimiento_id, movimientos}
+
+        Raises:
+            ValueError: si la fecha es anterior al primer corte (no hay historia)
+        """
+        consulta_corte = SnapshotInventario.query.filter(
+            SnapshotInventario.tipo_recurso == tipo_recurso,
+            SnapshotInventario.recurso_id == recurso_id
+        )
+        if hasta is not None:
+            consulta_corte = consulta_corte.filter(SnapshotInventario.created_at <= hasta)
+        corte = consulta_corte.order_by(SnapshotInventario.movimiento_id.desc()).first()
+
+        if corte is None and hasta is not None:
+            primer_corte = db.session.query(func.min(SnapshotInventario.created_at)).scalar()
+            if primer_corte is None or hasta < primer_corte:
+                raise ValueError("No hay historial de inventario para esa fecha")
+
+        # Sin corte propio: el recurso se creó después del corte, parte de 0
+        base = corte.stock if corte else 0
+        desde = corte.movimiento_id if corte else 0
+
+        consulta = db.session.query(
+            func.coalesce(func.sum(MovimientoInventario.cantidad), 0), func.count(MovimientoInventario.id)
+        ).filter(
+            MovimientoInventario.tipo_recurso == tipo_recurso,
+            MovimientoInventario.recurso_id == recurso_id,
+            MovimientoInventario.id > desde
+        )
+        if hasta is not None:
+            consulta = consulta.filter(MovimientoInventario.created_at <= hasta)
+        delta, cantidad_movimientos = consulta.one()
+
+        return {
+            'stock': round(base + delta, 6),
+            'snapshot_movimiento_id': desde,
+            'movimientos': cantidad_movimientos
+        }
+
+    @staticmethod
+    def movimientos(tipo_recurso, recurso_id, desde=None, hasta=None, limite=100):
+        """
+        Movimientos de un recurso, del más reciente al más antiguo.
+
+        Returns:
+            list[dict]
+        """
+        consulta = MovimientoInventario.query.filter(
+            MovimientoInventario.tipo_recurso == tipo_recurso,
+            MovimientoInventario.recurso_id == recurso_id
+        )
+        if desde is not None:
+            consulta = consulta.filter(MovimientoInventario.created_at >= desde)
+        if hasta is not None:
+            consulta = consulta.filter(MovimientoInventario.created_at <= hasta)
+
+        return [
+            {
+                'id': m.id,
+                'tipo_recurso': LibroInventario.TIPOS_RECURSO.get(m.tipo_recurso),
+                'recurso_id': m.recurso_id,
+                'tipo_movimiento': LibroInventario.TIPOS_MOVIMIENTO.get(m.tipo_movimiento),
+                'cantidad': m.cantidad,
+                'referencia_id': m.referencia_id,
+                'created_at': m.created_at.isoformat()
+            }
+            for m in consulta.order_by(MovimientoInventario.id.desc()).limit(limite)
+        ]
@@ -0,0 +1,146 @@
+"""
+Ranking de lo más vendido (productos y recetas) sobre ventas_resumen_dia.
+
+El resumen por día ya tiene una fila por (día, usuario, producto o receta),
+así que un rango de fechas lee a lo sumo días × items del catálogo, sin
+importar cuántas ventas haya. El ranking se ordena en SQL y solo se
+conservan los primeros: ORDER BY ... LIMIT para el rango completo y
+ROW_NUMBER() por día para el ranking diario. Los nombres se resuelven
+después, solo para los items del ranking.
+
+Las ventas anuladas no cuentan (el resumen las resta al anular).
+"""
+from sqlalchemy import func, select
+
+from models import db, Producto, Receta, ResumenVentasDia
+
+
+class MasVendidos:
+    """Top-K de productos y recetas en un rango de días."""
+
+    LIMITE = 10
+    MAX_LIMITE = 100
+
+    CRITERIOS = ('cantidad', 'ingresos')
+
+    @staticmethod
+    def _consulta(desde, hasta, usuario_id, *agrupar):
+        """
+        Filas producto/receta del rango agrupadas por item (y por las columnas
+        de agrupar), con cantidad e ingresos sumados.
+
+        Args:
+            desde, hasta: date - rango [desde, hasta); None = sin límite
+            usuario_id: solo ventas de este usuario (None = todos)
+        """
+        cantidad = func.sum(ResumenVentasDia.cantidad)
+        consulta = db.session.query(
+            *agrupar, ResumenVentasDia.tipo_item, ResumenVentasDia.item_id,
+            cantidad.label('cantidad'), func.sum(ResumenVentasDia.ingresos).label('ingresos')
+        ).filter(ResumenVentasDia.tipo_item != 'venta')
+        if desde is not None:
+            consulta = consulta.filter(ResumenVentasDia.bucket >= desde)
+        if hasta is not None:
+            consulta = consulta.filter(ResumenVentasDia.bucket < hasta)
+        if usuario_id is not None:
+            consulta = consulta.filter(ResumenVentasDia.usuario_id == usuario_id)
+        return consulta.group_by(
+            *agrupar, ResumenVentasDia.tipo_item, ResumenVentasDia.item_id
+        ).having(cantidad > 0)
+
+    @staticmethod
+    def _limite(limite):
+        return max(1, min(limite or MasVendidos.LIMITE, MasVendidos.MAX_LIMITE))
+
+    @staticmethod
+    def _nombres(claves):
+        """
+        Nombres actuales de los items (los borrados del catálogo se muestran
+        como 'Producto #id' / 'Receta #id').
+
+        Args:
+            claves: iterable de (tipo_item, item_id)
+        """
+        claves = set(claves)
+        ids = {'producto': set(), 'receta': set()}
+        for tipo_item, item_id in claves:
+            ids[tipo_item].add(item_id)
+
+        nombres = {}
+        for tipo_item, modelo in (('producto', Producto), ('receta', Receta)):
+            if ids[tipo_item]:
+                nombres.update(
+                    ((tipo_item, item_id), nombre)
+                    for item_id, nombre in db.session.query(modelo.id, modelo.nombre).filter(
+                        modelo.id.in_(ids[tipo_item])
+                    )
+                )
+        return {
+            clave: nombres.get(clave) or f"{clave[0].capitalize()} #{clave[1]}"
+            for clave in claves
+        }
+
+    @staticmethod
+    def _items(filas, nombres):
+        return [{
+            'tipo': fila.tipo_item,
+            'item_id': fila.item_id,
+            'nombre': nombres[(fila.tipo_item, fila.item_id)],
+            'cantidad': fila.cantidad,
+            'ingresos': round(fila.ingresos or 0, 2)
+        } for fila in filas]
+
+    @staticmethod
+    def top(desde=None, hasta=None, limite=LIMITE, usuario_id=None, criterio='cantidad'):
+        """
+        Los items más vendidos del rango.
+
+        Args:
+            desde, hasta: date - rango [desde, hasta); None = sin límite
+            limite: cantidad de items (hasta MAX_LIMITE)
+            usuario_id: solo ventas de este usuario (None = todos)
+            criterio: 'cantidad' | 'ingresos'
+
+        Returns:
+            list[dict]: {tipo, item_id, nombre, cantidad, ingresos}, de mayor a menor
+        """
+        if criterio not in MasVendidos.CRITERIOS:
+            raise ValueError(f"Criterio inválido: {criterio}")
+
+        filas = MasVendidos._consulta(desde, hasta, usuario_id).subquery()
+        ranking = db.session.query(filas).order_by(
+            filas.c[criterio].desc(), filas.c.tipo_item, filas.c.item_id
+        ).limit(MasVendidos._limite(limite)).all()
+
+        nombres = MasVendidos._nombres((fila.tipo_item, fila.item_id) for fila in ranking)
+        return MasVendidos._items(ranking, nombres)
+
+    @staticmethod
+    def top_por_dia(desde, hasta, limite=LIMITE, usuario_id=None):
+        """
+        Los items más vendidos de cada día del rango (por cantidad).
+
+        Args:
+            desde, hasta: date - rango [desde, hasta)
+            limite: items por día (hasta MAX_LIMITE)
+            usuario_id: solo ventas de este usuario (None = todos)
+
+        Returns:
+            dict {date: list[dict]} con los items de cada día de mayor a menor
+        """
+        filas = MasVendidos._consulta(desde, hasta, usuario_id, ResumenVentasDia.bucket).subquery()
+        posicion = func.row_number().over(
+            partition_by=filas.c.bucket,
+            order_by=(filas.c.cantidad.desc(), filas.c.tipo_item, filas.c.item_id)
+        ).label('posicion')
+        ordenadas = select(filas, posicion).subquery()
+
+        ranking = db.session.query(ordenadas).filter(
+            ordenadas.c.posicion <= MasVendidos._limite(limite)
+        ).order_by(ordenadas.c.bucket, ordenadas.c.posicion).all()
+
+        nombres = MasVendidos._nombres((fila.tipo_item, fila.item_id) for fila in ranking)
+        por_dia = {}
+        for fila in ranking:
+            por_dia.setdefault(fila.bucket, []).append(fila)
+        return {dia: MasVendidos._items(filas_dia, nombres) for dia, filas_dia in por_dia.items()}
@@ -3,6 +3,7 @@ Servicio de lógica de negocio para recetas.
 """
 from models import db, Receta, RecetaIngrediente, Ingrediente
 from services.calculos_service import CalculoCostos
+from services.grafo_recetas import GrafoRecetas
 from sqlalchemy import exc
 
 
@@ -175,8 +176,11 @@ class RecetaService:
             sub_receta = Receta.query.get(sub_receta_id)
             if not sub_receta:
                 return None, 'Sub-receta no encontrada'
-            if sub_receta.id == receta.id:
-                return None, 'No se puede agregar una receta a sí misma'
+            try:
+                # Rechaza ciclos directos (la misma receta) e indirectos
+                GrafoRecetas.validar_sub_receta(receta.id, sub_receta.id)
+            except ValueError as e:
+                return None, str(e)
             target_filter = {'sub_receta_id': sub_receta_id}
 
         try:
@@ -200,8 +204,8 @@ class RecetaService:
                 )
                 db.session.add(ri)
             
-            # Recalcular receta
-            CalculoCostos.actualizar_calculos_receta(receta)
+            # Recalcular la receta y las que la usan como sub-receta
+            GrafoRecetas.recalcular_costos([receta.id])
             
             db.session.commit()
             return ri, None
@@ -239,8 +243,8 @@ class RecetaService:
         try:
             db.session.delete(ri)
             
-            # Recalcular receta
-            CalculoCostos.actualizar_calculos_receta(receta)
+            # Recalcular la receta y las que la usan como sub-receta
+            GrafoRecetas.recalcular_costos([receta.id])
             
             db.session.commit()
             return True, None
@@ -279,8 +283,8 @@ class RecetaService:
         try:
             ri.cantidad = cantidad
             
-            # Recalcular receta
-            CalculoCostos.actualizar_calculos_receta(receta)
+            # Recalcular la receta y las que la usan como sub-receta
+            GrafoRecetas.recalcular_costos([receta.id])
             
             db.session.commit()
             return ri, None
@@ -0,0 +1,138 @@
+"""
+Reservas de stock para carritos abiertos.
+
+Mientras un cajero arma un carrito, sus productos e ingredientes quedan
+apartados por TTL_SEGUNDOS. El stock disponible para los demás es el stock
+físico menos las reservas vigentes de otros carritos; la venta que se cierra
+con el código de reserva la consume (borra sus filas y descuenta el stock
+en la misma transacción).
+
+Las reservas vencidas no cuentan aunque sigan en la tabla: todas las lecturas
+filtran por expira_en. El barrido solo libera espacio y usa el índice de
+expira_en, así que borra por rango sin recorrer las vigentes.
+"""
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, and_
+
+from models import db, ReservaStock
+
+
+class ReservasStock:
+    """Reservas temporales de productos e ingredientes."""
+
+    TTL_SEGUNDOS = int(os.getenv('RESERVA_STOCK_TTL_SEGUNDOS', '300'))
+
+    @staticmethod
+    def reservar(usuario_id, requerido, codigo=None):
+        """
+        Inserta las reservas de un carrito (sin commit).
+
+        Args:
+            usuario_id: ID del cajero dueño del carrito
+            requerido: dict {('producto'|'ingrediente', id): cantidad}
+            codigo: código existente del carrito; si no se entrega se genera uno
+
+        Returns:
+            tuple (codigo, expira_en)
+        """
+        codigo = codigo or uuid.uuid4().hex
+        ahora = datetime.utcnow()
+        expira_en = ahora + timedelta(seconds=ReservasStock.TTL_SEGUNDOS)
+
+        filas = [
+            {
+                'codigo': codigo,
+                'usuario_id': usuario_id,
+                'tipo_recurso': tipo,
+                'recurso_id': recurso_id,
+                'cantidad': cantidad,
+                'expira_en': expira_en,
+                'created_at': ahora
+            }
+            for (tipo, recurso_id), cantidad in sorted(requerido.items())
+        ]
+        if filas:
+            db.session.execute(ReservaStock.__table__.insert(), filas)
+
+        return codigo, expira_en
+
+    @staticmethod
+    def liberar(codigo, usuario_id):
+        """
+        Borra las reservas de un carrito (sin commit). Se usa al cancelar el
+        carrito, al reemplazar sus reservas y al cerrar la venta.
+
+        Returns:
+            int: filas borradas
+        """
+        if not codigo:
+            return 0
+        return ReservaStock.query.filter(
+            ReservaStock.codigo == codigo,
+            ReservaStock.usuario_id == usuario_id
+        ).delete(synchronize_session=False)
+
+    @staticmethod
+    def barrer():
+        """
+        Borra las reservas vencidas (sin commit) por rango sobre el índice de expira_en.
+
+        Returns:
+            int: filas borradas
+        """
+        return ReservaStock.query.filter(
+            ReservaStock.expira_en <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+
+    @staticmethod
+    def reservado(producto_ids=(), ingrediente_ids=(), excluir_codigo=None):
+        """
+        Cantidades reservadas vigentes por recurso, en una consulta.
+
+        Args:
+            excluir_codigo: reserva que no se suma (la del propio carrito)
+
+        Returns:
+            dict {('producto'|'ingrediente', id): cantidad}
+        """
+        if not producto_ids and not ingrediente_ids:
+            return {}
+
+        consulta = db.session.query(
+            ReservaStock.tipo_recurso, ReservaStock.recurso_id, func.sum(ReservaStock.cantidad)
+        ).filter(
+            ReservaStock.recurso_id.in_(set(producto_ids) | set(ingrediente_ids)),
+            ReservaStock.expira_en > datetime.utcnow()
+        )
+        if excluir_codigo:
+            consulta = consulta.filter(ReservaStock.codigo != excluir_codigo)
+        filas = consulta.group_by(ReservaStock.tipo_recurso, ReservaStock.recurso_id).all()
+
+        ids = {'producto': set(producto_ids), 'ingrediente': set(ingrediente_ids)}
+        return {
+            (tipo, recurso_id): cantidad
+            for tipo, recurso_id, cantidad in filas
+            if recurso_id in ids.get(tipo, ())
+        }
+
+    @staticmethod
+    def subconsulta_reservado(tipo_recurso, columna_id):
+        """
+        Subconsulta correlacionada con lo reservado vigente de la fila que se
+        actualiza (para las guardias de descuento de stock).
+
+        Args:
+            tipo_recurso: 'producto' | 'ingrediente'
+            columna_id: columna id de la tabla actualizada
+        """
+        reservas = ReservaStock.__table__
+        return select(func.coalesce(func.sum(reservas.c.cantidad), 0)).where(
+            and_(
+                reservas.c.tipo_recurso == tipo_recurso,
+                reservas.c.recurso_id == columna_id,
+                reservas.c.expira_en > datetime.utcnow()
+            )
+        ).scalar_subquery()
@@ -0,0 +1,169 @@
+"""
+Resúmenes de ventas por hora y por día.
+
+Cada venta suma sus montos en ventas_resumen_hora y ventas_resumen_dia dentro
+de su misma transacción, y cada anulación los resta. Los reportes leen solo
+estas tablas, así que su costo depende de la cantidad de horas/días e items
+del rango y no de la cantidad de ventas.
+"""
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Venta, VentaItem, VentaItemConsumo, ResumenVentasHora, ResumenVentasDia
+from services.cache_reportes import CacheReportes
+from services.contadores_dashboard import ContadoresDashboard
+
+
+class ResumenVentas:
+    """Mantenimiento de los resúmenes de ventas."""
+
+    COLUMNAS = ('cantidad', 'ingresos', 'descuentos', 'iva', 'costo')
+
+    @staticmethod
+    def bucket_hora(fecha):
+        """Inicio de la hora de una fecha (clave de ventas_resumen_hora)"""
+        return fecha.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def registrar_venta(venta, preparada):
+        """
+        Suma una venta recién registrada con los datos ya preparados (sin consultas ni commit).
+
+        Args:
+            venta: Venta con ID, usuario_id, created_at y montos
+            preparada: resultado de _preparar_venta
+        """
+        lineas = [
+            (
+                item_data['tipo'],
+                item_data['receta_id'] if item_data['es_receta'] else item_data['producto_id'],
+                item_data['cantidad'],
+                item_data['monto'],
+                sum(
+                    info['cantidad_total'] * (info['costo_unitario'] or 0)
+                    for info in item_data['explosion_detalles'].values()
+                )
+            )
+            for item_data in preparada['items']
+        ]
+        ResumenVentas._acumular([(venta.usuario_id, venta.created_at, 1, venta.total,
+                                  venta.descuento, venta.iva, lineas)], 1)
+
+    @staticmethod
+    def registrar_ventas(venta_ids, signo=1):
+        """
+        Suma (signo 1) o resta (signo -1) ventas ya guardadas, leyendo sus líneas
+        con una consulta agregada por tabla (sin commit). Se usa al anular.
+
+        Args:
+            venta_ids: lista de IDs de venta
+        """
+        if not venta_ids:
+            return
+
+        cabeceras = db.session.query(
+            Venta.id, Venta.usuario_id, Venta.created_at, Venta.total, Venta.descuento, Venta.iva
+        ).filter(Venta.id.in_(venta_ids)).all()
+
+        lineas = db.session.query(
+            VentaItem.venta_id, VentaItem.es_receta, VentaItem.receta_id, VentaItem.producto_id,
+            func.sum(VentaItem.cantidad), func.sum(VentaItem.subtotal)
+        ).filter(
+            VentaItem.venta_id.in_(venta_ids)
+        ).group_by(
+            VentaItem.venta_id, VentaItem.es_receta, VentaItem.receta_id, VentaItem.producto_id
+        ).all()
+
+        costos = {
+            (venta_id, receta_id): costo
+            for venta_id, receta_id, costo in db.session.query(
+                VentaItem.venta_id, VentaItem.receta_id,
+                func.sum(VentaItemConsumo.cantidad * func.coalesce(VentaItemConsumo.costo_unitario, 0))
+            ).join(
+                VentaItem, VentaItem.id == VentaItemConsumo.venta_item_id
+            ).filter(
+                VentaItem.venta_id.in_(venta_ids)
+            ).group_by(VentaItem.venta_id, VentaItem.receta_id)
+        }
+
+        por_venta = {}
+        for venta_id, es_receta, receta_id, producto_id, cantidad, subtotal in lineas:
+            if es_receta:
+                linea = ('receta', receta_id, cantidad, subtotal, costos.get((venta_id, receta_id), 0))
+            else:
+                linea = ('producto', producto_id, cantidad, subtotal, 0)
+            por_venta.setdefault(venta_id, []).append(linea)
+
+        ResumenVentas._acumular([
+            (usuario_id, created_at, 1, total, descuento, iva, por_venta.get(venta_id, []))
+            for venta_id, usuario_id, created_at, total, descuento, iva in cabeceras
+        ], signo)
+
+    @staticmethod
+    def _acumular(ventas, signo):
+        """
+        Agrupa por clave, aplica un upsert (executemany) por tabla, suma los
+        totales históricos del dashboard e invalida los reportes en caché de
+        los días tocados.
+
+        Args:
+            ventas: iterable de (usuario_id, created_at, n_ventas, total, descuento, iva,
+                                 [(tipo_item, item_id, cantidad, ingresos, costo)])
+            signo: 1 al vender, -1 al anular
+        """
+        horas = {}
+        dias = {}
+
+        def sumar(destino, clave, valores):
+            fila = destino.setdefault(clave, [0, 0, 0, 0, 0])
+            for i, valor in enumerate(valores):
+                fila[i] += signo * (valor or 0)
+
+        for usuario_id, created_at, n_ventas, total, descuento, iva, lineas in ventas:
+            created_at = created_at or datetime.utcnow()
+            usuario_id = usuario_id or 0
+            hora = ResumenVentas.bucket_hora(created_at)
+            dia = created_at.date()
+
+            for tipo_item, item_id, valores in [('venta', 0, (n_ventas, total, descuento, iva, 0))] + [
+                (tipo_item, item_id, (cantidad, ingresos, 0, 0, costo))
+                for tipo_item, item_id, cantidad, ingresos, costo in lineas
+                if item_id is not None
+            ]:
+                sumar(horas, (hora, usuario_id, tipo_item, item_id), valores)
+                sumar(dias, (dia, usuario_id, tipo_item, item_id), valores)
+
+        CacheReportes.marcar((usuario_id, dia) for dia, usuario_id, _, _ in dias)
+        ContadoresDashboard.sumar({
+            ContadoresDashboard.VENTAS_CANTIDAD: sum(
+                valores[0] for (_, _, tipo_item, _), valores in dias.items() if tipo_item == 'venta'
+            ),
+            ContadoresDashboard.VENTAS_TOTAL: sum(
+                valores[1] for (_, _, tipo_item, _), valores in dias.items() if tipo_item == 'venta'
+            )
+        })
+
+        for modelo, filas in ((ResumenVentasHora, horas), (ResumenVentasDia, dias)):
+            if not filas:
+                continue
+            tabla = modelo.__table__
+            sentencia = insert(tabla)
+            sentencia = sentencia.on_conflict_do_update(
+                index_elements=[tabla.c.bucket, tabla.c.usuario_id, tabla.c.tipo_item, tabla.c.item_id],
+                set_={
+                    columna: tabla.c[columna] + sentencia.excluded[columna]
+                    for columna in ResumenVentas.COLUMNAS
+                }
+            )
+            db.session.execute(sentencia, [
+                {
+                    'bucket': bucket,
+                    'usuario_id': usuario_id,
+                    'tipo_item': tipo_item,
+                    'item_id': item_id,
+                    **dict(zip(ResumenVentas.COLUMNAS, valores))
+                }
+                for (bucket, usuario_id, tipo_item, item_id), valores in sorted(filas.items())
+            ])
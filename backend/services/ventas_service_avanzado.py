@@ -6,21 +6,48 @@ Características:
 - Reportes granulares (por hora, día, rango de fechas)
 """
 from models import (
-    db, Venta, VentaItem, Producto, Receta, RecetaIngrediente, 
-    Ingrediente, Comanda, Usuario
+    db, Venta, VentaItem, Producto, Receta,
+    Ingrediente, Comanda, Usuario, VentaItemConsumo, ResumenVentasHora, ResumenVentasDia
 )
-from sqlalchemy import func, desc, and_
-from datetime import datetime, timedelta
-import json
+from services.explosion_service import ExplosionRecetas
+from services.comandas_worker import GeneradorComandas
+from services.comandas_feed import FeedComandas
+from services.comprobantes_service import PlantillasComprobantes
+from services.reservas_service import ReservasStock
+from services.libro_inventario import LibroInventario
+from services.resumen_ventas import ResumenVentas
+from services.cache_reportes import CacheReportes
+from services.busqueda_ventas import BusquedaVentas
+from services.mas_vendidos import MasVendidos
+from sqlalchemy import func, desc, and_, bindparam, true, exc, case, cast, String, tuple_
+from sqlalchemy.orm import undefer
+from datetime import datetime, timedelta, timezone
+import os
 
 
 class VentasServiceAvanzado:
     """Servicio centralizado para gestión avanzada de ventas"""
 
+    # Permite vender recetas aunque no alcance el stock de ingredientes (por
+    # defecto, como siempre: muchos locales no registran ese inventario). Con
+    # 'false' las ventas exigen stock de ingredientes, descontando reservas.
+    PERMITIR_STOCK_NEGATIVO_INGREDIENTES = os.getenv('PERMITIR_STOCK_NEGATIVO_INGREDIENTES', 'true').lower() == 'true'
+    
+    # Máximo de ventas aceptadas en una sincronización por lote
+    MAX_VENTAS_LOTE = 200
+    
+    # Máximo de ventas anuladas en una sola operación masiva
+    MAX_ANULACIONES_LOTE = 1000
+    
+    # Historial: ventas por página y tope del conteo del total estimado
+    MAX_POR_PAGINA = 100
+    LIMITE_CONTEO = 10000
+
     # ======================== CREACIÓN DE VENTAS ========================
 
     @staticmethod
-    def crear_venta_con_explosion(usuario_id, items, cliente_nombre='', numero_mesa='', descuento=0, comentarios=''):
+    def crear_venta_con_explosion(usuario_id, items, cliente_nombre='', numero_mesa='', descuento=0, comentarios='',
+                                  clave_idempotencia=None, codigo_reserva=None):
         """
         Crear venta con explosión automática de recetas
         
@@ -31,159 +58,170 @@ class VentasServiceAvanzado:
             numero_mesa: Número de mesa
             descuento: Porcentaje de descuento
             comentarios: Comentarios generales de la venta
+            clave_idempotencia: Clave enviada por el cliente; si ya existe una venta con
+                esa clave se devuelve su resultado en vez de crear otra
+            codigo_reserva: Reserva de stock del carrito; la venta la consume
         
         Returns:
-            dict con datos de venta, comprobantes e información de explosión
+            dict con datos de venta e información de explosión
+            ('repetida' indica si la venta ya existía). Las comandas se generan en
+            segundo plano; se consultan con obtener_comanda.
         """
-        if not items:
-            raise ValueError("La venta debe contener al menos un item")
+        VentasServiceAvanzado._validar_datos_venta(items, descuento)
+        VentasServiceAvanzado._validar_clave_idempotencia(clave_idempotencia)
         
-        if not 0 <= descuento <= 100:
-            raise ValueError("Descuento debe estar entre 0 y 100")
+        if clave_idempotencia:
+            existente = VentasServiceAvanzado._buscar_venta_por_clave(usuario_id, clave_idempotencia)
+            if existente:
+                return VentasServiceAvanzado._resultado_venta_existente(existente)
         
         try:
-            # Validar y procesar items
-            subtotal = 0
-            venta_items_data = []
-            descuentos_inventario = {}  # Tracking de ingredientes descontados
-            
-            for item in items:
-                tipo = item.get('tipo', 'producto')
-                cantidad = item.get('cantidad', 1)
-                
-                if tipo == 'producto':
-                    # Item es un producto simple
-                    producto = Producto.query.get(item['id'])
-                    if not producto:
-                        raise ValueError(f"Producto {item['id']} no encontrado")
-                    
-                    if producto.stock < cantidad:
-                        raise ValueError(
-                            f"Stock insuficiente de {producto.nombre}. "
-                            f"Disponible: {producto.stock}, Solicitado: {cantidad}"
-                        )
-                    
-                    precio_unitario = item.get('precio_unitario', producto.precio)
-                    monto = precio_unitario * cantidad
-                    subtotal += monto
-                    
-                    venta_items_data.append({
-                        'tipo': 'producto',
-                        'producto_id': producto.id,
-                        'receta_id': None,
-                        'cantidad': cantidad,
-                        'precio_unitario': precio_unitario,
-                        'monto': monto,
-                        'observaciones': item.get('observaciones', ''),
-                        'es_receta': False,
-                        'explosion_detalles': {}
-                    })
-                
-                elif tipo == 'receta':
-                    # Item es una receta - requiere explosión
-                    receta = Receta.query.get(item['id'])
-                    if not receta:
-                        raise ValueError(f"Receta {item['id']} no encontrada")
-                    
-                    precio_unitario = item.get('precio_unitario', receta.precio_venta)
-                    monto = precio_unitario * cantidad
-                    subtotal += monto
-                    
-                    # Procesar explosión de ingredientes
-                    explosion = VentasServiceAvanzado._procesar_explosion_receta(
-                        receta, cantidad, descuentos_inventario
-                    )
-                    
-                    # Crear producto dummy para vincular el VentaItem
-                    # (La receta se vincula directamente)
-                    venta_items_data.append({
-                        'tipo': 'receta',
-                        'producto_id': None,
-                        'receta_id': receta.id,
-                        'cantidad': cantidad,
-                        'precio_unitario': precio_unitario,
-                        'monto': monto,
-                        'observaciones': item.get('observaciones', ''),
-                        'es_receta': True,
-                        'explosion_detalles': explosion
-                    })
-            
-            # Validar stock para todos los ingredientes explosionados
-            VentasServiceAvanzado._validar_stock_ingredientes(descuentos_inventario)
+            # Resolver todo el carrito con una consulta IN por modelo
+            catalogo = VentasServiceAvanzado._cargar_catalogo(items)
             
-            # Calcular montos finales
-            descuento_monto = round(subtotal * (descuento / 100), 2)
-            subtotal_desc = subtotal - descuento_monto
-            iva = round(subtotal_desc * 0.19, 2)
-            propina = round(subtotal_desc * 0.10, 2)
-            total = subtotal_desc + iva + propina
-            
-            # Crear venta
             # Obtener nombre del usuario
             usuario = Usuario.query.get(usuario_id)
             usuario_nombre = usuario.nombre if usuario else f"Usuario {usuario_id}"
             
-            venta = Venta(
-                usuario_id=usuario_id,
-                usuario=usuario_nombre,
-                cliente_nombre=cliente_nombre,
-                numero_mesa=numero_mesa,
-                subtotal=subtotal,
-                descuento=descuento_monto,
-                iva=iva,
-                propina=propina,
-                total=total
+            preparada = VentasServiceAvanzado._preparar_venta(items, descuento, catalogo)
+            venta = VentasServiceAvanzado._registrar_venta(
+                preparada, usuario_id, usuario_nombre, cliente_nombre, numero_mesa,
+                clave_idempotencia=clave_idempotencia, codigo_reserva=codigo_reserva
             )
             
-            db.session.add(venta)
-            db.session.flush()  # Para obtener el ID
-            
-            # Agregar items y descontar stock
-            for item_data in venta_items_data:
-                venta_item = VentaItem(
-                    venta_id=venta.id,
-                    producto_id=item_data['producto_id'],
-                    receta_id=item_data['receta_id'],
-                    cantidad=item_data['cantidad'],
-                    precio_unitario=item_data['precio_unitario'],
-                    subtotal=item_data['monto'],
-                    observaciones=item_data['observaciones'],
-                    es_receta=item_data['es_receta'],
-                    explosion_detalles=json.dumps(item_data['explosion_detalles'])
-                )
-                db.session.add(venta_item)
+            db.session.commit()
+            
+            # Generar comprobantes fuera de la petición
+            GeneradorComandas.encolar(venta.id)
+            
+            return VentasServiceAvanzado._resultado_venta(venta, preparada)
+        
+        except exc.IntegrityError:
+            db.session.rollback()
+            # Otro reintento con la misma clave se registró primero
+            existente = clave_idempotencia and VentasServiceAvanzado._buscar_venta_por_clave(
+                usuario_id, clave_idempotencia
+            )
+            if existente:
+                return VentasServiceAvanzado._resultado_venta_existente(existente)
+            raise
+        
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+    @staticmethod
+    def crear_ventas_lote(usuario_id, ventas):
+        """
+        Registra un lote de ventas (p. ej. tablets que vuelven a tener conexión)
+        en una sola transacción, compartiendo la carga del catálogo y la explosión.
+        
+        Cada venta se aplica dentro de un savepoint: si una falla (stock, item
+        inexistente, datos inválidos) se informa en su resultado y el resto sigue.
+        Las comandas de las ventas nuevas se encolan después del commit.
+        
+        Args:
+            usuario_id: ID del usuario
+            ventas: Lista de {items, cliente_nombre, numero_mesa, descuento, created_at,
+                              referencia, clave_idempotencia}
+                created_at: fecha/hora ISO 8601 en que el cliente registró la venta
+                referencia: identificador opcional del cliente, se devuelve en el resultado
+                codigo_reserva: reserva de stock del carrito, que la venta consume
+                clave_idempotencia: si ya existe una venta con esa clave se devuelve
+                    su resultado (marcado como 'repetida') en vez de registrarla otra vez
+        
+        Returns:
+            dict con totales y un resultado por venta, en el mismo orden recibido
+        """
+        if not ventas:
+            raise ValueError("El lote debe contener al menos una venta")
+        
+        if len(ventas) > VentasServiceAvanzado.MAX_VENTAS_LOTE:
+            raise ValueError(f"El lote no puede superar {VentasServiceAvanzado.MAX_VENTAS_LOTE} ventas")
+        
+        try:
+            # Un solo catálogo para todas las ventas del lote
+            todos_items = [item for venta in ventas for item in (venta.get('items') or [])]
+            catalogo = VentasServiceAvanzado._cargar_catalogo(todos_items)
+            
+            usuario = Usuario.query.get(usuario_id)
+            usuario_nombre = usuario.nombre if usuario else f"Usuario {usuario_id}"
+            
+            # Ventas ya registradas en sincronizaciones anteriores (una consulta por índice)
+            claves = {datos.get('clave_idempotencia') for datos in ventas} - {None, ''}
+            existentes = {}
+            if claves:
+                existentes = {
+                    v.clave_idempotencia: v
+                    for v in Venta.query.filter(Venta.clave_idempotencia.in_(claves)).all()
+                }
+            
+            resultados = []
+            nuevas = []
+            for indice, datos in enumerate(ventas):
+                resultado = {'indice': indice, 'referencia': datos.get('referencia')}
+                clave = datos.get('clave_idempotencia') or None
+                try:
+                    VentasServiceAvanzado._validar_clave_idempotencia(clave)
+                    
+                    if clave in existentes:
+                        if existentes[clave].usuario_id != usuario_id:
+                            raise ValueError("La clave de idempotencia pertenece a otra venta")
+                        resultado.update({
+                            'success': True,
+                            'data': VentasServiceAvanzado._resultado_venta_existente(existentes[clave])
+                        })
+                        resultados.append(resultado)
+                        continue
+                    
+                    items = datos.get('items') or []
+                    descuento = datos.get('descuento', 0)
+                    VentasServiceAvanzado._validar_datos_venta(items, descuento)
+                    fecha = VentasServiceAvanzado._parsear_fecha_cliente(datos.get('created_at'))
+                    
+                    with db.session.begin_nested():
+                        preparada = VentasServiceAvanzado._preparar_venta(items, descuento, catalogo)
+                        venta = VentasServiceAvanzado._registrar_venta(
+                            preparada, usuario_id, usuario_nombre,
+                            datos.get('cliente_nombre', ''), datos.get('numero_mesa', ''),
+                            created_at=fecha, clave_idempotencia=clave,
+                            codigo_reserva=datos.get('codigo_reserva')
+                        )
+                    
+                    nuevas.append(venta.id)
+                    if clave:
+                        existentes[clave] = venta
+                    resultado.update({
+                        'success': True,
+                        'data': VentasServiceAvanzado._resultado_venta(venta, preparada)
+                    })
+                except exc.IntegrityError:
+                    # Otra sincronización registró la misma clave mientras procesábamos el lote
+                    existente = clave and VentasServiceAvanzado._buscar_venta_por_clave(usuario_id, clave)
+                    if existente:
+                        resultado.update({
+                            'success': True,
+                            'data': VentasServiceAvanzado._resultado_venta_existente(existente)
+                        })
+                    else:
+                        resultado.update({'success': False, 'message': 'Error de integridad al registrar la venta'})
+                except (ValueError, KeyError, TypeError) as e:
+                    resultado.update({'success': False, 'message': str(e)})
                 
-                # Descontar stock de productos
-                if item_data['producto_id']:
-                    producto = Producto.query.get(item_data['producto_id'])
-                    producto.stock -= item_data['cantidad']
-            
-            # Descontar ingredientes (explosión)
-            for ingrediente_id, cantidad_total in descuentos_inventario.items():
-                ingrediente = Ingrediente.query.get(ingrediente_id)
-                if ingrediente:
-                    # Descontar del stock actual
-                    ingrediente.stock_actual = (ingrediente.stock_actual or 0) - cantidad_total
+                resultados.append(resultado)
             
             db.session.commit()
             
-            # Generar comprobantes
-            comanda_cocina = VentasServiceAvanzado._generar_comanda(venta, 'cocina')
-            comanda_caja = VentasServiceAvanzado._generar_comanda(venta, 'caja')
+            # Generar comprobantes fuera de la petición (las repetidas ya los tienen)
+            for venta_id in nuevas:
+                GeneradorComandas.encolar(venta_id)
             
+            exitosas = sum(1 for r in resultados if r['success'])
             return {
-                'venta_id': venta.id,
-                'cliente': cliente_nombre,
-                'mesa': numero_mesa,
-                'subtotal': subtotal,
-                'descuento': descuento_monto,
-                'iva': iva,
-                'propina': propina,
-                'total': total,
-                'items': len(venta_items_data),
-                'explosion_detalles': descuentos_inventario,
-                'comanda_cocina_id': comanda_cocina.id,
-                'comanda_caja_id': comanda_caja.id
+                'procesadas': len(resultados),
+                'exitosas': exitosas,
+                'fallidas': len(resultados) - exitosas,
+                'resultados': resultados
             }
         
         except Exception as e:
@@ -191,72 +229,514 @@ class VentasServiceAvanzado:
             raise e
 
     @staticmethod
-    def _procesar_explosion_receta(receta, cantidad_recetas, descuentos_tracking):
+    def _validar_datos_venta(items, descuento):
+        """Validaciones básicas de una venta antes de tocar la base de datos"""
+        if not items:
+            raise ValueError("La venta debe contener al menos un item")
+        
+        if not 0 <= descuento <= 100:
+            raise ValueError("Descuento debe estar entre 0 y 100")
+
+    @staticmethod
+    def _validar_clave_idempotencia(clave_idempotencia):
+        """La clave es opcional, pero si viene debe caber en la columna indexada"""
+        if clave_idempotencia is not None and not 0 < len(str(clave_idempotencia)) <= 64:
+            raise ValueError("La clave de idempotencia debe tener entre 1 y 64 caracteres")
+
+    @staticmethod
+    def _buscar_venta_por_clave(usuario_id, clave_idempotencia):
+        """
+        Busca una venta por su clave de idempotencia (índice único).
+        
+        Raises:
+            ValueError: si la clave pertenece a una venta de otro usuario
+        """
+        venta = Venta.query.filter_by(clave_idempotencia=clave_idempotencia).first()
+        if venta and venta.usuario_id != usuario_id:
+            raise ValueError("La clave de idempotencia pertenece a otra venta")
+        return venta
+
+    @staticmethod
+    def _parsear_fecha_cliente(valor):
+        """
+        Convierte la fecha ISO 8601 enviada por el cliente a UTC sin zona horaria
+        (como se guardan las fechas en la base). Sin fecha se usa la hora actual.
+        """
+        if not valor:
+            return datetime.utcnow()
+        
+        try:
+            fecha = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Fecha inválida: {valor}. Use formato ISO 8601")
+        
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        return fecha
+
+    @staticmethod
+    def _preparar_venta(items, descuento, catalogo):
         """
-        Procesa la explosión de una receta de forma recursiva (maneja sub-recetas)
+        Valida los items contra el catálogo cargado, explota recetas y calcula montos.
+        No escribe en la base de datos.
         
         Returns:
-            dict con detalles de ingredientes descontados
+            dict con items, descuentos de stock y montos de la venta
         """
-        explosion = {}
+        subtotal = 0
+        venta_items_data = []
+        descuentos_productos = {}  # Unidades a descontar por producto
+        descuentos_inventario = {}  # Tracking de ingredientes descontados
         
-        for item in receta.ingredientes:
-            cantidad_total_item = item.cantidad * cantidad_recetas
+        for item in items:
+            tipo = item.get('tipo', 'producto')
+            cantidad = item.get('cantidad', 1)
             
-            if item.ingrediente_id:
-                # Es un ingrediente directo
-                ingrediente_id = item.ingrediente_id
+            if tipo == 'producto':
+                # Item es un producto simple
+                producto = catalogo['productos'].get(item['id'])
+                if not producto:
+                    raise ValueError(f"Producto {item['id']} no encontrado")
                 
-                # Tracking de total descontado por ingrediente
-                if ingrediente_id not in descuentos_tracking:
-                    descuentos_tracking[ingrediente_id] = 0
-                descuentos_tracking[ingrediente_id] += cantidad_total_item
+                # Acumular por producto: dos líneas del mismo producto comparten stock
+                descuentos_productos[producto.id] = descuentos_productos.get(producto.id, 0) + cantidad
+                if (producto.stock or 0) < descuentos_productos[producto.id]:
+                    raise ValueError(
+                        f"Stock insuficiente de {producto.nombre}. "
+                        f"Disponible: {producto.stock}, Solicitado: {descuentos_productos[producto.id]}"
+                    )
                 
-                # Detalles de explosión
-                clave = f"ing_{ingrediente_id}"
-                if clave not in explosion:
-                    explosion[clave] = {
-                        'ingrediente_id': ingrediente_id,
-                        'ingrediente_nombre': item.ingrediente.nombre,
-                        'unidad': item.ingrediente.unidad_medida,
-                        'cantidad_por_receta': item.cantidad,
-                        'cantidad_total': 0, # Se suma abajo
-                        'costo_unitario': item.ingrediente.costo_unitario,
-                        'costo_total': 0
-                    }
+                precio_unitario = item.get('precio_unitario', producto.precio)
+                monto = precio_unitario * cantidad
+                subtotal += monto
                 
-                explosion[clave]['cantidad_total'] += cantidad_total_item
-                explosion[clave]['costo_total'] = round(explosion[clave]['cantidad_total'] * item.ingrediente.costo_unitario, 2)
+                venta_items_data.append({
+                    'tipo': 'producto',
+                    'producto_id': producto.id,
+                    'receta_id': None,
+                    'cantidad': cantidad,
+                    'precio_unitario': precio_unitario,
+                    'monto': monto,
+                    'observaciones': item.get('observaciones', ''),
+                    'es_receta': False,
+                    'explosion_detalles': {}
+                })
+            
+            elif tipo == 'receta':
+                # Item es una receta - requiere explosión
+                receta = catalogo['recetas'].get(item['id'])
+                if not receta:
+                    raise ValueError(f"Receta {item['id']} no encontrada")
+                
+                precio_unitario = item.get('precio_unitario', receta.precio_venta)
+                monto = precio_unitario * cantidad
+                subtotal += monto
                 
-            elif item.sub_receta_id:
-                # Es una sub-receta: Recursión
-                sub_receta = item.sub_receta
-                sub_explosion = VentasServiceAvanzado._procesar_explosion_receta(
-                    sub_receta, cantidad_total_item, descuentos_tracking
+                # Procesar explosión de ingredientes
+                explosion = VentasServiceAvanzado._procesar_explosion_receta(
+                    receta, cantidad, descuentos_inventario, catalogo
                 )
                 
-                # Agregar detalles de la sub-receta (solo informativo o visualización)
-                # La explosión real (stock) ocurre dentro de la llamada recursiva al llenar 'descuentos_tracking'
-                clave = f"sub_{sub_receta.id}"
-                explosion[clave] = {
-                    'tipo': 'subreceta',
-                    'nombre': sub_receta.nombre,
-                    'cantidad': cantidad_total_item,
-                    'items_descontados': sub_explosion
+                # Crear producto dummy para vincular el VentaItem
+                # (La receta se vincula directamente)
+                venta_items_data.append({
+                    'tipo': 'receta',
+                    'producto_id': None,
+                    'receta_id': receta.id,
+                    'cantidad': cantidad,
+                    'precio_unitario': precio_unitario,
+                    'monto': monto,
+                    'observaciones': item.get('observaciones', ''),
+                    'es_receta': True,
+                    'explosion_detalles': explosion
+                })
+        
+        # Validar stock para todos los ingredientes explosionados
+        VentasServiceAvanzado._validar_stock_ingredientes(descuentos_inventario, catalogo['ingredientes'])
+        
+        # Calcular montos finales
+        descuento_monto = round(subtotal * (descuento / 100), 2)
+        subtotal_desc = subtotal - descuento_monto
+        iva = round(subtotal_desc * 0.19, 2)
+        propina = round(subtotal_desc * 0.10, 2)
+        total = subtotal_desc + iva + propina
+        
+        return {
+            'items': venta_items_data,
+            'descuentos_productos': descuentos_productos,
+            'descuentos_inventario': descuentos_inventario,
+            'subtotal': subtotal,
+            'descuento': descuento_monto,
+            'iva': iva,
+            'propina': propina,
+            'total': total
+        }
+
+    @staticmethod
+    def _registrar_venta(preparada, usuario_id, usuario_nombre, cliente_nombre, numero_mesa, created_at=None,
+                         clave_idempotencia=None, codigo_reserva=None):
+        """
+        Inserta la venta y sus items y descuenta el stock, sin hacer commit.
+        Las reservas del carrito (codigo_reserva) se consumen: se borran en la
+        misma transacción, antes del descuento, para que no cuenten como ocupadas.
+        
+        Returns:
+            Venta creada (con ID asignado)
+        """
+        created_at = created_at or datetime.utcnow()
+        
+        venta = Venta(
+            usuario_id=usuario_id,
+            usuario=usuario_nombre,
+            cliente_nombre=cliente_nombre,
+            numero_mesa=numero_mesa,
+            subtotal=preparada['subtotal'],
+            descuento=preparada['descuento'],
+            iva=preparada['iva'],
+            propina=preparada['propina'],
+            total=preparada['total'],
+            clave_idempotencia=clave_idempotencia,
+            created_at=created_at
+        )
+        
+        db.session.add(venta)
+        db.session.flush()  # Para obtener el ID
+        
+        # Agregar items: un solo INSERT por lotes; los IDs vuelven en el orden de las filas
+        items_tabla = VentaItem.__table__
+        item_ids = db.session.execute(
+            items_tabla.insert().returning(items_tabla.c.id, sort_by_parameter_order=True),
+            [
+                {
+                    'venta_id': venta.id,
+                    'producto_id': item_data['producto_id'],
+                    'receta_id': item_data['receta_id'],
+                    'cantidad': item_data['cantidad'],
+                    'precio_unitario': item_data['precio_unitario'],
+                    'subtotal': item_data['monto'],
+                    'observaciones': item_data['observaciones'],
+                    'es_receta': item_data['es_receta'],
+                    'created_at': created_at
                 }
+                for item_data in preparada['items']
+            ]
+        ).scalars().all()
+        
+        # Consumo de ingredientes por línea (un executemany para toda la venta)
+        consumos = [
+            {
+                'venta_item_id': item_id,
+                'ingrediente_id': info['ingrediente_id'],
+                'cantidad': info['cantidad_total'],
+                'costo_unitario': info['costo_unitario']
+            }
+            for item_id, item_data in zip(item_ids, preparada['items'])
+            for info in item_data['explosion_detalles'].values()
+        ]
+        if consumos:
+            db.session.execute(VentaItemConsumo.__table__.insert(), consumos)
+        
+        ReservasStock.liberar(codigo_reserva, usuario_id)
+        
+        # Descontar stock de productos e ingredientes (explosión) en bloque
+        VentasServiceAvanzado.descontar_stock(
+            preparada['descuentos_productos'], preparada['descuentos_inventario']
+        )
+        LibroInventario.registrar(LibroInventario.VENTA, [
+            *((LibroInventario.PRODUCTO, producto_id, -cantidad, venta.id)
+              for producto_id, cantidad in sorted(preparada['descuentos_productos'].items())),
+            *((LibroInventario.INGREDIENTE, ingrediente_id, -cantidad, venta.id)
+              for ingrediente_id, cantidad in sorted(preparada['descuentos_inventario'].items()))
+        ])
+        ResumenVentas.registrar_venta(venta, preparada)
+        
+        return venta
+
+    @staticmethod
+    def _resultado_venta(venta, preparada):
+        """Respuesta estándar de una venta creada"""
+        return {
+            'venta_id': venta.id,
+            'cliente': venta.cliente_nombre,
+            'mesa': venta.numero_mesa,
+            'subtotal': preparada['subtotal'],
+            'descuento': preparada['descuento'],
+            'iva': preparada['iva'],
+            'propina': preparada['propina'],
+            'total': preparada['total'],
+            'items': len(preparada['items']),
+            'explosion_detalles': preparada['descuentos_inventario'],
+            'created_at': venta.created_at.isoformat(),
+            'repetida': False
+        }
+
+    @staticmethod
+    def _resultado_venta_existente(venta):
+        """
+        Reconstruye la respuesta de una venta ya registrada (reintento con la misma
+        clave de idempotencia).
+        """
+        descuentos_inventario = dict(
+            db.session.query(
+                VentaItemConsumo.ingrediente_id, func.sum(VentaItemConsumo.cantidad)
+            ).join(
+                VentaItem, VentaItem.id == VentaItemConsumo.venta_item_id
+            ).filter(
+                VentaItem.venta_id == venta.id
+            ).group_by(VentaItemConsumo.ingrediente_id).all()
+        )
+        
+        return {
+            'venta_id': venta.id,
+            'cliente': venta.cliente_nombre,
+            'mesa': venta.numero_mesa,
+            'subtotal': venta.subtotal,
+            'descuento': venta.descuento,
+            'iva': venta.iva,
+            'propina': venta.propina,
+            'total': venta.total,
+            'items': len(venta.items),
+            'explosion_detalles': descuentos_inventario,
+            'created_at': venta.created_at.isoformat(),
+            'repetida': True
+        }
+
+    @staticmethod
+    def _cargar_catalogo(items):
+        """
+        Carga en memoria todo lo necesario para procesar un carrito:
+        productos, recetas, sus vectores de ingredientes aplanados e ingredientes.
+        
+        Usa una consulta IN por modelo en lugar de un .get() por item, así el
+        número de consultas no crece con el carrito. Los vectores de las recetas
+        salen de la caché de ExplosionRecetas.
+        
+        Returns:
+            dict {productos, recetas, vectores, ingredientes} indexados por ID
+        """
+        producto_ids = {item['id'] for item in items if item.get('tipo', 'producto') == 'producto'}
+        receta_ids = {item['id'] for item in items if item.get('tipo') == 'receta'}
+        
+        productos = {}
+        if producto_ids:
+            productos = {p.id: p for p in Producto.query.filter(Producto.id.in_(producto_ids)).all()}
+        
+        recetas = {}
+        vectores = {}
+        if receta_ids:
+            recetas = {r.id: r for r in Receta.query.filter(Receta.id.in_(receta_ids)).all()}
+            vectores = ExplosionRecetas.vectores(recetas.keys())
+        
+        ingrediente_ids = {iid for vector in vectores.values() for iid in vector}
+        ingredientes = {}
+        if ingrediente_ids:
+            ingredientes = {
+                i.id: i for i in Ingrediente.query.filter(Ingrediente.id.in_(ingrediente_ids)).all()
+            }
+        
+        return {
+            'productos': productos,
+            'recetas': recetas,
+            'vectores': vectores,
+            'ingredientes': ingredientes
+        }
+
+    @staticmethod
+    def _procesar_explosion_receta(receta, cantidad_recetas, descuentos_tracking, catalogo=None):
+        """
+        Procesa la explosión de una receta usando su vector de ingredientes aplanado
+        (las sub-recetas ya vienen resueltas en el vector)
+        
+        catalogo: resultado de _cargar_catalogo; si no se entrega se carga para esta receta
+        
+        Returns:
+            dict con detalles de ingredientes descontados
+        """
+        if catalogo is None:
+            catalogo = VentasServiceAvanzado._cargar_catalogo([{'tipo': 'receta', 'id': receta.id}])
+        
+        explosion = {}
+        
+        for ingrediente_id, cantidad_por_receta in catalogo['vectores'].get(receta.id, {}).items():
+            ingrediente = catalogo['ingredientes'].get(ingrediente_id)
+            if not ingrediente:
+                continue
+            
+            cantidad_total = cantidad_por_receta * cantidad_recetas
+            
+            # Tracking de total descontado por ingrediente
+            descuentos_tracking[ingrediente_id] = descuentos_tracking.get(ingrediente_id, 0) + cantidad_total
+            
+            # Detalles de explosión
+            explosion[f"ing_{ingrediente_id}"] = {
+                'ingrediente_id': ingrediente_id,
+                'ingrediente_nombre': ingrediente.nombre,
+                'unidad': ingrediente.unidad_medida,
+                'cantidad_por_receta': cantidad_por_receta,
+                'cantidad_total': cantidad_total,
+                'costo_unitario': ingrediente.costo_unitario,
+                'costo_total': round(cantidad_total * ingrediente.costo_unitario, 2)
+            }
         
         return explosion
 
     @staticmethod
-    def _validar_stock_ingredientes(descuentos_tracking):
+    def descontar_stock(descuentos_productos, descuentos_inventario):
         """
-        Valida que haya suficiente stock de ingredientes
-        En este caso, solo registramos el uso (ingredientes no tienen stock limit)
+        Descuenta stock con UPDATE condicionales (stock = stock - n WHERE
+        stock - reservado_por_otros >= n), un executemany por tabla y siempre
+        en el mismo orden (productos y luego ingredientes, cada uno por ID)
+        para que cajas concurrentes no se pisen ni se bloqueen en orden cruzado.
+        Sin commit; también lo usan la venta simple y las mermas de productos.
+        
+        Los demás cambios de stock (compras, mermas de ingredientes, ajustes)
+        también se escriben como stock = stock +/- n en SQL, nunca leyendo,
+        calculando y asignando, para no pisar estos descuentos.
+        
+        Args:
+            descuentos_productos: dict {producto_id: cantidad}
+            descuentos_inventario: dict {ingrediente_id: cantidad}
+        
+        Raises:
+            ValueError: si alguna fila no tiene stock suficiente; en ese caso no se descuenta nada
         """
-        pass
+        productos = Producto.__table__
+        ingredientes = Ingrediente.__table__
+        stock_producto = func.coalesce(productos.c.stock, 0)
+        stock_ingrediente = func.coalesce(ingredientes.c.stock_actual, 0)
+        
+        # Las reservas vigentes de otros carritos no están disponibles
+        guardia_productos = stock_producto - ReservasStock.subconsulta_reservado(
+            'producto', productos.c.id
+        ) >= bindparam('b_cantidad')
+        
+        if VentasServiceAvanzado.PERMITIR_STOCK_NEGATIVO_INGREDIENTES:
+            guardia_ingredientes = true()
+        else:
+            guardia_ingredientes = stock_ingrediente - ReservasStock.subconsulta_reservado(
+                'ingrediente', ingredientes.c.id
+            ) >= bindparam('b_cantidad')
+        
+        operaciones = [
+            (productos, productos.c.stock, stock_producto, guardia_productos, descuentos_productos),
+            (ingredientes, ingredientes.c.stock_actual, stock_ingrediente, guardia_ingredientes, descuentos_inventario)
+        ]
+        
+        try:
+            with db.session.begin_nested():
+                for tabla, columna, stock, guardia, descuentos in operaciones:
+                    if not descuentos:
+                        continue
+                    
+                    parametros = [{'b_id': key, 'b_cantidad': descuentos[key]} for key in sorted(descuentos)]
+                    resultado = db.session.execute(
+                        tabla.update()
+                        .where(tabla.c.id == bindparam('b_id'), guardia)
+                        .values({columna: stock - bindparam('b_cantidad')}),
+                        parametros
+                    )
+                    
+                    if resultado.rowcount != len(parametros):
+                        raise ValueError("Stock insuficiente")
+        
+        except ValueError:
+            # El savepoint ya se revirtió: el stock leído ahora es el previo al descuento
+            raise ValueError(VentasServiceAvanzado._describir_faltantes(
+                descuentos_productos, descuentos_inventario
+            ))
+
+    @staticmethod
+    def _describir_faltantes(descuentos_productos, descuentos_inventario):
+        """Arma el mensaje de stock insuficiente para las filas que no alcanzan"""
+        faltantes = []
+        reservado = ReservasStock.reservado(descuentos_productos, descuentos_inventario)
+        
+        if descuentos_productos:
+            for producto_id, nombre, stock in db.session.query(
+                Producto.id, Producto.nombre, Producto.stock
+            ).filter(Producto.id.in_(descuentos_productos)).order_by(Producto.id):
+                disponible = (stock or 0) - reservado.get(('producto', producto_id), 0)
+                if disponible < descuentos_productos[producto_id]:
+                    faltantes.append(
+                        f"{nombre}. Disponible: {disponible}, Solicitado: {descuentos_productos[producto_id]}"
+                    )
+        
+        if descuentos_inventario and not VentasServiceAvanzado.PERMITIR_STOCK_NEGATIVO_INGREDIENTES:
+            for ingrediente_id, nombre, stock, unidad in db.session.query(
+                Ingrediente.id, Ingrediente.nombre, Ingrediente.stock_actual, Ingrediente.unidad_medida
+            ).filter(Ingrediente.id.in_(descuentos_inventario)).order_by(Ingrediente.id):
+                disponible = (stock or 0) - reservado.get(('ingrediente', ingrediente_id), 0)
+                if disponible < descuentos_inventario[ingrediente_id]:
+                    faltantes.append(
+                        f"{nombre}. Disponible: {round(disponible, 3)}{unidad}, "
+                        f"Solicitado: {round(descuentos_inventario[ingrediente_id], 3)}{unidad}"
+                    )
+        
+        if not faltantes:
+            return "Stock insuficiente: el inventario cambió durante la venta, intente nuevamente"
+        
+        return "Stock insuficiente de " + "; ".join(faltantes)
+
+    @staticmethod
+    def _validar_stock_ingredientes(descuentos_tracking, ingredientes):
+        """
+        Valida contra el stock ya cargado que haya suficiente de cada ingrediente.
+        Es solo un rechazo temprano: la validación definitiva la hace el UPDATE
+        condicional de descontar_stock.
+        """
+        if VentasServiceAvanzado.PERMITIR_STOCK_NEGATIVO_INGREDIENTES:
+            return
+        
+        for ingrediente_id in sorted(descuentos_tracking):
+            ingrediente = ingredientes.get(ingrediente_id)
+            requerido = descuentos_tracking[ingrediente_id]
+            if ingrediente and (ingrediente.stock_actual or 0) < requerido:
+                raise ValueError(
+                    f"Stock insuficiente de {ingrediente.nombre}. "
+                    f"Disponible: {round(ingrediente.stock_actual or 0, 3)}{ingrediente.unidad_medida}, "
+                    f"Solicitado: {round(requerido, 3)}{ingrediente.unidad_medida}"
+                )
 
     # ======================== COMPROBANTES ========================
 
+    @staticmethod
+    def generar_comandas_venta(venta_id):
+        """
+        Genera en una sola transacción las comandas que falten de una venta
+        (lo ejecuta el GeneradorComandas en segundo plano)
+        """
+        venta = Venta.query.options(
+            *PlantillasComprobantes.opciones_carga()
+        ).filter_by(id=venta_id).first()
+        
+        if not venta:
+            return []
+        
+        existentes = {
+            tipo for (tipo,) in db.session.query(Comanda.tipo_comanda).filter(Comanda.venta_id == venta_id)
+        }
+        
+        # La vista de la venta se arma una vez para ambas comandas
+        vista = PlantillasComprobantes.vista_venta(venta)
+        comandas = []
+        for tipo_comanda in ('cocina', 'caja'):
+            if tipo_comanda not in existentes:
+                comandas.append(VentasServiceAvanzado._construir_comanda(venta, tipo_comanda, vista))
+        
+        if not comandas:
+            return []
+        
+        try:
+            db.session.add_all(comandas)
+            db.session.commit()
+        except exc.IntegrityError:
+            # Se generaron al mismo tiempo desde GET /comanda
+            db.session.rollback()
+            return []
+        
+        return comandas
+
     @staticmethod
     def _generar_comanda(venta, tipo_comanda):
         """
@@ -273,240 +753,37 @@ class VentasServiceAvanzado:
         if comanda_existente:
             return comanda_existente
         
+        comanda = VentasServiceAvanzado._construir_comanda(venta, tipo_comanda)
+        
+        try:
+            db.session.add(comanda)
+            db.session.commit()
+        except exc.IntegrityError:
+            # El generador en segundo plano la creó primero
+            db.session.rollback()
+            comanda = Comanda.query.filter_by(venta_id=venta.id, tipo_comanda=tipo_comanda).first()
+        
+        return comanda
+
+    @staticmethod
+    def _construir_comanda(venta, tipo_comanda, vista=None):
+        """Arma (sin guardar) la comanda con su contenido HTML y texto"""
+        if vista is None:
+            vista = PlantillasComprobantes.vista_venta(venta)
+        
         # Generar contenido según tipo
         if tipo_comanda == 'cocina':
-            html, texto = VentasServiceAvanzado._generar_comanda_cocina(venta)
+            html, texto = PlantillasComprobantes.comanda_cocina(vista)
         else:  # caja
-            html, texto = VentasServiceAvanzado._generar_comanda_caja(venta)
+            html, texto = PlantillasComprobantes.comanda_caja(vista)
         
-        comanda = Comanda(
+        return Comanda(
             venta_id=venta.id,
             tipo_comanda=tipo_comanda,
             contenido_html=html,
-            contenido_texto=texto
+            contenido_texto=texto,
+            contenido_escpos=PlantillasComprobantes.escpos(vista, tipo_comanda)
         )
-        
-        db.session.add(comanda)
-        db.session.commit()
-        
-        return comanda
-
-    @staticmethod
-    def _generar_comanda_cocina(venta):
-        """
-        Genera comanda para cocina con detalles de productos e ingredientes
-        """
-        html = f"""
-        <div style="font-family: monospace; max-width: 400px; padding: 10px;">
-            <h2 style="text-align: center; margin: 5px 0;">👨‍🍳 COMANDA COCINA</h2>
-            <hr style="margin: 5px 0;">
-            <p><strong>Orden:</strong> #{venta.id}</p>
-            <p><strong>Hora:</strong> {venta.created_at.strftime('%H:%M:%S')}</p>
-            <p><strong>Mesa:</strong> {venta.numero_mesa or 'N/A'}</p>
-            <hr style="margin: 5px 0;">
-            <h3 style="margin: 10px 0; border-bottom: 2px solid black;">PRODUCTOS</h3>
-        """
-        
-        texto = f"""
-╔════════════════════════════════════╗
-║      👨‍🍳 COMANDA COCINA           ║
-╠════════════════════════════════════╣
-Orden: #{venta.id}
-Hora: {venta.created_at.strftime('%H:%M:%S')}
-Mesa: {venta.numero_mesa or 'N/A'}
-╠════════════════════════════════════╣
-        """
-        
-        for item in venta.items:
-            if item.es_receta:
-                # Mostrar receta y detalles de ingredientes
-                receta = item.receta
-                html += f"""
-                <div style="margin: 10px 0; padding: 8px; border: 1px solid #ccc; background: #fffacd;">
-                    <strong style="font-size: 1.2em;">🍽️ {receta.nombre}</strong><br>
-                    <span style="color: red; font-size: 1.5em; font-weight: bold;">x{item.cantidad}</span>
-                """
-                
-                texto += f"\n🍽️  {receta.nombre} x{item.cantidad}\n"
-                
-                # Detalles de ingredientes
-                try:
-                    explosion = json.loads(item.explosion_detalles)
-                    for ing_key, ing_data in explosion.items():
-                        html += f"""
-                        <br><small>
-                            • {ing_data['cantidad_total']}{ing_data['unidad']} de {ing_data['ingrediente_nombre']}
-                        </small>
-                        """
-                        texto += f"   → {ing_data['cantidad_total']}{ing_data['unidad']} {ing_data['ingrediente_nombre']}\n"
-                except:
-                    pass
-                
-                # Observaciones
-                if item.observaciones:
-                    html += f"<br><em style='color: red;'>⚠️ {item.observaciones}</em>"
-                    texto += f"   ⚠️  NOTA: {item.observaciones}\n"
-                
-                html += "</div>"
-            else:
-                # Producto simple
-                html += f"""
-                <div style="margin: 8px 0; padding: 5px; border-bottom: 1px dotted #ccc;">
-                    <strong>{item.producto.nombre}</strong> x{item.cantidad}
-                """
-                
-                texto += f"\n📦 {item.producto.nombre} x{item.cantidad}\n"
-                
-                if item.observaciones:
-                    html += f"<br><small style='color: red;'>⚠️ {item.observaciones}</small>"
-                    texto += f"   ⚠️  {item.observaciones}\n"
-                
-                html += "</div>"
-        
-        html += """
-            <hr style="margin: 10px 0;">
-            <p style="text-align: center; font-size: 0.9em; margin-top: 20px;">
-                <strong>Marque cuando esté listo</strong><br>
-                __ Cocina __ QA
-            </p>
-        </div>
-        """
-        
-        texto += """
-╠════════════════════════════════════╣
-         ☐ Marca cuando esté listo
-╚════════════════════════════════════╝
-        """
-        
-        return html, texto
-
-    @staticmethod
-    def _generar_comanda_caja(venta):
-        """
-        Genera recibo para caja/cajero
-        """
-        usuario = Usuario.query.get(venta.usuario_id)
-        usuario_nombre = usuario.nombre if usuario else "Sistema"
-        
-        html = f"""
-        <div style="font-family: monospace; max-width: 400px; padding: 15px; background: white;">
-            <div style="text-align: center; margin-bottom: 15px;">
-                <h2 style="margin: 5px 0;">🧾 RECIBO DE VENTA</h2>
-                <p style="font-size: 0.9em; color: #666;">Carbon & Cheddar</p>
-            </div>
-            
-            <hr style="margin: 10px 0;">
-            
-            <table style="width: 100%; font-size: 0.95em;">
-                <tr>
-                    <td><strong>Recibo #:</strong></td>
-                    <td style="text-align: right;">{venta.id}</td>
-                </tr>
-                <tr>
-                    <td><strong>Fecha:</strong></td>
-                    <td style="text-align: right;">{venta.created_at.strftime('%d/%m/%Y')}</td>
-                </tr>
-                <tr>
-                    <td><strong>Hora:</strong></td>
-                    <td style="text-align: right;">{venta.created_at.strftime('%H:%M:%S')}</td>
-                </tr>
-                <tr>
-                    <td><strong>Cajero:</strong></td>
-                    <td style="text-align: right;">{usuario_nombre}</td>
-                </tr>
-                {f'<tr><td><strong>Cliente:</strong></td><td style="text-align: right;">{venta.cliente_nombre}</td></tr>' if venta.cliente_nombre else ''}
-                {f'<tr><td><strong>Mesa:</strong></td><td style="text-align: right;">{venta.numero_mesa}</td></tr>' if venta.numero_mesa else ''}
-            </table>
-            
-            <hr style="margin: 10px 0;">
-            
-            <h4 style="margin: 10px 0;">DETALLES</h4>
-        """
-        
-        texto = f"""
-╔════════════════════════════════════╗
-║      🧾 RECIBO DE VENTA           ║
-║      Carbon & Cheddar             ║
-╠════════════════════════════════════╣
-Recibo #: {venta.id}
-Fecha: {venta.created_at.strftime('%d/%m/%Y')}
-Hora: {venta.created_at.strftime('%H:%M:%S')}
-Cajero: {usuario_nombre}
-{f'Cliente: {venta.cliente_nombre}' if venta.cliente_nombre else ''}
-{f'Mesa: {venta.numero_mesa}' if venta.numero_mesa else ''}
-╠════════════════════════════════════╣
-        """
-        
-        # Items
-        for item in venta.items:
-            nombre = item.receta.nombre if item.es_receta else item.producto.nombre
-            html += f"""
-            <div style="display: flex; justify-content: space-between; padding: 5px 0; border-bottom: 1px dotted #ddd;">
-                <span>{nombre} x{item.cantidad}</span>
-                <strong>${item.subtotal:.2f}</strong>
-            </div>
-            """
-            
-            texto += f"{nombre} x{item.cantidad:<25}${item.subtotal:>8.2f}\n"
-        
-        html += f"""
-            <hr style="margin: 10px 0; font-weight: bold;">
-            
-            <div style="display: flex; justify-content: space-between; padding: 5px 0;">
-                <span>Subtotal:</span>
-                <strong>${venta.subtotal:.2f}</strong>
-            </div>
-        """
-        
-        texto += f"\n{'SUBTOTAL:':<35}${venta.subtotal:>8.2f}\n"
-        
-        if venta.descuento > 0:
-            html += f"""
-            <div style="display: flex; justify-content: space-between; padding: 5px 0; color: green;">
-                <span>Descuento:</span>
-                <strong>-${venta.descuento:.2f}</strong>
-            </div>
-            """
-            texto += f"{'DESCUENTO:':<35}-${venta.descuento:>8.2f}\n"
-        
-        html += f"""
-            <div style="display: flex; justify-content: space-between; padding: 5px 0;">
-                <span>IVA (19%):</span>
-                <strong>${venta.iva:.2f}</strong>
-            </div>
-            <div style="display: flex; justify-content: space-between; padding: 5px 0;">
-                <span>Propina (10%):</span>
-                <strong>${venta.propina:.2f}</strong>
-            </div>
-            
-            <hr style="margin: 10px 0; border: 2px solid black;">
-            
-            <div style="display: flex; justify-content: space-between; padding: 10px 0; font-size: 1.3em; font-weight: bold;">
-                <span>TOTAL:</span>
-                <span>${venta.total:.2f}</span>
-            </div>
-            
-            <hr style="margin: 10px 0;">
-            
-            <div style="text-align: center; font-size: 0.85em; color: #666;">
-                <p>¡Gracias por su compra!</p>
-                <p>Vuelva pronto</p>
-            </div>
-        </div>
-        """
-        
-        texto += f"""
-{'IVA (19%):':<35}${venta.iva:>8.2f}
-{'PROPINA (10%):':<35}${venta.propina:>8.2f}
-╠════════════════════════════════════╣
-{'TOTAL:':<35}${venta.total:>8.2f}
-╠════════════════════════════════════╣
-        ¡Gracias por su compra!
-        Vuelva pronto
-╚════════════════════════════════════╝
-        """
-        
-        return html, texto
 
     # ======================== OBTENER COMPROBANTES ========================
 
@@ -536,6 +813,34 @@ Cajero: {usuario_nombre}
             'created_at': comanda.created_at.isoformat()
         }
 
+    @staticmethod
+    def obtener_comanda_escpos(venta_id, tipo_comanda='cocina'):
+        """
+        Obtiene los bytes ESC/POS de una comanda.
+        
+        Se guardan en la comanda al generarla; las comandas anteriores a esta
+        columna los generan en la primera descarga y quedan guardados.
+        
+        Returns:
+            tuple: (comanda_id, bytes)
+        """
+        comanda = Comanda.query.options(
+            undefer(Comanda.contenido_escpos)
+        ).filter_by(venta_id=venta_id, tipo_comanda=tipo_comanda).first()
+        
+        if not comanda:
+            venta = Venta.query.get(venta_id)
+            if not venta:
+                raise ValueError(f"Venta {venta_id} no encontrada")
+            comanda = VentasServiceAvanzado._generar_comanda(venta, tipo_comanda)
+        
+        if comanda.contenido_escpos is None:
+            vista = PlantillasComprobantes.vista_venta(comanda.venta)
+            comanda.contenido_escpos = PlantillasComprobantes.escpos(vista, tipo_comanda)
+            db.session.commit()
+        
+        return comanda.id, comanda.contenido_escpos
+
     @staticmethod
     def marcar_comanda_impresa(comanda_id):
         """
@@ -556,25 +861,27 @@ Cajero: {usuario_nombre}
     @staticmethod
     def reporte_ventas_por_hora(usuario_id, fecha, agrupar_por='hora'):
         """
-        Genera reporte de ventas agrupado por hora
+        Genera reporte de ventas agrupado por hora (lee ventas_resumen_hora)
         
         agrupar_por: 'hora' | 'producto' | 'receta'
         """
-        # Obtener nombre del usuario desde su ID
         usuario = Usuario.query.get(usuario_id)
         if not usuario:
             raise ValueError(f"Usuario {usuario_id} no encontrado")
         
         fecha_inicio = datetime.combine(fecha, datetime.min.time())
         fecha_fin = fecha_inicio + timedelta(days=1)
+        rango = VentasServiceAvanzado._filtro_resumen(ResumenVentasHora, usuario_id, fecha_inicio, fecha_fin)
+        hora = func.strftime('%H:00', ResumenVentasHora.bucket)
         
-        ventas = Venta.query.filter(
-            Venta.usuario == usuario.nombre,
-            Venta.created_at >= fecha_inicio,
-            Venta.created_at < fecha_fin
-        ).order_by(Venta.created_at).all()
+        horas = db.session.query(
+            hora, ResumenVentasHora.cantidad, func.round(ResumenVentasHora.ingresos, 2),
+            func.round(ResumenVentasHora.ingresos / ResumenVentasHora.cantidad, 2)
+        ).filter(
+            *rango, ResumenVentasHora.tipo_item == 'venta'
+        ).order_by(ResumenVentasHora.bucket).all()
         
-        if not ventas:
+        if not horas:
             return {
                 'fecha': fecha.isoformat(),
                 'total_ventas': 0,
@@ -584,201 +891,381 @@ Cajero: {usuario_nombre}
                 'detalles_hora': []
             }
         
-        # Agrupar por hora
-        ventas_por_hora = {}
-        for venta in ventas:
-            hora = venta.created_at.strftime('%H:00')
-            if hora not in ventas_por_hora:
-                ventas_por_hora[hora] = {
-                    'hora': hora,
-                    'cantidad_ventas': 0,
-                    'total_ingresos': 0,
-                    'items': [],
-                    'ticket_promedio': 0
-                }
-            
-            ventas_por_hora[hora]['cantidad_ventas'] += 1
-            ventas_por_hora[hora]['total_ingresos'] += venta.total
-            
-            for item in venta.items:
-                nombre = item.receta.nombre if item.es_receta else item.producto.nombre
-                ventas_por_hora[hora]['items'].append({
-                    'nombre': nombre,
-                    'cantidad': item.cantidad,
-                    'monto': item.subtotal
-                })
+        nombre, consulta_items = VentasServiceAvanzado._consulta_items_resumen(ResumenVentasHora)
+        items = consulta_items.with_entities(
+            hora, nombre, ResumenVentasHora.cantidad, func.round(ResumenVentasHora.ingresos, 2)
+        ).filter(*rango).order_by(ResumenVentasHora.bucket, ResumenVentasHora.cantidad.desc()).all()
         
-        # Calcular promedios
-        for hora, datos in ventas_por_hora.items():
-            datos['ticket_promedio'] = round(datos['total_ingresos'] / datos['cantidad_ventas'], 2)
+        ventas_por_hora = {
+            etiqueta: {
+                'hora': etiqueta,
+                'cantidad_ventas': cantidad_ventas,
+                'total_ingresos': total_ingresos,
+                'items': [],
+                'ticket_promedio': ticket_promedio
+            }
+            for etiqueta, cantidad_ventas, total_ingresos, ticket_promedio in horas
+        }
+        for etiqueta, nombre_item, cantidad, monto in items:
+            if etiqueta in ventas_por_hora:
+                ventas_por_hora[etiqueta]['items'].append({
+                    'nombre': nombre_item,
+                    'cantidad': cantidad,
+                    'monto': monto
+                })
         
-        total_ingresos = sum(v['total_ingresos'] for v in ventas_por_hora.values())
+        total_ventas = sum(fila[1] for fila in horas)
         
         return {
             'fecha': fecha.isoformat(),
-            'total_ventas': len(ventas),
-            'total_ingresos': round(total_ingresos, 2),
-            'total_items': sum(v['cantidad_ventas'] for v in ventas_por_hora.values()),
+            'total_ventas': total_ventas,
+            'total_ingresos': round(sum(fila[2] for fila in horas), 2),
+            'total_items': total_ventas,
             'horas': sorted(ventas_por_hora.items())
         }
 
     @staticmethod
     def reporte_ventas_por_dia(usuario_id, fecha_inicio, fecha_fin):
         """
-        Genera reporte de ventas por día en un rango
+        Genera reporte de ventas por día en un rango (lee ventas_resumen_dia)
         """
-        # Obtener nombre del usuario desde su ID
         usuario = Usuario.query.get(usuario_id)
         if not usuario:
             raise ValueError(f"Usuario {usuario_id} no encontrado")
         
-        ventas = Venta.query.filter(
-            Venta.usuario == usuario.nombre,
-            Venta.created_at >= datetime.combine(fecha_inicio, datetime.min.time()),
-            Venta.created_at < datetime.combine(fecha_fin + timedelta(days=1), datetime.min.time())
-        ).all()
-        
-        # Agrupar por día
-        ventas_por_dia = {}
-        for venta in ventas:
-            dia = venta.created_at.date().isoformat()
-            if dia not in ventas_por_dia:
-                ventas_por_dia[dia] = {
-                    'fecha': dia,
-                    'cantidad_ventas': 0,
-                    'total_ingresos': 0,
-                    'total_descuentos': 0,
-                    'ticket_promedio': 0,
-                    'productos_mas_vendidos': {}
-                }
-            
-            ventas_por_dia[dia]['cantidad_ventas'] += 1
-            ventas_por_dia[dia]['total_ingresos'] += venta.total
-            ventas_por_dia[dia]['total_descuentos'] += venta.descuento
-            
-            # Productos más vendidos
-            for item in venta.items:
-                nombre = item.receta.nombre if item.es_receta else item.producto.nombre
-                if nombre not in ventas_por_dia[dia]['productos_mas_vendidos']:
-                    ventas_por_dia[dia]['productos_mas_vendidos'][nombre] = 0
-                ventas_por_dia[dia]['productos_mas_vendidos'][nombre] += item.cantidad
+        rango = VentasServiceAvanzado._filtro_resumen(
+            ResumenVentasDia, usuario_id, fecha_inicio, fecha_fin + timedelta(days=1)
+        )
         
-        # Calcular promedios
-        for dia, datos in ventas_por_dia.items():
-            if datos['cantidad_ventas'] > 0:
-                datos['ticket_promedio'] = round(datos['total_ingresos'] / datos['cantidad_ventas'], 2)
+        dias = db.session.query(
+            ResumenVentasDia.bucket, ResumenVentasDia.cantidad,
+            func.round(ResumenVentasDia.ingresos, 2), func.round(ResumenVentasDia.descuentos, 2),
+            func.round(ResumenVentasDia.ingresos / ResumenVentasDia.cantidad, 2)
+        ).filter(
+            *rango, ResumenVentasDia.tipo_item == 'venta'
+        ).order_by(ResumenVentasDia.bucket).all()
+        
+        # Los más vendidos de cada día (productos y recetas)
+        mas_vendidos = MasVendidos.top_por_dia(fecha_inicio, fecha_fin + timedelta(days=1), usuario_id=usuario_id)
+        
+        ventas_por_dia = {
+            bucket.isoformat(): {
+                'fecha': bucket.isoformat(),
+                'cantidad_ventas': cantidad_ventas,
+                'total_ingresos': total_ingresos,
+                'total_descuentos': total_descuentos,
+                'ticket_promedio': ticket_promedio,
+                'productos_mas_vendidos': {}
+            }
+            for bucket, cantidad_ventas, total_ingresos, total_descuentos, ticket_promedio in dias
+        }
+        for dia, items in mas_vendidos.items():
+            datos = ventas_por_dia.get(dia.isoformat())
+            if datos:
+                # Un producto y una receta del mismo nombre se muestran juntos
+                for item in items:
+                    vendidos = datos['productos_mas_vendidos']
+                    vendidos[item['nombre']] = vendidos.get(item['nombre'], 0) + item['cantidad']
         
         return {
             'fecha_inicio': fecha_inicio.isoformat(),
             'fecha_fin': fecha_fin.isoformat(),
-            'total_ventas': len(ventas),
-            'total_ingresos': round(sum(d['total_ingresos'] for d in ventas_por_dia.values()), 2),
+            'total_ventas': sum(fila[1] for fila in dias),
+            'total_ingresos': round(sum(fila[2] for fila in dias), 2),
             'dias': sorted(ventas_por_dia.items())
         }
 
     @staticmethod
     def reporte_detallado_ventas(usuario_id, fecha_inicio, fecha_fin):
         """
-        Reporte detallado con desglose completo
+        Reporte detallado con desglose completo. Los totales y el desglose por
+        producto/receta salen de ventas_resumen_dia; el listado de ventas lee
+        solo las columnas de cabecera.
         """
-        # Obtener nombre del usuario desde su ID
         usuario = Usuario.query.get(usuario_id)
         if not usuario:
             raise ValueError(f"Usuario {usuario_id} no encontrado")
         
-        ventas = Venta.query.filter(
-            Venta.usuario == usuario.nombre,
-            Venta.created_at >= datetime.combine(fecha_inicio, datetime.min.time()),
-            Venta.created_at < datetime.combine(fecha_fin + timedelta(days=1), datetime.min.time())
-        ).order_by(desc(Venta.created_at)).all()
+        rango = VentasServiceAvanzado._filtro_resumen(
+            ResumenVentasDia, usuario_id, fecha_inicio, fecha_fin + timedelta(days=1)
+        )
+        
+        cantidad_ventas, total_ingresos, total_descuentos, total_iva, ticket_promedio = db.session.query(
+            func.coalesce(func.sum(ResumenVentasDia.cantidad), 0),
+            func.round(func.coalesce(func.sum(ResumenVentasDia.ingresos), 0), 2),
+            func.round(func.coalesce(func.sum(ResumenVentasDia.descuentos), 0), 2),
+            func.round(func.coalesce(func.sum(ResumenVentasDia.iva), 0), 2),
+            func.coalesce(func.round(func.sum(ResumenVentasDia.ingresos) / func.sum(ResumenVentasDia.cantidad), 2), 0)
+        ).filter(*rango, ResumenVentasDia.tipo_item == 'venta').one()
+        
+        # Desglose por nombre (como se muestra), costo de lo consumido al vender
+        nombre, consulta_items = VentasServiceAvanzado._consulta_items_resumen(ResumenVentasDia)
+        cantidad = func.sum(ResumenVentasDia.cantidad)
+        desglose = consulta_items.with_entities(
+            ResumenVentasDia.tipo_item, nombre, cantidad,
+            func.round(func.sum(ResumenVentasDia.ingresos), 2), func.round(func.sum(ResumenVentasDia.costo), 2)
+        ).filter(*rango).group_by(
+            ResumenVentasDia.tipo_item, nombre
+        ).order_by(cantidad.desc()).all()
         
-        # Detalles de productos
         productos_vendidos = {}
         recetas_vendidas = {}
+        for tipo_item, nombre_item, cantidad_item, ingresos, costo in desglose:
+            if tipo_item == 'receta':
+                recetas_vendidas[nombre_item] = {'cantidad': cantidad_item, 'ingresos': ingresos, 'costo': costo}
+            else:
+                productos_vendidos[nombre_item] = {'cantidad': cantidad_item, 'ingresos': ingresos}
         
-        for venta in ventas:
-            for item in venta.items:
-                if item.es_receta:
-                    nombre = item.receta.nombre
-                    if nombre not in recetas_vendidas:
-                        recetas_vendidas[nombre] = {
-                            'cantidad': 0,
-                            'ingresos': 0,
-                            'costo': 0
-                        }
-                    recetas_vendidas[nombre]['cantidad'] += item.cantidad
-                    recetas_vendidas[nombre]['ingresos'] += item.subtotal
-                    recetas_vendidas[nombre]['costo'] += item.receta.costo_total * item.cantidad
-                else:
-                    nombre = item.producto.nombre
-                    if nombre not in productos_vendidos:
-                        productos_vendidos[nombre] = {
-                            'cantidad': 0,
-                            'ingresos': 0
-                        }
-                    productos_vendidos[nombre]['cantidad'] += item.cantidad
-                    productos_vendidos[nombre]['ingresos'] += item.subtotal
-        
-        total_ingresos = sum(v.total for v in ventas)
-        total_descuentos = sum(v.descuento for v in ventas)
-        total_iva = sum(v.iva for v in ventas)
+        ventas = db.session.query(
+            Venta.id, Venta.created_at, Venta.cliente_nombre, Venta.numero_mesa, Venta.total,
+            func.count(VentaItem.id)
+        ).outerjoin(
+            VentaItem, VentaItem.venta_id == Venta.id
+        ).filter(
+            Venta.usuario_id == usuario_id,
+            Venta.anulada.isnot(True),
+            Venta.created_at >= datetime.combine(fecha_inicio, datetime.min.time()),
+            Venta.created_at < datetime.combine(fecha_fin + timedelta(days=1), datetime.min.time())
+        ).group_by(Venta.id).order_by(desc(Venta.created_at)).all()
         
         return {
             'fecha_inicio': fecha_inicio.isoformat(),
             'fecha_fin': fecha_fin.isoformat(),
             'resumen': {
-                'cantidad_ventas': len(ventas),
-                'total_ingresos': round(total_ingresos, 2),
-                'total_descuentos': round(total_descuentos, 2),
-                'total_iva': round(total_iva, 2),
-                'ticket_promedio': round(total_ingresos / len(ventas), 2) if ventas else 0
+                'cantidad_ventas': cantidad_ventas,
+                'total_ingresos': total_ingresos,
+                'total_descuentos': total_descuentos,
+                'total_iva': total_iva,
+                'ticket_promedio': ticket_promedio
             },
             'productos': productos_vendidos,
             'recetas': recetas_vendidas,
             'ventas': [
                 {
-                    'id': v.id,
-                    'fecha': v.created_at.isoformat(),
-                    'cliente': v.cliente_nombre,
-                    'mesa': v.numero_mesa,
-                    'total': v.total,
-                    'items_count': len(v.items)
+                    'id': venta_id,
+                    'fecha': created_at.isoformat(),
+                    'cliente': cliente,
+                    'mesa': mesa,
+                    'total': total,
+                    'items_count': items_count
                 }
-                for v in ventas
+                for venta_id, created_at, cliente, mesa, total, items_count in ventas
             ]
         }
 
     @staticmethod
-    def listar_ventas(filtros, pagina=1, por_pagina=20):
+    def _filtro_resumen(modelo, usuario_id, desde, hasta):
+        """Condiciones de una tabla de resumen: usuario, rango [desde, hasta) y filas con ventas"""
+        return (
+            modelo.usuario_id == usuario_id,
+            modelo.bucket >= desde,
+            modelo.bucket < hasta,
+            modelo.cantidad > 0
+        )
+
+    @staticmethod
+    def _consulta_items_resumen(modelo):
+        """
+        Consulta sobre las filas producto/receta de una tabla de resumen con el
+        nombre del item resuelto por JOIN (los items borrados del catálogo se
+        muestran como 'Producto #id' / 'Receta #id').
+        
+        Returns:
+            tuple (columna nombre, Query base para with_entities)
+        """
+        nombre = func.coalesce(
+            case((modelo.tipo_item == 'receta', Receta.nombre), else_=Producto.nombre),
+            case((modelo.tipo_item == 'receta', 'Receta #'), else_='Producto #') + cast(modelo.item_id, String)
+        )
+        consulta = db.session.query(modelo).outerjoin(
+            Receta, and_(modelo.tipo_item == 'receta', Receta.id == modelo.item_id)
+        ).outerjoin(
+            Producto, and_(modelo.tipo_item == 'producto', Producto.id == modelo.item_id)
+        ).filter(modelo.tipo_item != 'venta')
+        return nombre, consulta
+
+    @staticmethod
+    def reporte_consumo_ingredientes(fecha_inicio, fecha_fin):
+        """
+        Consumo de ingredientes por ventas en un rango de fechas (ventas no anuladas),
+        agregado en SQL sobre venta_item_consumos.
+        """
+        filas = db.session.query(
+            Ingrediente.id,
+            Ingrediente.nombre,
+            Ingrediente.unidad_medida,
+            func.sum(VentaItemConsumo.cantidad).label('cantidad'),
+            func.sum(VentaItemConsumo.cantidad * VentaItemConsumo.costo_unitario).label('costo'),
+            func.count(func.distinct(VentaItem.venta_id)).label('ventas')
+        ).join(
+            VentaItem, VentaItem.id == VentaItemConsumo.venta_item_id
+        ).join(
+            Venta, Venta.id == VentaItem.venta_id
+        ).join(
+            Ingrediente, Ingrediente.id == VentaItemConsumo.ingrediente_id
+        ).filter(
+            Venta.created_at >= datetime.combine(fecha_inicio, datetime.min.time()),
+            Venta.created_at < datetime.combine(fecha_fin + timedelta(days=1), datetime.min.time()),
+            Venta.anulada == False
+        ).group_by(
+            Ingrediente.id, Ingrediente.nombre, Ingrediente.unidad_medida
+        ).order_by(desc('costo')).all()
+        
+        ingredientes = [
+            {
+                'ingrediente_id': fila.id,
+                'nombre': fila.nombre,
+                'unidad': fila.unidad_medida,
+                'cantidad': round(fila.cantidad or 0, 3),
+                'costo': round(fila.costo or 0, 2),
+                'ventas': fila.ventas
+            }
+            for fila in filas
+        ]
+        
+        return {
+            'fecha_inicio': fecha_inicio.isoformat(),
+            'fecha_fin': fecha_fin.isoformat(),
+            'costo_total': round(sum(i['costo'] for i in ingredientes), 2),
+            'ingredientes': ingredientes
+        }
+
+    @staticmethod
+    def listar_ventas(filtros, cursor=None, por_pagina=20, con_total=False):
         """
-        Lista ventas con filtros y paginación.
+        Lista ventas con filtros, de la más reciente a la más antigua, paginadas
+        por cursor sobre (created_at, id): cada página continúa desde la última
+        venta de la anterior usando el índice de created_at, sin OFFSET.
+        
+        Args:
+            filtros: dict {id, fecha_inicio, fecha_fin, cliente, q}; las fechas son
+                YYYY-MM-DD (fecha_fin incluida) o ISO 8601 (rango [inicio, fin));
+                q busca por prefijos en cliente, mesa y observaciones, cliente
+                solo en el nombre del cliente
+            cursor: siguiente_cursor de la página anterior
+            por_pagina: int (1..MAX_POR_PAGINA)
+            con_total: incluir un total estimado (conteo hasta LIMITE_CONTEO)
+        
+        Returns:
+            dict {ventas, por_pagina, siguiente_cursor, total?, total_exacto?}
+        
+        Raises:
+            ValueError: si una fecha o el cursor son inválidos
         """
-        query = Venta.query
+        por_pagina = max(1, min(por_pagina, VentasServiceAvanzado.MAX_POR_PAGINA))
+        
+        query = db.session.query(
+            Venta.id, Venta.usuario, Venta.cliente_nombre, Venta.numero_mesa, Venta.subtotal,
+            Venta.descuento, Venta.iva, Venta.propina, Venta.total, Venta.anulada, Venta.created_at
+        )
         
         if filtros.get('id'):
             query = query.filter(Venta.id == filtros['id'])
         
         if filtros.get('fecha_inicio'):
-            query = query.filter(func.date(Venta.created_at) >= filtros['fecha_inicio'])
+            query = query.filter(Venta.created_at >= VentasServiceAvanzado._limite_fecha(filtros['fecha_inicio']))
             
         if filtros.get('fecha_fin'):
-            query = query.filter(func.date(Venta.created_at) <= filtros['fecha_fin'])
+            query = query.filter(Venta.created_at < VentasServiceAvanzado._limite_fecha(filtros['fecha_fin'], fin=True))
             
-        if filtros.get('cliente'):
-            query = query.filter(Venta.cliente_nombre.ilike(f"%{filtros['cliente']}%"))
-            
-        # Ordenar por fecha descendente
-        query = query.order_by(Venta.created_at.desc())
+        for clave, columna in (('q', None), ('cliente', 'cliente_nombre')):
+            if not filtros.get(clave):
+                continue
+            if BusquedaVentas.disponible:
+                condicion = BusquedaVentas.filtro(Venta.id, filtros[clave], columna)
+                if condicion is not None:
+                    query = query.filter(condicion)
+            elif clave == 'cliente':
+                query = query.filter(Venta.cliente_nombre.ilike(f"%{filtros['cliente']}%"))
+            else:
+                patron = f"%{filtros['q']}%"
+                query = query.filter(
+                    Venta.cliente_nombre.ilike(patron) | Venta.numero_mesa.ilike(patron) |
+                    Venta.items.any(VentaItem.observaciones.ilike(patron))
+                )
         
-        total = query.count()
-        ventas_paginadas = query.paginate(page=pagina, per_page=por_pagina, error_out=False).items
+        resultado = {'por_pagina': por_pagina}
+        if con_total:
+            conteo = db.session.query(func.count()).select_from(
+                query.with_entities(Venta.id).limit(VentasServiceAvanzado.LIMITE_CONTEO + 1).subquery()
+            ).scalar()
+            resultado['total'] = min(conteo, VentasServiceAvanzado.LIMITE_CONTEO)
+            resultado['total_exacto'] = conteo <= VentasServiceAvanzado.LIMITE_CONTEO
         
-        return {
-            'total': total,
-            'pagina': pagina,
-            'por_pagina': por_pagina,
-            'ventas': [v.to_dict() for v in ventas_paginadas]
-        }
+        if cursor:
+            try:
+                fecha_cursor, id_cursor = cursor.rsplit('_', 1)
+                posicion = (datetime.fromisoformat(fecha_cursor), int(id_cursor))
+            except ValueError:
+                raise ValueError(f"Cursor inválido: {cursor}")
+            query = query.filter(tuple_(Venta.created_at, Venta.id) < posicion)
+        
+        ventas = query.order_by(
+            Venta.created_at.desc(), Venta.id.desc()
+        ).limit(por_pagina + 1).all()
+        
+        hay_mas = len(ventas) > por_pagina
+        ventas = ventas[:por_pagina]
+        resultado['siguiente_cursor'] = (
+            f"{ventas[-1].created_at.isoformat()}_{ventas[-1].id}" if hay_mas else None
+        )
+        
+        # Líneas de la página en una consulta, sin consumos de ingredientes
+        es_receta = VentaItem.es_receta.is_(True)
+        items_por_venta = {}
+        for item in db.session.query(
+            VentaItem.id, VentaItem.venta_id, VentaItem.producto_id, VentaItem.receta_id,
+            case((es_receta, Receta.nombre), else_=Producto.nombre).label('nombre'),
+            VentaItem.cantidad, VentaItem.precio_unitario, VentaItem.subtotal,
+            VentaItem.observaciones, VentaItem.es_receta
+        ).outerjoin(
+            Receta, and_(es_receta, Receta.id == VentaItem.receta_id)
+        ).outerjoin(
+            Producto, Producto.id == VentaItem.producto_id
+        ).filter(
+            VentaItem.venta_id.in_([venta.id for venta in ventas])
+        ).order_by(VentaItem.id):
+            items_por_venta.setdefault(item.venta_id, []).append({
+                'id': item.id,
+                'producto_id': item.producto_id,
+                'receta_id': item.receta_id,
+                'producto_nombre': item.nombre,
+                'cantidad': item.cantidad,
+                'precio_unitario': item.precio_unitario,
+                'subtotal': item.subtotal,
+                'observaciones': item.observaciones,
+                'es_receta': item.es_receta
+            })
+        
+        resultado['ventas'] = [
+            {
+                'id': venta.id,
+                'usuario': venta.usuario,
+                'cliente_nombre': venta.cliente_nombre,
+                'numero_mesa': venta.numero_mesa,
+                'subtotal': venta.subtotal,
+                'descuento': venta.descuento,
+                'iva': venta.iva,
+                'propina': venta.propina,
+                'total': venta.total,
+                'anulada': venta.anulada,
+                'items': items_por_venta.get(venta.id, []),
+                'created_at': venta.created_at.isoformat()
+            }
+            for venta in ventas
+        ]
+        return resultado
+
+    @staticmethod
+    def _limite_fecha(valor, fin=False):
+        """
+        Límite de un rango [inicio, fin) de created_at. Una fecha sin hora
+        (YYYY-MM-DD) como fin incluye ese día completo.
+        """
+        fecha = VentasServiceAvanzado._parsear_fecha_cliente(valor)
+        if fin and len(str(valor)) == 10:
+            fecha += timedelta(days=1)
+        return fecha
 
     @staticmethod
     def actualizar_venta_cabecera(venta_id, datos):
@@ -807,6 +1294,10 @@ Cajero: {usuario_nombre}
                 if item_id_str in datos['items_observaciones']:
                     item.observaciones = datos['items_observaciones'][item_id_str]
         
+        # El listado del reporte detallado muestra cliente y mesa
+        if venta.created_at:
+            CacheReportes.marcar([(venta.usuario_id or 0, venta.created_at.date())])
+        
         db.session.commit()
         return venta.to_dict()
     @staticmethod
@@ -817,59 +1308,218 @@ Cajero: {usuario_nombre}
         Retorna:
             dict {disponible: bool, faltantes: list}
         """
-        if tipo == 'producto':
-            producto = Producto.query.get(item_id)
-            if not producto:
-                raise ValueError("Producto no encontrado")
-            
-            disponible = (producto.stock or 0) >= cantidad
-            faltantes = []
-            
-            if not disponible:
-                faltantes.append({
-                    'nombre': producto.nombre,
-                    'stock_actual': producto.stock or 0,
-                    'requerido': cantidad,
-                    'id': producto.id,
-                    'tipo': 'producto'
-                })
-            
-            return {
-                'disponible': disponible,
-                'faltantes': faltantes
+        if tipo not in ('producto', 'receta'):
+            raise ValueError(f"Tipo de item inválido: {tipo}")
+        
+        resultado = VentasServiceAvanzado.validar_stock_carrito([{'tipo': tipo, 'id': item_id, 'cantidad': cantidad}])
+        
+        return {
+            'disponible': resultado['disponible'],
+            'faltantes': [
+                {
+                    'nombre': faltante['nombre'],
+                    'stock_actual': faltante['stock_actual'],
+                    'requerido': faltante['requerido'],
+                    'unidad': faltante['unidad'],
+                    'id': faltante['id'],
+                    'tipo': faltante['tipo']
+                }
+                for faltante in resultado['faltantes']
+            ]
+        }
+
+    @staticmethod
+    def validar_stock_carrito(items, codigo_reserva=None):
+        """
+        Valida el stock de un carrito completo de una vez.
+        
+        Los requerimientos se suman entre líneas (dos hamburguesas comparten la
+        misma carne) y se comparan contra el stock disponible (stock menos
+        reservas vigentes de otros carritos), cargado con una consulta por tabla.
+        
+        Args:
+            items: list [{tipo: 'producto'|'receta', id, cantidad}]
+            codigo_reserva: reserva del propio carrito, que no cuenta como ocupada
+        
+        Returns:
+            dict {
+                disponible: bool,
+                faltantes: [{tipo, id, nombre, unidad, stock_actual, reservado, disponible,
+                             requerido, faltante, lineas}],
+                lineas: [{indice, tipo, id, nombre, cantidad, disponible, faltantes}]
             }
+        """
+        return VentasServiceAvanzado._evaluar_carrito(items, codigo_reserva)[0]
+
+    @staticmethod
+    def _evaluar_carrito(items, codigo_reserva=None):
+        """
+        Returns:
+            tuple (resultado de validar_stock_carrito,
+                   dict {('producto'|'ingrediente', id): cantidad requerida})
+        """
+        if not items:
+            raise ValueError("El carrito está vacío")
+        
+        catalogo = VentasServiceAvanzado._cargar_catalogo(items)
+        
+        requerido = {}  # ('producto'|'ingrediente', id) -> cantidad total
+        por_linea = []  # [(item, nombre, {clave: cantidad})]
+        
+        for item in items:
+            tipo = item.get('tipo', 'producto')
+            cantidad = item.get('cantidad', 1)
+            if not isinstance(cantidad, (int, float)) or cantidad <= 0:
+                raise ValueError("La cantidad debe ser mayor a 0")
             
-        elif tipo == 'receta':
-            receta = Receta.query.get(item_id)
-            if not receta:
-                raise ValueError("Receta no encontrada")
-            
-            # Usar la lógica de explosión existente para recolectar necesidades de ingredientes
-            descuentos_tracking = {}
-            VentasServiceAvanzado._procesar_explosion_receta(receta, cantidad, descuentos_tracking)
-            
-            faltantes = []
-            for ing_id, cant_req in descuentos_tracking.items():
-                ingrediente = Ingrediente.query.get(ing_id)
-                if ingrediente:
-                    stock_actual = ingrediente.stock_actual or 0
-                    if stock_actual < cant_req:
-                        faltantes.append({
-                            'nombre': ingrediente.nombre,
-                            'stock_actual': stock_actual,
-                            'requerido': cant_req,
-                            'unidad': ingrediente.unidad_medida,
-                            'id': ingrediente.id,
-                            'tipo': 'ingrediente'
-                        })
+            if tipo == 'producto':
+                producto = catalogo['productos'].get(item.get('id'))
+                if not producto:
+                    raise ValueError(f"Producto {item.get('id')} no encontrado")
+                nombre = producto.nombre
+                necesidades = {('producto', producto.id): cantidad}
+            elif tipo == 'receta':
+                receta = catalogo['recetas'].get(item.get('id'))
+                if not receta:
+                    raise ValueError(f"Receta {item.get('id')} no encontrada")
+                nombre = receta.nombre
+                necesidades = {
+                    ('ingrediente', ingrediente_id): cantidad_por_receta * cantidad
+                    for ingrediente_id, cantidad_por_receta in catalogo['vectores'].get(receta.id, {}).items()
+                    if ingrediente_id in catalogo['ingredientes']
+                }
+            else:
+                raise ValueError(f"Tipo de item inválido: {tipo}")
             
-            return {
-                'disponible': len(faltantes) == 0,
-                'faltantes': faltantes
-            }
+            for clave, cantidad_requerida in necesidades.items():
+                requerido[clave] = requerido.get(clave, 0) + cantidad_requerida
+            por_linea.append((item, nombre, necesidades))
         
-        else:
-            raise ValueError(f"Tipo de item inválido: {tipo}")
+        reservado = ReservasStock.reservado(
+            [rid for tipo, rid in requerido if tipo == 'producto'],
+            [rid for tipo, rid in requerido if tipo == 'ingrediente'],
+            excluir_codigo=codigo_reserva
+        )
+        
+        # Faltantes agregados por producto / ingrediente
+        faltantes = {}
+        for (tipo, recurso_id), cantidad_requerida in sorted(requerido.items()):
+            if tipo == 'producto':
+                recurso = catalogo['productos'][recurso_id]
+                stock_actual, unidad = recurso.stock or 0, None
+            else:
+                recurso = catalogo['ingredientes'][recurso_id]
+                stock_actual, unidad = recurso.stock_actual or 0, recurso.unidad_medida
+            
+            reservado_otros = reservado.get((tipo, recurso_id), 0)
+            disponible = stock_actual - reservado_otros
+            if disponible < cantidad_requerida:
+                faltantes[(tipo, recurso_id)] = {
+                    'tipo': tipo,
+                    'id': recurso_id,
+                    'nombre': recurso.nombre,
+                    'unidad': unidad,
+                    'stock_actual': stock_actual,
+                    'reservado': round(reservado_otros, 3),
+                    'disponible': round(disponible, 3),
+                    'requerido': round(cantidad_requerida, 3),
+                    'faltante': round(cantidad_requerida - disponible, 3),
+                    'lineas': []
+                }
+        
+        # Faltantes por línea: lo que la línea necesita de cada recurso que no alcanza
+        lineas = []
+        for indice, (item, nombre, necesidades) in enumerate(por_linea):
+            faltantes_linea = []
+            for clave, cantidad_requerida in necesidades.items():
+                if clave in faltantes:
+                    faltantes[clave]['lineas'].append(indice)
+                    faltantes_linea.append({
+                        'tipo': clave[0],
+                        'id': clave[1],
+                        'nombre': faltantes[clave]['nombre'],
+                        'unidad': faltantes[clave]['unidad'],
+                        'requerido': round(cantidad_requerida, 3)
+                    })
+            lineas.append({
+                'indice': indice,
+                'tipo': item.get('tipo', 'producto'),
+                'id': item.get('id'),
+                'nombre': nombre,
+                'cantidad': item.get('cantidad', 1),
+                'disponible': not faltantes_linea,
+                'faltantes': faltantes_linea
+            })
+        
+        resultado = {
+            'disponible': not faltantes,
+            'faltantes': list(faltantes.values()),
+            'lineas': lineas
+        }
+        return resultado, requerido
+
+    # ======================== RESERVAS DE STOCK ========================
+
+    @staticmethod
+    def reservar_stock_carrito(usuario_id, items, codigo_reserva=None):
+        """
+        Aparta el stock de un carrito por ReservasStock.TTL_SEGUNDOS.
+        
+        Todo o nada: si algo no alcanza no se reserva nada y las reservas
+        anteriores del carrito (codigo_reserva) se mantienen. Si alcanza, las
+        reservas del carrito se reemplazan por las del carrito actual y el plazo
+        se renueva.
+        
+        Args:
+            usuario_id: ID del cajero
+            items: list [{tipo: 'producto'|'receta', id, cantidad}]
+            codigo_reserva: código devuelto por una reserva anterior del mismo carrito
+        
+        Returns:
+            dict: resultado de validar_stock_carrito más {reservado, codigo_reserva, expira_en}
+        """
+        try:
+            # Escribir primero: en SQLite el barrido toma el bloqueo de escritura,
+            # así nadie reserva entre la lectura del disponible y el INSERT
+            ReservasStock.barrer()
+            ReservasStock.liberar(codigo_reserva, usuario_id)
+            
+            resultado, requerido = VentasServiceAvanzado._evaluar_carrito(items)
+            
+            bloqueantes = [
+                f for f in resultado['faltantes']
+                if f['tipo'] == 'producto' or not VentasServiceAvanzado.PERMITIR_STOCK_NEGATIVO_INGREDIENTES
+            ]
+            if bloqueantes:
+                db.session.rollback()
+                resultado.update({'reservado': False, 'codigo_reserva': codigo_reserva, 'expira_en': None})
+                return resultado
+            
+            codigo, expira_en = ReservasStock.reservar(usuario_id, requerido, codigo_reserva)
+            db.session.commit()
+            
+            resultado.update({'reservado': True, 'codigo_reserva': codigo, 'expira_en': expira_en.isoformat()})
+            return resultado
+        
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+    @staticmethod
+    def liberar_reserva_stock(codigo_reserva, usuario_id):
+        """
+        Libera las reservas de un carrito (cancelado o vaciado)
+        
+        Returns:
+            int: reservas liberadas
+        """
+        try:
+            liberadas = ReservasStock.liberar(codigo_reserva, usuario_id)
+            db.session.commit()
+            return liberadas
+        except Exception as e:
+            db.session.rollback()
+            raise e
 
     @staticmethod
     def anular_venta(venta_id, usuario_id):
@@ -887,41 +1537,12 @@ Cajero: {usuario_nombre}
             # Marcar anulada
             venta.anulada = True
             
-            # Revertir Stock
-            for item in venta.items:
-                if item.es_receta:
-                    # Usar la explosión guardada para saber cuánto descontamos exactamente
-                    if item.explosion_detalles:
-                        try:
-                            detalles = json.loads(item.explosion_detalles)
-                            for key, info in detalles.items():
-                                # info puede tener 'ingrediente_id' o ser subreceta
-                                # Si es un ingrediente directo
-                                if 'ingrediente_id' in info:
-                                    ing_id = info['ingrediente_id']
-                                    cantidad_desc = info['cantidad_total']
-                                    
-                                    ing = Ingrediente.query.get(ing_id)
-                                    if ing:
-                                        ing.stock_actual = (ing.stock_actual or 0) + cantidad_desc
-                                
-                                # Si es subreceta, la estructura es diferente y recursiva
-                                # Pero _procesar_explosion_receta devuelve un dict plano donde
-                                # todas las hojas (ingredientes finales) deberian estar en el nivel superior 
-                                # si se procesó correctamente, O deberíamos iterar recursivamente.
-                                # Revisando _procesar_explosion_receta: 
-                                # devuelve un dict plano 'explosion' keys: f"ing_{id}" y f"sub_{id}".
-                                # Y "sub_{id}" contiene 'items_descontados' que es OTRO dict.
-                                # Debemos procesar recursivamente el JSON de devolución.
-                                
-                                elif key.startswith('sub_') and 'items_descontados' in info:
-                                    VentasServiceAvanzado._revertir_stock_recursivo(info['items_descontados'])
-
-                        except Exception as e:
-                            print(f"Error parseando explosion para item {item.id}: {e}")
-                else:
-                    # Producto simple
-                    item.producto.stock = (item.producto.stock or 0) + item.cantidad
+            # Revertir stock con los consumos registrados en la venta
+            VentasServiceAvanzado._revertir_stock_ventas([venta.id])
+            ResumenVentas.registrar_ventas([venta.id], signo=-1)
+            
+            # Avisar a las pantallas de cocina
+            FeedComandas.registrar_anulacion([venta.id])
             
             db.session.commit()
             return True, "Venta anulada exitosamente"
@@ -931,14 +1552,143 @@ Cajero: {usuario_nombre}
             return False, str(e)
 
     @staticmethod
-    def _revertir_stock_recursivo(detalles_dict):
-        """Helper para revertir stock de estructuras anidadas en JSON"""
-        for key, info in detalles_dict.items():
-            if 'ingrediente_id' in info:
-                ing_id = info['ingrediente_id']
-                cantidad_desc = info['cantidad_total']
-                ing = Ingrediente.query.get(ing_id)
-                if ing:
-                    ing.stock_actual = (ing.stock_actual or 0) + cantidad_desc
-            elif key.startswith('sub_') and 'items_descontados' in info:
-                VentasServiceAvanzado._revertir_stock_recursivo(info['items_descontados'])
+    def anular_ventas_lote(venta_ids=None, filtros=None):
+        """
+        Anula varias ventas en una sola transacción (correcciones de fin de turno).
+        
+        El stock a devolver se calcula agregado para todas las ventas (una consulta
+        por tabla) y se aplica con un UPDATE executemany por tabla.
+        
+        Args:
+            venta_ids: lista de IDs de venta
+            filtros: dict alternativo {usuario_id, desde, hasta}; desde/hasta ISO 8601,
+                rango [desde, hasta)
+        
+        Returns:
+            dict {anuladas, ya_anuladas, no_encontradas, stock_restaurado}
+        """
+        query = db.session.query(Venta.id, Venta.anulada)
+        
+        if venta_ids:
+            if not isinstance(venta_ids, list) or not all(isinstance(v, int) for v in venta_ids):
+                raise ValueError("venta_ids debe ser una lista de IDs")
+            venta_ids = sorted(set(venta_ids))
+            if len(venta_ids) > VentasServiceAvanzado.MAX_ANULACIONES_LOTE:
+                raise ValueError(f"No se pueden anular más de {VentasServiceAvanzado.MAX_ANULACIONES_LOTE} ventas a la vez")
+            query = query.filter(Venta.id.in_(venta_ids))
+        elif filtros:
+            if not any(filtros.get(k) for k in ('usuario_id', 'desde', 'hasta')):
+                raise ValueError("Se requiere al menos un filtro (usuario_id, desde, hasta)")
+            if filtros.get('usuario_id'):
+                query = query.filter(Venta.usuario_id == filtros['usuario_id'])
+            if filtros.get('desde'):
+                query = query.filter(Venta.created_at >= VentasServiceAvanzado._parsear_fecha_cliente(filtros['desde']))
+            if filtros.get('hasta'):
+                query = query.filter(Venta.created_at < VentasServiceAvanzado._parsear_fecha_cliente(filtros['hasta']))
+        else:
+            raise ValueError("Se requiere venta_ids o filtros")
+        
+        try:
+            encontradas = dict(query.order_by(Venta.id).limit(VentasServiceAvanzado.MAX_ANULACIONES_LOTE + 1).all())
+            if len(encontradas) > VentasServiceAvanzado.MAX_ANULACIONES_LOTE:
+                raise ValueError(
+                    f"El filtro abarca más de {VentasServiceAvanzado.MAX_ANULACIONES_LOTE} ventas, acótelo"
+                )
+            
+            pendientes = [venta_id for venta_id, anulada in encontradas.items() if not anulada]
+            
+            anuladas = []
+            stock_restaurado = {'productos': {}, 'ingredientes': {}}
+            if pendientes:
+                # Solo las que siguen sin anular (otra caja pudo anular alguna mientras tanto)
+                tabla = Venta.__table__
+                anuladas = sorted(db.session.execute(
+                    tabla.update()
+                    .where(tabla.c.id.in_(pendientes), tabla.c.anulada.isnot(True))
+                    .values(anulada=True)
+                    .returning(tabla.c.id)
+                ).scalars().all())
+                
+                if anuladas:
+                    stock_restaurado = VentasServiceAvanzado._revertir_stock_ventas(anuladas)
+                    ResumenVentas.registrar_ventas(anuladas, signo=-1)
+                    FeedComandas.registrar_anulacion(anuladas)
+            
+            db.session.commit()
+            
+            return {
+                'anuladas': anuladas,
+                'ya_anuladas': sorted(set(encontradas) - set(anuladas)),
+                'no_encontradas': sorted(set(venta_ids or ()) - set(encontradas)),
+                'stock_restaurado': stock_restaurado
+            }
+        
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+    @staticmethod
+    def _revertir_stock_ventas(venta_ids):
+        """
+        Devuelve al stock lo descontado por las ventas indicadas, con una consulta
+        agregada por tabla y un UPDATE executemany (sin commit). Cada devolución
+        queda en el libro de inventario como anulación de su venta.
+        
+        Args:
+            venta_ids: lista de IDs de venta
+        
+        Returns:
+            dict {productos: {id: cantidad}, ingredientes: {id: cantidad}} devuelto al stock
+        """
+        por_venta_productos = db.session.query(
+            VentaItem.venta_id, VentaItem.producto_id, func.sum(VentaItem.cantidad)
+        ).filter(
+            VentaItem.venta_id.in_(venta_ids),
+            VentaItem.producto_id.isnot(None),
+            VentaItem.es_receta == False
+        ).group_by(VentaItem.venta_id, VentaItem.producto_id).all()
+        
+        por_venta_ingredientes = db.session.query(
+            VentaItem.venta_id, VentaItemConsumo.ingrediente_id, func.sum(VentaItemConsumo.cantidad)
+        ).join(
+            VentaItem, VentaItem.id == VentaItemConsumo.venta_item_id
+        ).filter(
+            VentaItem.venta_id.in_(venta_ids)
+        ).group_by(VentaItem.venta_id, VentaItemConsumo.ingrediente_id).all()
+        
+        def sumar(filas):
+            totales = {}
+            for _, recurso_id, cantidad in filas:
+                totales[recurso_id] = totales.get(recurso_id, 0) + cantidad
+            return sorted(totales.items())
+        
+        productos = sumar(por_venta_productos)
+        ingredientes = sumar(por_venta_ingredientes)
+        
+        if productos:
+            tabla = Producto.__table__
+            db.session.execute(
+                tabla.update().where(tabla.c.id == bindparam('p_id')).values(
+                    stock=func.coalesce(tabla.c.stock, 0) + bindparam('p_cantidad')
+                ),
+                [{'p_id': producto_id, 'p_cantidad': cantidad} for producto_id, cantidad in productos]
+            )
+        
+        if ingredientes:
+            tabla = Ingrediente.__table__
+            db.session.execute(
+                tabla.update().where(tabla.c.id == bindparam('i_id')).values(
+                    stock_actual=func.coalesce(tabla.c.stock_actual, 0) + bindparam('i_cantidad')
+                ),
+                [{'i_id': ingrediente_id, 'i_cantidad': cantidad} for ingrediente_id, cantidad in ingredientes]
+            )
+        
+        LibroInventario.registrar(LibroInventario.ANULACION, [
+            *((LibroInventario.PRODUCTO, producto_id, cantidad, venta_id)
+              for venta_id, producto_id, cantidad in por_venta_productos),
+            *((LibroInventario.INGREDIENTE, ingrediente_id, cantidad, venta_id)
+              for venta_id, ingrediente_id, cantidad in por_venta_ingredientes)
+        ])
+        
+        return {'productos': dict(productos), 'ingredientes': dict(ingredientes)}
+
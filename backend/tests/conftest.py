@@ -0,0 +1,56 @@
+"""
+Pruebas de la API contra una base SQLite temporal (con los datos de demostración
+que app.py crea al importarse).
+"""
+import atexit
+import os
+import sys
+import tempfile
+
+import pytest
+
+_BASE = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+_BASE.close()
+atexit.register(os.unlink, _BASE.name)  # Después de los hilos de comandas
+os.environ['DATABASE_URL'] = f'sqlite:///{_BASE.name}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def headers(client):
+    """Cabeceras del usuario de demostración (admin)"""
+    respuesta = client.post('/api/auth/login', json={'email': 'demo@example.com', 'password': 'demo123'})
+    datos = respuesta.get_json()
+    token = datos.get('token') or datos['data']['token']
+    return {'Authorization': f'Bearer {token}', 'X-Is-Admin': 'true'}
+
+
+@pytest.fixture
+def headers_cajero(app, client):
+    """Cabeceras de un usuario sin rol admin"""
+    from models import db, Usuario
+
+    with app.app_context():
+        if not Usuario.query.filter_by(email='cajero@example.com').first():
+            cajero = Usuario(nombre='Cajero', email='cajero@example.com', rol='user', permisos=['ver_ventas'])
+            cajero.set_password('cajero123')
+            db.session.add(cajero)
+            db.session.commit()
+
+    respuesta = client.post('/api/auth/login', json={'email': 'cajero@example.com', 'password': 'cajero123'})
+    datos = respuesta.get_json()
+    token = datos.get('token') or datos['data']['token']
+    return {'Authorization': f'Bearer {token}'}
@@ -0,0 +1,19 @@
+from models import Producto
+
+
+def test_anular_lote_requiere_admin(app, client, headers, headers_cajero):
+    with app.app_context():
+        producto_id = Producto.query.first().id
+
+    venta = client.post('/api/ventas/crear-con-explosion', headers=headers_cajero, json={
+        'items': [{'tipo': 'producto', 'id': producto_id, 'cantidad': 1, 'precio_unitario': 8.5}]
+    })
+    assert venta.status_code == 201
+    venta_id = venta.get_json()['data']['venta_id']
+
+    filtros = {'filtros': {'desde': '2000-01-01T00:00:00'}}
+    assert client.post('/api/ventas/anular-lote', headers=headers_cajero, json=filtros).status_code == 403
+
+    respuesta = client.post('/api/ventas/anular-lote', headers=headers, json={'venta_ids': [venta_id]})
+    assert respuesta.status_code == 200
+    assert venta_id in respuesta.get_json()['data']['anuladas']
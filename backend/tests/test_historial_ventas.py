@@ -0,0 +1,31 @@
+from models import Producto
+
+
+def _vender(app, client, headers, **cabecera):
+    with app.app_context():
+        producto_id = Producto.query.first().id
+    respuesta = client.post('/api/ventas/crear-con-explosion', headers=headers, json={
+        'items': [{'tipo': 'producto', 'id': producto_id, 'cantidad': 1, 'precio_unitario': 8.5}],
+        **cabecera
+    })
+    assert respuesta.status_code == 201, respuesta.get_json()
+    return respuesta.get_json()['data']['venta_id']
+
+
+def _buscar(client, headers, **filtros):
+    respuesta = client.get('/api/ventas/historial', headers=headers, query_string=filtros)
+    assert respuesta.status_code == 200, respuesta.get_json()
+    return {venta['id'] for venta in respuesta.get_json()['data']['ventas']}
+
+
+def test_busqueda_por_texto_y_cliente(app, client, headers):
+    ana = _vender(app, client, headers, cliente_nombre='Ana Gómez', numero_mesa='3')
+    jose = _vender(app, client, headers, cliente_nombre='José Pérez', numero_mesa='7')
+
+    assert ana in _buscar(client, headers, q='ana')
+    assert jose in _buscar(client, headers, cliente='jose')
+
+    # Cada filtro conserva su propio texto: ninguna venta cumple ambos
+    assert _buscar(client, headers, q='ana', cliente='jose') == set()
+    assert _buscar(client, headers, q='jose', cliente='ana') == set()
+    assert _buscar(client, headers, q='gomez', cliente='ana') == {ana}
@@ -0,0 +1,40 @@
+from sqlalchemy import func
+
+from models import db, SnapshotInventario
+from services.libro_inventario import LibroInventario
+
+
+def _recursos_del_ultimo_corte(app):
+    with app.app_context():
+        ultimo = db.session.query(func.max(SnapshotInventario.movimiento_id)).scalar()
+        return {
+            (tipo_recurso, recurso_id)
+            for tipo_recurso, recurso_id in db.session.query(
+                SnapshotInventario.tipo_recurso, SnapshotInventario.recurso_id
+            ).filter(SnapshotInventario.movimiento_id == ultimo)
+        }
+
+
+def test_snapshot_requiere_admin(client, headers_cajero):
+    assert client.post('/api/inventario/snapshots', headers=headers_cajero).status_code == 403
+
+
+def test_snapshot_omite_productos_eliminados(app, client, headers):
+    producto = client.post('/api/productos', headers=headers, json={
+        'nombre': 'Producto de corte', 'precio': 1, 'stock': 3, 'costo': 1
+    }).get_json()
+    clave = (LibroInventario.PRODUCTO, producto['id'])
+
+    assert client.post('/api/inventario/snapshots', headers=headers).status_code == 201
+    assert clave in _recursos_del_ultimo_corte(app)
+
+    # Un movimiento nuevo para que el corte no se omita por estar al día
+    otro = client.post('/api/productos', headers=headers, json={
+        'nombre': 'Otro producto', 'precio': 1, 'stock': 1, 'costo': 1
+    }).get_json()
+    assert client.delete(f"/api/productos/{producto['id']}", headers=headers).status_code == 200
+
+    assert client.post('/api/inventario/snapshots', headers=headers).status_code == 201
+    recursos = _recursos_del_ultimo_corte(app)
+    assert clave not in recursos
+    assert (LibroInventario.PRODUCTO, otro['id']) in recursos
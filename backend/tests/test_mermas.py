@@ -0,0 +1,31 @@
+from models import db, Merma, Producto
+
+
+def test_merma_to_dict(app):
+    with app.app_context():
+        producto = Producto.query.first()
+        merma = Merma(producto_id=producto.id, cantidad=1, razon='Vencido', usuario='test')
+        db.session.add(merma)
+        db.session.commit()
+
+        datos = merma.to_dict()
+        assert datos['producto_id'] == producto.id
+        assert datos['producto_nombre'] == producto.nombre
+        assert 'receta_id' not in datos
+
+
+def test_crear_y_listar_mermas(app, client):
+    with app.app_context():
+        producto = Producto.query.first()
+        producto_id, stock = producto.id, producto.stock
+
+    respuesta = client.post('/api/mermas', json={'producto_id': producto_id, 'cantidad': 2, 'razon': 'Roto'})
+    assert respuesta.status_code == 201
+    assert respuesta.get_json()['merma']['cantidad'] == 2
+
+    assert client.get('/api/mermas').status_code == 200
+    mermas = client.get(f'/api/mermas/producto/{producto_id}').get_json()
+    assert any(merma['razon'] == 'Roto' for merma in mermas)
+
+    with app.app_context():
+        assert db.session.get(Producto, producto_id).stock == stock - 2
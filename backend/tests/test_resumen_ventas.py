@@ -0,0 +1,52 @@
+from sqlalchemy import text
+
+from models import db, Producto
+from services.contadores_dashboard import ContadoresDashboard
+
+
+def test_resumen_ventas_usa_contadores(app, client, headers):
+    antes = client.get('/api/reportes/resumen-ventas')
+    assert antes.status_code == 200
+    antes = antes.get_json()
+    assert set(antes) == {'hoy', 'ultimos_7_dias', 'total', 'inventario'}
+
+    with app.app_context():
+        producto = Producto.query.first()
+        producto_id, precio = producto.id, producto.precio
+    respuesta = client.post('/api/ventas/crear-con-explosion', headers=headers, json={
+        'items': [{'tipo': 'producto', 'id': producto_id, 'cantidad': 2, 'precio_unitario': precio}]
+    })
+    assert respuesta.status_code == 201, respuesta.get_json()
+    total_venta = respuesta.get_json()['data']['total']
+
+    despues = client.get('/api/reportes/resumen-ventas').get_json()
+    for periodo in ('hoy', 'ultimos_7_dias', 'total'):
+        assert despues[periodo]['cantidad_ventas'] == antes[periodo]['cantidad_ventas'] + 1
+        assert round(despues[periodo]['total'] - antes[periodo]['total'], 2) == round(total_venta, 2)
+    assert despues['inventario']['stock_total'] == antes['inventario']['stock_total'] - 2
+
+
+def test_resumen_de_recetas_sigue_en_su_ruta(client, headers):
+    datos = client.get('/api/reportes/resumen', headers=headers).get_json()
+    assert 'total_recetas' in datos
+
+
+def test_contadores_siguen_al_stock_de_la_base(app, client, headers):
+    producto = client.post('/api/productos', headers=headers, json={
+        'nombre': 'Producto temporal', 'precio': 4, 'stock': 10, 'costo': 1
+    }).get_json()
+
+    # Otra caja vende 3 (stock 10 -> 7) sin pasar por este objeto del ORM
+    with app.app_context():
+        db.session.execute(text("UPDATE productos SET stock = stock - 3 WHERE id = :id"), {'id': producto['id']})
+        ContadoresDashboard.registrar_stock_productos({producto['id']: -3})
+        db.session.commit()
+
+    assert client.put(f"/api/productos/{producto['id']}", headers=headers, json={'precio': 6}).status_code == 200
+    assert client.put(f"/api/productos/{producto['id']}", headers=headers, json={'stock': 1}).status_code == 400
+    assert client.delete(f"/api/productos/{producto['id']}", headers=headers).status_code == 200
+
+    with app.app_context():
+        mantenidos = ContadoresDashboard.resumen()['inventario']
+        ContadoresDashboard.recalcular()
+        assert ContadoresDashboard.resumen()['inventario'] == mantenidos
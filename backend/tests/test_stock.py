@@ -0,0 +1,81 @@
+from models import db, Producto, Ingrediente, Receta
+
+
+def _stock_producto(app, producto_id):
+    with app.app_context():
+        return db.session.get(Producto, producto_id).stock
+
+
+def _producto(client, headers):
+    producto = client.post('/api/productos', headers=headers, json={
+        'nombre': 'Producto de stock', 'precio': 2, 'stock': 20, 'costo': 1
+    }).get_json()
+    return producto['id'], producto['stock'], producto['precio']
+
+
+def test_venta_simple_descuenta_y_rechaza_faltante(app, client, headers):
+    producto_id, stock, precio = _producto(client, headers)
+
+    item = {'id': producto_id, 'precio': precio, 'cantidad': 2}
+    assert client.post('/api/ventas', json={'items': [item, item]}).status_code == 201
+    assert _stock_producto(app, producto_id) == stock - 4
+
+    item['cantidad'] = stock
+    respuesta = client.post('/api/ventas', json={'items': [item]})
+    assert respuesta.status_code == 400
+    assert 'Stock insuficiente' in respuesta.get_json()['error']
+    assert _stock_producto(app, producto_id) == stock - 4
+
+
+def test_merma_y_ajuste_de_producto(app, client, headers):
+    producto_id, stock, _ = _producto(client, headers)
+
+    respuesta = client.post('/api/mermas', json={'producto_id': producto_id, 'cantidad': stock + 1})
+    assert respuesta.status_code == 400
+    assert _stock_producto(app, producto_id) == stock
+
+    respuesta = client.patch(f'/api/productos/{producto_id}/stock', headers=headers, json={'cantidad': 5})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['producto']['stock'] == stock + 5
+
+
+def test_reabastecer_y_merma_de_ingrediente(app, client, headers):
+    with app.app_context():
+        ingrediente = Ingrediente(nombre='Harina prueba', unidad_medida='kg', costo_unitario=2.0, stock_actual=10)
+        db.session.add(ingrediente)
+        db.session.commit()
+        ingrediente_id = ingrediente.id
+
+    respuesta = client.post('/api/inventario/reabastecer', headers=headers, json={
+        'ingrediente_id': ingrediente_id, 'cantidad': 10, 'costo_compra': 40
+    })
+    assert respuesta.status_code == 201
+    datos = respuesta.get_json()['ingrediente']
+    assert datos['stock_actual'] == 20
+    assert datos['costo_unitario'] == 3.0  # (10 * 2 + 40) / 20
+
+    respuesta = client.post('/api/inventario/mermas', headers=headers, json={
+        'ingrediente_id': ingrediente_id, 'cantidad': 25
+    })
+    assert respuesta.status_code == 201
+    assert respuesta.get_json()['ingrediente']['stock_actual'] == -5
+
+
+def test_receta_se_vende_sin_stock_de_ingredientes(app, client, headers):
+    with app.app_context():
+        receta = Receta.query.first()
+        receta_id = receta.id
+        ingrediente_ids = [ri.ingrediente_id for ri in receta.ingredientes]
+        Ingrediente.query.filter(Ingrediente.id.in_(ingrediente_ids)).update(
+            {'stock_actual': 0}, synchronize_session=False
+        )
+        db.session.commit()
+
+    respuesta = client.post('/api/ventas/crear-con-explosion', headers=headers, json={
+        'items': [{'tipo': 'receta', 'id': receta_id, 'cantidad': 1, 'precio_unitario': 8.5}]
+    })
+    assert respuesta.status_code == 201, respuesta.get_json()
+
+    with app.app_context():
+        stocks = [i.stock_actual for i in Ingrediente.query.filter(Ingrediente.id.in_(ingrediente_ids))]
+        assert stocks and all(stock < 0 for stock in stocks)
@@ -0,0 +1,31 @@
+from sqlalchemy import func
+
+from models import db, Producto, ComandaEvento
+from services.comandas_feed import FeedComandas
+from services.comandas_worker import GeneradorComandas
+
+
+def test_lote_encola_comandas(app, client, headers):
+    GeneradorComandas.esperar()
+    with app.app_context():
+        producto_id = Producto.query.first().id
+        cursor = db.session.query(func.max(ComandaEvento.id)).scalar() or 0
+
+    venta = {
+        'clave_idempotencia': 'lote-comandas-0001',
+        'items': [{'tipo': 'producto', 'id': producto_id, 'cantidad': 1, 'precio_unitario': 8.5}]
+    }
+    respuesta = client.post('/api/ventas/lote', headers=headers, json={'ventas': [venta]})
+    assert respuesta.status_code == 200, respuesta.get_json()
+    venta_id = respuesta.get_json()['data']['resultados'][0]['data']['venta_id']
+    GeneradorComandas.esperar()
+
+    with app.app_context():
+        eventos = FeedComandas.eventos_desde(cursor, 'cocina')
+        assert [e['venta_id'] for e in eventos if e['evento'] == 'creada'] == [venta_id]
+
+    # Reenviar el lote no vuelve a encolar la venta
+    client.post('/api/ventas/lote', headers=headers, json={'ventas': [venta]})
+    GeneradorComandas.esperar()
+    with app.app_context():
+        assert len(FeedComandas.eventos_desde(cursor, 'cocina')) == len(eventos)
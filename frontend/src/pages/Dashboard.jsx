@@ -12,6 +12,7 @@ export default function Dashboard() {
   const [nuevoNombreNegocio, setNuevoNombreNegocio] = useState(nombreNegocio);
   const [recetas, setRecetas] = useState([]);
   const [reporte, setReporte] = useState(null);
+  const [resumenVentas, setResumenVentas] = useState(null);
   const [cargando, setCargando] = useState(true);
   const [tab, setTab] = useState('recetas');
 
@@ -29,8 +30,12 @@ export default function Dashboard() {
       const datosRecetas = await recetasService.listar();
       setRecetas(datosRecetas?.recetas || datosRecetas?.data || []);
 
-      const datosReporte = await reportesService.obtenerResumenRecetas();
+      const [datosReporte, datosVentas] = await Promise.all([
+        reportesService.obtenerResumenRecetas(),
+        reportesService.obtenerResumenVentas()
+      ]);
       setReporte(datosReporte);
+      setResumenVentas(datosVentas);
     } catch (err) {
       console.error('Error cargando datos:', err);
       navigate('/login');
@@ -259,6 +264,42 @@ export default function Dashboard() {
                   </div>
                 </div>
               </div>
+
+              {resumenVentas && (
+                <div style={styles.reporteCard}>
+                  <h3>Ventas e Inventario</h3>
+                  <div style={styles.reporteContent}>
+                    <div style={styles.reporteItem}>
+                      <span>Ventas de Hoy:</span>
+                      <strong>
+                        {resumenVentas.hoy?.cantidad_ventas || 0} · ${(resumenVentas.hoy?.total || 0).toFixed(2)}
+                      </strong>
+                    </div>
+                    <div style={styles.reporteItem}>
+                      <span>Últimos 7 Días:</span>
+                      <strong>
+                        {resumenVentas.ultimos_7_dias?.cantidad_ventas || 0} · ${(resumenVentas.ultimos_7_dias?.total || 0).toFixed(2)}
+                      </strong>
+                    </div>
+                    <div style={styles.reporteItem}>
+                      <span>Ventas Totales:</span>
+                      <strong>
+                        {resumenVentas.total?.cantidad_ventas || 0} · ${(resumenVentas.total?.total || 0).toFixed(2)}
+                      </strong>
+                    </div>
+                    <div style={styles.reporteItem}>
+                      <span>Productos en Stock:</span>
+                      <strong>
+                        {resumenVentas.inventario?.cantidad_productos || 0} ({resumenVentas.inventario?.stock_total || 0} u.)
+                      </strong>
+                    </div>
+                    <div style={styles.reporteItem}>
+                      <span>Valor del Stock:</span>
+                      <strong>${(resumenVentas.inventario?.valor_stock || 0).toFixed(2)}</strong>
+                    </div>
+                  </div>
+                </div>
+              )}
             </div>
           </>
         )}
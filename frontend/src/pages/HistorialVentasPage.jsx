@@ -9,9 +9,10 @@ const HistorialVentasPage = () => {
         id: '',
         fecha_inicio: '',
         fecha_fin: '',
-        cliente: ''
+        q: ''
     });
-    const [paginacion, setPaginacion] = useState({ page: 1, total: 0, pages: 1 });
+    const [siguienteCursor, setSiguienteCursor] = useState(null);
+    const [total, setTotal] = useState({ valor: 0, exacto: true });
     const [cargando, setCargando] = useState(false);
     const [error, setError] = useState('');
 
@@ -22,17 +23,22 @@ const HistorialVentasPage = () => {
 
     useEffect(() => {
         buscarVentas();
-    }, [paginacion.page]);
+    }, []);
 
-    const buscarVentas = async () => {
+    // Sin cursor recarga desde la venta más reciente; con cursor agrega la página siguiente
+    const buscarVentas = async (cursor = null) => {
         setCargando(true);
         setError('');
         try {
             const params = {
-                pagina: paginacion.page,
                 por_pagina: 20,
                 ...filtros
             };
+            if (cursor) {
+                params.cursor = cursor;
+            } else {
+                params.total = true;
+            }
 
             // Limpiar params vacíos
             Object.keys(params).forEach(key => {
@@ -42,12 +48,12 @@ const HistorialVentasPage = () => {
             const response = await apiClient.get('/ventas/historial', { params });
 
             if (response.data.success) {
-                setVentas(response.data.data.ventas);
-                setPaginacion({
-                    page: response.data.data.pagina,
-                    total: response.data.data.total,
-                    pages: Math.ceil(response.data.data.total / response.data.data.por_pagina)
-                });
+                const data = response.data.data;
+                setVentas(prev => (cursor ? [...prev, ...data.ventas] : data.ventas));
+                setSiguienteCursor(data.siguiente_cursor);
+                if (!cursor) {
+                    setTotal({ valor: data.total, exacto: data.total_exacto });
+                }
             }
         } catch (err) {
             console.error(err);
@@ -122,9 +128,9 @@ const HistorialVentasPage = () => {
                     style={styles.input}
                 />
                 <input
-                    placeholder="Cliente"
-                    value={filtros.cliente}
-                    onChange={e => setFiltros({ ...filtros, cliente: e.target.value })}
+                    placeholder="Cliente, mesa o nota"
+                    value={filtros.q}
+                    onChange={e => setFiltros({ ...filtros, q: e.target.value })}
                     style={styles.input}
                 />
                 <input
@@ -133,7 +139,7 @@ const HistorialVentasPage = () => {
                     onChange={e => setFiltros({ ...filtros, fecha_inicio: e.target.value })}
                     style={styles.input}
                 />
-                <button onClick={() => { setPaginacion({ ...paginacion, page: 1 }); buscarVentas(); }} style={styles.btnBuscar}>
+                <button onClick={() => buscarVentas()} style={styles.btnBuscar}>
                     Buscar
                 </button>
             </div>
@@ -175,6 +181,15 @@ const HistorialVentasPage = () => {
                 </div>
             )}
 
+            <div style={styles.paginacion}>
+                <span>Mostrando {ventas.length} de {total.valor}{total.exacto ? '' : '+'}</span>
+                {siguienteCursor && (
+                    <button onClick={() => buscarVentas(siguienteCursor)} disabled={cargando} style={styles.btnVer}>
+                        Cargar más
+                    </button>
+                )}
+            </div>
+
             {/* MODAL DETALLE */}
             {ventaSeleccionada && (
                 <div style={styles.modalOverlay}>
@@ -283,6 +298,7 @@ const styles = {
     btnBack: { padding: '8px 16px', background: '#666', color: 'white', border: 'none', borderRadius: 4, cursor: 'pointer' },
     tableContainer: { overflowX: 'auto', background: 'white', padding: 15, borderRadius: 8, boxShadow: '0 2px 5px rgba(0,0,0,0.1)' },
     table: { width: '100%', borderCollapse: 'collapse' },
+    paginacion: { display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginTop: 15 },
     btnVer: { padding: '5px 10px', background: '#2196f3', color: 'white', border: 'none', borderRadius: 4, cursor: 'pointer' },
     modalOverlay: { position: 'fixed', top: 0, left: 0, right: 0, bottom: 0, background: 'rgba(0,0,0,0.5)', display: 'flex', justifyContent: 'center', alignItems: 'center', zIndex: 1000 },
     modal: { background: 'white', padding: 25, borderRadius: 8, width: '90%', maxWidth: 500, maxHeight: '90vh', overflowY: 'auto' },
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import apiClient from '../services/apiService';
 
@@ -158,6 +158,8 @@ const VentasPageMejorada = () => {
   const [productos, setProductos] = useState([]);
   const [recetas, setRecetas] = useState([]);
   const [cart, setCart] = useState([]);
+  const [codigoReserva, setCodigoReserva] = useState(null);
+  const [expiraReserva, setExpiraReserva] = useState(null);
   const [cliente, setCliente] = useState('');
   const [mesa, setMesa] = useState('');
   const [descuento, setDescuento] = useState(0);
@@ -170,10 +172,51 @@ const VentasPageMejorada = () => {
   const [ventaId, setVentaId] = useState(null);
   const [tipoItemSelected, setTipoItemSelected] = useState('producto');
 
+  // Último carrito y código de reserva, para los timers y la limpieza al salir
+  const cartRef = useRef([]);
+  const codigoReservaRef = useRef(null);
+  const colaReserva = useRef(Promise.resolve());
+
   useEffect(() => {
     cargarDatos();
   }, []);
 
+  // Liberar la reserva al salir de la página o cerrar la pestaña
+  useEffect(() => {
+    const liberarAlSalir = () => {
+      const codigo = codigoReservaRef.current;
+      if (!codigo) return;
+      codigoReservaRef.current = null;
+      // keepalive: la petición termina aunque la página se esté cerrando
+      const token = localStorage.getItem('token');
+      fetch(`${apiClient.defaults.baseURL}/ventas/reservas/${codigo}`, {
+        method: 'DELETE',
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+        keepalive: true
+      }).catch(() => {});
+    };
+
+    window.addEventListener('pagehide', liberarAlSalir);
+    return () => {
+      window.removeEventListener('pagehide', liberarAlSalir);
+      liberarAlSalir();
+    };
+  }, []);
+
+  // Renovar la reserva antes de que venza
+  useEffect(() => {
+    if (!expiraReserva) return;
+    // expira_en llega en UTC sin zona horaria
+    const expira = Date.parse(expiraReserva.endsWith('Z') ? expiraReserva : `${expiraReserva}Z`);
+    const espera = Math.max(expira - Date.now() - 30000, 5000);
+    const timer = setTimeout(() => {
+      sincronizarReserva(cartRef.current).catch(err => {
+        console.error('Error renovando reserva:', err);
+      });
+    }, espera);
+    return () => clearTimeout(timer);
+  }, [expiraReserva]);
+
   const cargarDatos = async () => {
     try {
       setCargando(true);
@@ -198,34 +241,70 @@ const VentasPageMejorada = () => {
     }
   };
 
-  const agregarAlCarrito = async (item, tipo) => {
-    try {
-      // Validar stock con el backend (recursivo)
-      const res = await apiClient.get('/ventas/validar-stock', {
-        params: { tipo: tipo, id: item.id, cantidad: 1 }
-      });
+  const guardarReserva = (codigo, expira) => {
+    codigoReservaRef.current = codigo;
+    setCodigoReserva(codigo);
+    setExpiraReserva(expira);
+  };
 
-      if (res.data.success) {
-        const stockData = res.data.data;
-        if (!stockData.disponible) {
-          const faltantesStr = stockData.faltantes
-            .map(f => `${f.nombre} (Stock: ${f.stock_actual} / Requerido: ${f.requerido} ${f.unidad || ''})`)
-            .join('\n');
+  /**
+   * Deja reservado el stock del carrito indicado (o libera la reserva si
+   * está vacío). Las llamadas se encolan para que una respuesta vieja no
+   * pise a una nueva. Devuelve los datos de /ventas/reservas o null.
+   */
+  const sincronizarReserva = (carrito) => {
+    const tarea = colaReserva.current.then(async () => {
+      const codigo = codigoReservaRef.current;
+
+      if (carrito.length === 0) {
+        if (codigo) {
+          guardarReserva(null, null);
+          await apiClient.delete(`/ventas/reservas/${codigo}`);
+        }
+        return null;
+      }
 
-          const confirmar = window.confirm(
-            `⚠️ ATENCIÓN: Faltan ingredientes para este producto:\n\n${faltantesStr}\n\n¿Deseas agregarlo al carrito de todos modos?`
-          );
+      // Los ingredientes compartidos entre líneas se suman en el servidor
+      const items = carrito.map(i => ({ tipo: i.tipo, id: i.id_ref, cantidad: i.cantidad }));
+      const res = await apiClient.post('/ventas/reservas', { items, codigo_reserva: codigo });
+      if (!res.data.success) return null;
 
-          if (!confirmar) return;
-        }
+      const stockData = res.data.data;
+      if (stockData.reservado) {
+        guardarReserva(stockData.codigo_reserva, stockData.expira_en);
+      }
+      return stockData;
+    });
+    colaReserva.current = tarea.catch(() => null);
+    return tarea;
+  };
+
+  const describirFaltantes = (stockData) => stockData.faltantes
+    .map(f => {
+      const lineas = f.lineas.map(i => stockData.lineas[i].nombre).join(', ');
+      return `${f.nombre} (Disponible: ${f.disponible} / Requerido: ${f.requerido} ${f.unidad || ''}) - ${lineas}`;
+    })
+    .join('\n');
+
+  /**
+   * Aplica un cambio al carrito y reserva el carrito resultante; si falta
+   * stock lo avisa (el cambio se mantiene y sigue la reserva anterior).
+   */
+  const cambiarCarrito = async (nuevoCarrito) => {
+    setCart(nuevoCarrito);
+    cartRef.current = nuevoCarrito;
+    try {
+      const stockData = await sincronizarReserva(nuevoCarrito);
+      if (stockData && !stockData.disponible) {
+        setError(`Faltan ingredientes para el carrito:\n${describirFaltantes(stockData)}`);
       }
     } catch (err) {
-      console.error('Error validando stock:', err);
-      // Si falla la validación (ej: error 500), avisar pero permitir agregar o manejar el error
-      const proceed = window.confirm('No se pudo verificar el stock. ¿Deseas agregar el producto de todos modos?');
-      if (!proceed) return;
+      console.error('Error reservando stock:', err);
     }
+  };
 
+  const agregarAlCarrito = async (item, tipo) => {
+    const carritoAnterior = cartRef.current;
     const nuevoItem = {
       id: `${tipo}-${item.id}-${Date.now()}`, // Agregar timestamp para permitir múltiples entradas del mismo item si se desea o IDs únicos
       tipo: tipo,
@@ -235,28 +314,62 @@ const VentasPageMejorada = () => {
       cantidad: 1,
       observaciones: ''
     };
+    const nuevoCarrito = [...carritoAnterior, nuevoItem];
+
+    try {
+      // Reservar el stock del carrito completo con el nuevo item
+      const stockData = await sincronizarReserva(nuevoCarrito);
+
+      if (stockData && !stockData.disponible) {
+        const confirmar = window.confirm(
+          `⚠️ ATENCIÓN: Faltan ingredientes para el carrito:\n\n${describirFaltantes(stockData)}\n\n¿Deseas agregarlo al carrito de todos modos?`
+        );
+
+        if (!confirmar) {
+          // Sin el item: volver a reservar el carrito que queda
+          cambiarCarrito(carritoAnterior);
+          return;
+        }
+      }
+    } catch (err) {
+      console.error('Error validando stock:', err);
+      // Si falla la validación (ej: error 500), avisar pero permitir agregar o manejar el error
+      const proceed = window.confirm('No se pudo verificar el stock. ¿Deseas agregar el producto de todos modos?');
+      if (!proceed) {
+        cambiarCarrito(carritoAnterior);
+        return;
+      }
+    }
 
-    setCart([...cart, nuevoItem]);
+    setCart(nuevoCarrito);
+    cartRef.current = nuevoCarrito;
   };
 
   const actualizarCantidad = (id, cantidad) => {
+    if (Number.isNaN(cantidad)) return;
     if (cantidad <= 0) {
       eliminarDelCarrito(id);
     } else {
-      setCart(cart.map(item =>
+      cambiarCarrito(cartRef.current.map(item =>
         item.id === id ? { ...item, cantidad } : item
       ));
     }
   };
 
   const actualizarObservaciones = (id, observaciones) => {
-    setCart(cart.map(item =>
+    const nuevoCarrito = cartRef.current.map(item =>
       item.id === id ? { ...item, observaciones } : item
-    ));
+    );
+    setCart(nuevoCarrito);
+    cartRef.current = nuevoCarrito;
   };
 
   const eliminarDelCarrito = (id) => {
-    setCart(cart.filter(item => item.id !== id));
+    cambiarCarrito(cartRef.current.filter(item => item.id !== id));
+  };
+
+  const vaciarCarrito = () => {
+    cambiarCarrito([]);
   };
 
   const calcularTotales = () => {
@@ -300,7 +413,8 @@ const VentasPageMejorada = () => {
         cliente_nombre: cliente,
         numero_mesa: mesa,
         descuento,
-        comentarios
+        comentarios,
+        codigo_reserva: codigoReserva
       });
 
       if (response.data.success) {
@@ -309,8 +423,10 @@ const VentasPageMejorada = () => {
         setVentaId(venta.venta_id);
         setMostrarComanda(true);
 
-        // Limpiar carrito
+        // Limpiar carrito (la venta consumió la reserva)
         setCart([]);
+        cartRef.current = [];
+        guardarReserva(null, null);
         setCliente('');
         setMesa('');
         setDescuento(0);
@@ -515,6 +631,12 @@ const VentasPageMejorada = () => {
             )}
           </div>
 
+          {hayItems && (
+            <button onClick={vaciarCarrito} style={styles.btnVaciar}>
+              Vaciar carrito
+            </button>
+          )}
+
           <hr style={{ margin: '10px 0' }} />
 
           {/* Descuento */}
@@ -730,6 +852,16 @@ const styles = {
     cursor: 'pointer',
     borderRadius: '3px'
   },
+  btnVaciar: {
+    width: '100%',
+    marginTop: '5px',
+    padding: '6px',
+    backgroundColor: 'white',
+    color: '#f44336',
+    border: '1px solid #f44336',
+    cursor: 'pointer',
+    borderRadius: '4px'
+  },
   formGroup: {
     marginBottom: '10px'
   },
@@ -275,6 +275,14 @@ export const reportesService = {
     return response.data;
   },
 
+  /**
+   * Obtener resumen de ventas (hoy, últimos 7 días, histórico) e inventario
+   */
+  obtenerResumenVentas: async () => {
+    const response = await apiClient.get('/reportes/resumen-ventas');
+    return response.data;
+  },
+
   /**
    * Obtener reporte de rentabilidad
    */